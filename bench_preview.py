@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""Misura il rendering dell'anteprima: vecchio renderer (un insert per frammento) contro render_runs.
+
+Uso: python bench_preview.py [righe] [ripetizioni]
+
+Con un display si scrive in un vero tk.Text, quindi conta anche il passaggio
+in Tcl di ogni insert, e si misura anche la prima apertura con BlockPreview
+(blocchi e mark, come nella GUI); senza display un Text finto conta solo le
+chiamate, e il tempo misurato è quello del lavoro in Python.
+"""
+import random
+import statistics
+import sys
+import time
+
+from caldras_preview import BlockPreview, insert_args, plan_preview, render_runs
+
+# ╔══════════════════╗
+# DOCUMENTO DI PROVA
+# ╚══════════════════╝
+
+def sample_note(lines, seed=0):
+    """Nota markdown deterministica di circa lines righe, con tutti i costrutti dell'anteprima"""
+    rnd = random.Random(seed)
+    words = "stella orbita nota sonda codice archivio vettore segnale cometa anello".split()
+
+    def sentence(n):
+        parts = []
+        for _ in range(n):
+            w = rnd.choice(words)
+            r = rnd.random()
+            parts.append(f"**{w}**" if r < 0.1 else f"*{w}*" if r < 0.2 else f"`{w}`" if r < 0.27 else w)
+        return " ".join(parts)
+
+    out = []
+    while len(out) < lines:
+        out.append(f"## {sentence(3)}")
+        out.append("")
+        for _ in range(rnd.randint(2, 5)):
+            out.append(sentence(rnd.randint(8, 16)))
+        out.append("")
+        for i in range(rnd.randint(2, 6)):
+            out.append(f"- {sentence(6)}" if i % 2 else f"{i + 1}. {sentence(6)}")
+        out.append("> " + sentence(8))
+        out.append("```python")
+        out.extend(f"    x = {n}  # {rnd.choice(words)}" for n in range(rnd.randint(2, 6)))
+        out.append("```")
+        out.append("")
+    return "\n".join(out[:lines])
+
+# ╔═══════════════════════════════════════╗
+# RENDERER PRECEDENTE (RIFERIMENTO, COPIATO)
+# ╚═══════════════════════════════════════╝
+
+class OldRenderer:
+    """render_markdown_to_text com'era prima del tokenizzatore: regex a ogni chiamata, un insert per frammento"""
+
+    def __init__(self, preview):
+        self.preview = preview
+        self._render_at = "end"
+
+    def render_markdown_to_text(self, md_text):
+        import re
+        lines = md_text.split('\n')
+        for line_num, line in enumerate(lines):
+            if line.startswith('### '):
+                self.preview.insert(self._render_at, line[4:] + '\n', "h3")
+            elif line.startswith('## '):
+                self.preview.insert(self._render_at, line[3:] + '\n', "h2")
+            elif line.startswith('# '):
+                self.preview.insert(self._render_at, line[2:] + '\n', "h1")
+            elif line.startswith('> '):
+                self.preview.insert(self._render_at, "❯ " + line[2:] + '\n', "blockquote")
+            elif re.match(r'^\s*[-*+]\s', line):
+                indent = len(line) - len(line.lstrip())
+                bullet = "  " * (indent // 2) + "• "
+                content = re.sub(r'^\s*[-*+]\s', '', line)
+                self.preview.insert(self._render_at, bullet)
+                self.format_inline_text(content + '\n')
+            elif re.match(r'^\s*\d+\.\s', line):
+                indent = len(line) - len(line.lstrip())
+                prefix = "  " * (indent // 2)
+                match = re.match(r'^\s*(\d+)\.\s(.*)$', line)
+                if match:
+                    num, content = match.groups()
+                    self.preview.insert(self._render_at, f"{prefix}{num}. ")
+                    self.format_inline_text(content + '\n')
+            elif line.startswith('```'):
+                if hasattr(self, '_in_code_block'):
+                    del self._in_code_block
+                    self.preview.insert(self._render_at, '\n')
+                else:
+                    self._in_code_block = True
+                    lang = line[3:].strip()
+                    if lang:
+                        self.preview.insert(self._render_at, f"[{lang}]\n", "code")
+            elif hasattr(self, '_in_code_block'):
+                self.preview.insert(self._render_at, line + '\n', "code")
+            else:
+                if line.strip():
+                    self.format_inline_text(line + '\n')
+                else:
+                    self.preview.insert(self._render_at, '\n')
+
+    def format_inline_text(self, text):
+        import re
+        pos = 0
+        for match in re.finditer(r'`([^`]+)`', text):
+            if match.start() > pos:
+                self.format_bold_italic(text[pos:match.start()])
+            self.preview.insert(self._render_at, match.group(1), "code")
+            pos = match.end()
+        if pos < len(text):
+            self.format_bold_italic(text[pos:])
+
+    def format_bold_italic(self, text):
+        import re
+        pos = 0
+        for match in re.finditer(r'\*\*\*(.+?)\*\*\*|\*\*(.+?)\*\*|\*(.+?)\*', text):
+            if match.start() > pos:
+                self.preview.insert(self._render_at, text[pos:match.start()])
+            if match.group(1):
+                self.preview.insert(self._render_at, match.group(1), ("bold", "italic"))
+            elif match.group(2):
+                self.preview.insert(self._render_at, match.group(2), "bold")
+            elif match.group(3):
+                self.preview.insert(self._render_at, match.group(3), "italic")
+            pos = match.end()
+        if pos < len(text):
+            self.preview.insert(self._render_at, text[pos:])
+
+# ╔════════════╗
+# MISURAZIONE
+# ╚════════════╝
+
+class CountingText:
+    """Al posto di tk.Text senza display: accetta gli insert e non fa altro"""
+
+    def insert(self, index, *args):
+        pass
+
+def make_widget():
+    """(widget, descrizione): un tk.Text nascosto se c'è un display, altrimenti CountingText"""
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+    except Exception:
+        return CountingText, "Text finto (nessun display: solo lavoro in Python)"
+    def text():
+        widget = tk.Text(root)
+        for tag in ("h1", "h2", "h3", "blockquote", "code", "bold", "italic"):
+            widget.tag_configure(tag)
+        return widget
+    return text, "tk.Text"
+
+def old_render(widget, note):
+    OldRenderer(widget).render_markdown_to_text(note)
+
+def new_render(widget, note):
+    widget.insert("end", *insert_args(render_runs(note)))
+
+def measure(render, new_widget, note, repeat):
+    """Mediana in ms su repeat esecuzioni, ciascuna su un widget nuovo, e numero di insert"""
+    times, calls = [], 0
+    for _ in range(repeat):
+        widget = new_widget()
+        inserts = [0]
+        insert = widget.insert
+        def counted(index, *args):
+            inserts[0] += 1
+            return insert(index, *args)
+        widget.insert = counted
+        start = time.perf_counter()
+        render(widget, note)
+        times.append((time.perf_counter() - start) * 1000)
+        calls = inserts[0]
+        if hasattr(widget, "destroy"):
+            widget.destroy()
+    return statistics.median(times), calls
+
+def main(argv):
+    lines = int(argv[1]) if len(argv) > 1 else 5000
+    repeat = int(argv[2]) if len(argv) > 2 else 5
+    note = sample_note(lines)
+    new_widget, kind = make_widget()
+    print(f"Nota di {lines} righe, {len(note)} caratteri; widget: {kind}")
+    old_ms, old_calls = measure(old_render, new_widget, note, repeat)
+    new_ms, new_calls = measure(new_render, new_widget, note, repeat)
+    print(f"  prima:  {old_ms:8.1f} ms  {old_calls:6d} insert")
+    print(f"  adesso: {new_ms:8.1f} ms  {new_calls:6d} insert")
+    print(f"  rapporto: {old_ms / new_ms:.1f}x")
+    if new_widget is not CountingText:
+        blocks_ms, _ = measure(lambda widget, note: BlockPreview(widget).apply(plan_preview(note)),
+                               new_widget, note, repeat)
+        print(f"  BlockPreview, prima apertura: {blocks_ms:8.1f} ms")
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -1,19 +1,44 @@
 #!/usr/bin/env python3
 import tkinter as tk
-from tkinter import messagebox, simpledialog, filedialog
-import pickle, os, base64, hashlib, markdown, json, tempfile, subprocess
-from cryptography.fernet import Fernet
+from tkinter import messagebox, simpledialog, filedialog, ttk
+import pickle, os, sys, time, base64, hashlib, json, tempfile, subprocess
+from collections import OrderedDict
+from caldras_journal import append_record, clear_journal, encode_record, make_diff, read_journal, replay
+from caldras_list import VirtualList
+from caldras_preview import BlockPreview, plan_preview
+from caldras_query import dependencies, is_structured, run_query, snippet_query
+from caldras_search import SearchIndex
+from caldras_session import SessionCache
+from caldras_store import vault_stamp
+from caldras_undo import UndoHistory
+from caldras_worker import BackgroundLoad, Debouncer, JobQueue, LatestOnlyWorker
 
-# 🛰️ Supporto PDF automatico
-try:
-    from weasyprint import HTML
-    PDF_ENGINE = "weasyprint"
-except ImportError:
-    PDF_ENGINE = "wkhtmltopdf"
+# Moduli pesanti: importati da import_heavy() nel thread dello splash
+markdown = Fernet = HTML = None
+PDF_ENGINE = "wkhtmltopdf"
 
 CONFIG_FILE = ".caldras.conf"
 NOTE_FILE = ".note.dat"
+INDEX_FILE = ".note.idx"
+JOURNAL_FILE = ".note.journal"
+SNAPSHOT_FILE = ".caldras.snap"
 FONT_CONSOLE = ("Cascadia Code", 11)
+FONT_SNIPPET = ("Cascadia Code", 9)
+MAX_RESULTS = 50
+SEARCH_DEBOUNCE_MS = 100
+PREVIEW_DEBOUNCE_MS = 80
+AUTOSAVE_IDLE_MS = 2000
+JOURNAL_MS = 3000
+SESSION_EXPIRE_MS = 60000
+# Caricamento a pezzi delle note lunghe: primo schermo subito, il resto nei momenti liberi
+LOAD_FIRST_CHARS = 16000
+LOAD_CHUNK_CHARS = 128000
+# Fine del testo già caricato: i pezzi successivi vanno qui, non dopo quanto scritto in coda
+LOAD_MARK = "load_end"
+MAX_TAG_FACETS = 30
+MAX_COMPLETIONS = 8
+SPLASH_FRAME_MS = 300
+SPLASH_POLL_MS = 30
 
 def load_config():
     if os.path.exists(CONFIG_FILE):
@@ -25,6 +50,40 @@ def save_config(config):
     with open(CONFIG_FILE, "w") as f:
         json.dump(config, f)
 
+def load_snapshot():
+    """Stato dell'elenco all'ultima uscita, per disegnare la finestra prima di aprire il vault"""
+    try:
+        with open(SNAPSHOT_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_snapshot(snapshot):
+    tmp = SNAPSHOT_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, SNAPSHOT_FILE)
+
+def import_heavy():
+    """markdown, cryptography e (se c'è) WeasyPrint: da soli valgono buona parte dell'avvio"""
+    global markdown, Fernet, HTML, PDF_ENGINE
+    import markdown
+    from cryptography.fernet import Fernet
+    # 🛰️ Supporto PDF automatico
+    try:
+        from weasyprint import HTML
+        PDF_ENGINE = "weasyprint"
+    except ImportError:
+        PDF_ENGINE = "wkhtmltopdf"
+
+def load_startup():
+    """Moduli, note e indice di ricerca: gira nel thread dello splash, senza toccare Tk"""
+    import_heavy()
+    notes = load_notes()
+    index = SearchIndex.open(INDEX_FILE, notes, vault_stamp(NOTE_FILE),
+                             decrypt=decrypt_text, encrypt=encrypt_text)
+    return notes, index
+
 def get_key(password):
     return base64.urlsafe_b64encode(hashlib.sha256(password.encode()).digest())
 
@@ -45,6 +104,15 @@ def save_notes(notes):
     with open(NOTE_FILE, "wb") as f:
         pickle.dump(notes, f)
 
+def content_hash(text):
+    """Impronta del testo in chiaro di una nota, per capire se è cambiato"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+def chunk_end(text, start, size):
+    """Fine del pezzo di circa size caratteri che parte da start, a fine riga se possibile"""
+    end = text.find("\n", start + size, start + 2 * size)
+    return min(start + size, len(text)) if end < 0 else end + 1
+
 def generate_pdf(content_md, filename):
     html_body = markdown.markdown(content_md)
     style = """
@@ -68,7 +136,9 @@ def generate_pdf(content_md, filename):
     except Exception as e:
         return False, str(e)
 
-def splash():
+def splash(loading, min_ms=0):
+    """Resta a schermo finché loading non ha finito (e almeno min_ms), non un tempo fisso"""
+    start = time.monotonic()
     root = tk.Tk()
     root.overrideredirect(True)
     root.geometry("440x220+500+320")
@@ -81,27 +151,149 @@ def splash():
     def animate(i=[0]):
         dots.config(text="Caricamento" + "." * (i[0] % 4))
         i[0] += 1
-        if i[0] < 10:
-            root.after(300, animate)
-        else:
+        root.after(SPLASH_FRAME_MS, animate)
+    def poll():
+        if loading.done.is_set() and (time.monotonic() - start) * 1000 >= min_ms:
             root.destroy()
+        else:
+            root.after(SPLASH_POLL_MS, poll)
     animate()
+    poll()
     root.mainloop()
+
+class NoteTab:
+    """Widget di una nota aperta in una scheda: editor, anteprima e cronologia di annullamento propri"""
+
+    def __init__(self, note_id, frame, text, preview):
+        self.note_id = note_id      # None per la scheda vuota
+        self.frame = frame
+        self.text = text
+        self.preview = preview
+        self.blocks = None          # BlockPreview dell'anteprima
+        self.history = None         # UndoHistory dell'editor
+        self.size = 0               # caratteri caricati, per il limite di memoria delle schede
+        self.pending = None         # (testo, posizione) ancora da inserire nell'editor
+
 class CaldrasApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, config=None, startup=None, loading=None, snapshot=None):
         super().__init__()
         self.title("🧠 Stazione Orbitale Caldras")
         self.geometry("1000x600")
         self.minsize(800, 480)
 
-        self.config = load_config()
+        # Note e indice arrivano già caricati durante lo splash (startup) oppure, se c'è
+        # uno snapshot, dal thread loading mentre la finestra è già disegnata
+        self.config = config if config is not None else load_config()
         self.theme = self.config.get("theme", "alien-dark")
-        self.notes = load_notes()
+        self.notes, self.index = [], None
+        self.snapshot = snapshot or {}
+        self.restore_top = 0        # prima posizione dell'elenco dopo il caricamento
+        self.snapshot_labels = {}   # id → etichetta delle righe dello snapshot
+        self.visible_ids = []
         self.current_index = None
+        # Salvataggio automatico: testo non salvato e hash dell'ultima versione salvata, per id
+        self.dirty = {}
+        self.saved_hash = {}
+        self.editor_note = None     # id della nota il cui testo è nell'editor
+        # Note protette sbloccate e anteprime: budget e scadenza configurabili in .caldras.conf
+        self.session = SessionCache(self.config.get("cache_mb", 64) * 2**20,
+                                    self.config.get("cache_idle_min", 10) * 60)
+        # Diario per il recupero dopo un crash: ultimo testo registrato per id
+        self.journaled = {}
+        self.journal_job = None
+        self.journal_keep = False   # recupero rimandato: il diario non va svuotato
 
         self.setup_ui()
         self.apply_theme()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.bind("<Control-l>", lambda e: self.lock_session())
+        self.after(SESSION_EXPIRE_MS, self.expire_session)
+        if loading is None:
+            self.attach(*(startup if startup is not None else load_startup()))
+        else:
+            self.show_snapshot()
+            self.wait_loading(loading)
+
+    # ╔══════════════════════════════╗
+    # AVVIO: SNAPSHOT E VAULT CARICATO
+    # ╚══════════════════════════════╝
+
+    def show_snapshot(self):
+        """Prima pittura: le righe dell'elenco come all'ultima uscita, senza note né indice"""
+        rows = self.snapshot.get("rows", [])
+        self.snapshot_labels = dict(rows)
+        self.search_var.set(self.snapshot.get("query", ""))
+        self.tag_var.set(self.snapshot.get("tags", ""))
+        self.note_rows.selected = self.snapshot.get("selected")
+        self.note_rows.set_ids([note_id for note_id, _ in rows])
+        self.status_message = "📂 Apertura dell'archivio..."
+        self.show_status([])
+
+    def wait_loading(self, loading):
+        if not loading.done.is_set():
+            self.after(SPLASH_POLL_MS, self.wait_loading, loading)
+            return
+        try:
+            startup = loading.result()
+        except Exception as e:
+            messagebox.showerror("Errore", f"Impossibile aprire l'archivio:\n{e}")
+            self.destroy()
+            return
+        self.clear_status()
+        self.attach(*startup)
+
+    def attach(self, notes, index):
+        """Vault e indice pronti: la ricerca riallinea l'elenco, cambiando solo le righe diverse"""
+        self.notes, self.index = notes, index
+        # Le righe dello snapshot partono da top: la stessa finestra, se nulla è cambiato, non si ridisegna
+        self.restore_top = self.snapshot.get("top", 0)
         self.refresh_list()
+        self.recover_journal()
+        opened = self.snapshot.get("open")
+        if opened:
+            note_id, titolo = opened
+            pos = self.index.position(note_id)
+            # Con un vault diverso gli id possono essere stati riassegnati: vale anche il titolo
+            same = self.snapshot.get("stamp") == list(vault_stamp(NOTE_FILE))
+            if pos is not None and (same or self.notes[pos][0] == titolo) \
+                    and not (len(self.notes[pos]) == 3 and self.notes[pos][2]):
+                self.open_note(pos)
+
+    def write_snapshot(self):
+        """In uscita: righe visibili, scorrimento, selezione e nota aperta"""
+        pos = self.index.position(self.editor_note) if self.editor_note is not None else None
+        save_snapshot({
+            "stamp": list(vault_stamp(NOTE_FILE)),
+            "rows": [list(row) for row in self.note_rows.shown],
+            "top": self.note_rows.top,
+            "selected": self.note_rows.selected,
+            "query": self.search_var.get(),
+            "tags": self.tag_var.get(),
+            "open": [self.editor_note, self.notes[pos][0]] if pos is not None else None,
+        })
+
+    def on_close(self):
+        if self.index is None:
+            # Chiusa prima che l'archivio fosse aperto: niente da salvare
+            self.destroy()
+            return
+        # L'indice su disco si aggiorna in uscita: al prossimo avvio non si ricostruisce
+        self.searcher.cancel()
+        self.preview_worker.cancel()
+        # Prima si salvano le modifiche e si finiscono i salvataggi in coda
+        self.autosave_debounce.cancel()
+        for tab in self.editors.values():
+            self.capture_editor(tab, final=True)
+        self.commit_dirty()
+        self.jobs.drain()
+        if not self.dirty and not self.journal_keep:
+            clear_journal(JOURNAL_FILE)
+        self.index.save(INDEX_FILE, self.notes, vault_stamp(NOTE_FILE))
+        try:
+            self.write_snapshot()
+        except OSError:
+            pass    # solo un'accelerazione dell'avvio
+        self.destroy()
 
     def setup_ui(self):
         self.pane_main = tk.Frame(self, bg="#0e0f12")
@@ -110,37 +302,85 @@ class CaldrasApp(tk.Tk):
         self.search_frame = tk.Frame(self.pane_main, bg="#0e0f12")
         self.search_frame.pack(side=tk.TOP, fill=tk.X, padx=5, pady=(5, 0))
 
+        # Filtro per tag: elenco con i conteggi (🏷️) e campo per combinarli
+        self.tag_var = tk.StringVar()
+        self.tag_button = tk.Menubutton(self.search_frame, text="🏷️", font=FONT_CONSOLE,
+                                        bg="#16232f", fg="#c6f6ff", relief=tk.FLAT)
+        self.tag_menu = tk.Menu(self.tag_button, tearoff=0, postcommand=self.fill_tag_menu)
+        self.tag_button.configure(menu=self.tag_menu)
+        self.tag_button.pack(side=tk.RIGHT, padx=2)
+        self.tag_entry = tk.Entry(self.search_frame, textvariable=self.tag_var, width=18,
+                                  font=FONT_CONSOLE, bg="#16232f", fg="#c6f6ff",
+                                  insertbackground="#76f6ff", relief=tk.FLAT)
+        self.tag_entry.pack(side=tk.RIGHT, padx=2)
+
         self.search_var = tk.StringVar()
         self.search_entry = tk.Entry(self.search_frame, textvariable=self.search_var,
                                      font=FONT_CONSOLE, bg="#16232f", fg="#c6f6ff",
                                      insertbackground="#76f6ff", relief=tk.FLAT)
         self.search_entry.pack(fill=tk.X, padx=2)
-        self.search_var.trace("w", lambda *args: self.refresh_list())
+        # Piano scelto per le query strutturate (quali indici, in che ordine)
+        self.plan_label = tk.Label(self.pane_main, text="", anchor="w", font=FONT_SNIPPET,
+                                   bg="#0e0f12", fg="#c6f6ff")
+        self.plan_label.pack(side=tk.TOP, fill=tk.X, padx=7)
+        # Digitazione raggruppata (debounce) e filtro eseguito in un thread separato
+        self.search_debounce = Debouncer(self, SEARCH_DEBOUNCE_MS, self.refresh_list)
+        self.searcher = LatestOnlyWorker(self, on_error=lambda e: self.flash_status(f"⚠️ Ricerca non riuscita: {e}"))
+        self.search_var.trace("w", self.on_search_change)
+        # Completamento dei titoli: tendina sotto il campo di ricerca (↓ per sceglierne uno)
+        self.completion_ids = []
+        self.completion_list = tk.Listbox(self, height=MAX_COMPLETIONS, font=FONT_CONSOLE,
+                                          bg="#16232f", fg="#c6f6ff", selectbackground="#76f6ff",
+                                          selectforeground="#0e0f12", relief=tk.FLAT)
+        self.completion_list.bind("<Return>", lambda e: self.open_completion())
+        self.completion_list.bind("<Double-Button-1>", lambda e: self.open_completion())
+        self.completion_list.bind("<Escape>", lambda e: (self.hide_completions(), self.search_entry.focus_set()))
+        self.search_entry.bind("<Down>", self.focus_completions)
+        self.search_entry.bind("<Return>", lambda e: self.open_completion(0))
+        self.search_entry.bind("<Escape>", lambda e: self.hide_completions())
+        self.search_entry.bind("<FocusOut>", lambda e: self.after(150, self.hide_completions_unless_focused))
+        self.tag_var.trace("w", lambda *args: self.search_debounce())
 
-        self.note_list = tk.Listbox(self.pane_main, width=30, font=FONT_CONSOLE,
+        self.list_frame = tk.Frame(self.pane_main, bg="#0e0f12")
+        self.list_frame.pack(side=tk.LEFT, fill=tk.Y, padx=5, pady=5)
+        # Estratto del risultato sotto il puntatore, con i termini cercati evidenziati
+        self.snippet_view = tk.Text(self.list_frame, width=30, height=5, wrap=tk.WORD,
+                                    state=tk.DISABLED, font=FONT_SNIPPET, bg="#16232f",
+                                    fg="#c6f6ff", relief=tk.FLAT)
+        self.snippet_view.tag_configure("match", background="#76f6ff", foreground="#0e0f12")
+        self.snippet_view.pack(side=tk.BOTTOM, fill=tk.X, pady=(5, 0))
+        self.snippet_shown = None
+
+        self.note_scroll = tk.Scrollbar(self.list_frame, orient=tk.VERTICAL)
+        self.note_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.note_list = tk.Listbox(self.list_frame, width=30, font=FONT_CONSOLE,
                                     bg="#16232f", fg="#c6f6ff", selectbackground="#76f6ff",
                                     selectforeground="#0e0f12", relief=tk.FLAT)
-        self.note_list.pack(side=tk.LEFT, fill=tk.Y, padx=5, pady=5)
+        self.note_list.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        # Elenco virtuale: nel Listbox ci sono solo le righe visibili dei risultati
+        self.note_rows = VirtualList(self.note_list, self.note_scroll, self.note_label)
         self.note_list.bind("<<ListboxSelect>>", self.on_select)
+        self.note_list.bind("<Motion>", lambda e: self.show_snippet(self.note_rows.nearest(e.y)))
 
         self.right_frame = tk.Frame(self.pane_main, bg="#0e0f12")
         self.right_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
 
-        pane_editor = tk.PanedWindow(self.right_frame, orient=tk.HORIZONTAL, bg="#0e0f12")
-        pane_editor.pack(fill=tk.BOTH, expand=True)
-
-        self.text_area = tk.Text(pane_editor, wrap=tk.WORD, font=FONT_CONSOLE,
-                                 bg="#16232f", fg="#c6f6ff", insertbackground="#76f6ff",
-                                 relief=tk.FLAT)
-        # Bind per aggiornamento automatico anteprima
-        self.text_area.bind("<KeyRelease>", self.update_preview)
-        self.text_area.bind("<ButtonRelease>", self.update_preview)
-        pane_editor.add(self.text_area)
+        # Tasti raggruppati (debounce); la conversione del markdown gira in un thread
+        # separato e il mainloop applica solo l'ultimo piano
+        self.preview_debounce = Debouncer(self, PREVIEW_DEBOUNCE_MS, self.render_preview_async)
+        self.preview_worker = LatestOnlyWorker(self)
+        self.sync_pending = False
 
-        self.preview = tk.Text(pane_editor, wrap=tk.WORD, state=tk.DISABLED,
-                               font=FONT_CONSOLE, bg="#16232f", fg="#c6f6ff",
-                               relief=tk.FLAT)
-        pane_editor.add(self.preview)
+        # Una scheda per nota aperta: tornarci non reinserisce né riconverte nulla.
+        # self.text_area, self.preview e self.preview_blocks sono quelli della scheda attiva
+        self.tabs = ttk.Notebook(self.right_frame)
+        self.tabs.pack(fill=tk.BOTH, expand=True)
+        self.tabs.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+        self.tabs.bind("<Button-2>", self.close_tab_at)
+        self.bind("<Control-w>", lambda e: self.close_tab(self.editor))
+        self.editors = OrderedDict()    # id → scheda, dalla usata meno di recente alla attiva
+        self.editor = None
+        self.activate(self.new_tab(None, "—"))
 
         self.bottom = tk.Frame(self, height=50, bg="#0e0f12")
         self.bottom.pack(side=tk.BOTTOM, fill=tk.X)
@@ -149,7 +389,9 @@ class CaldrasApp(tk.Tk):
             tk.Button(self.bottom, text="📝 Nuova", command=self.new_note),
             tk.Button(self.bottom, text="💾 Salva", command=self.save_current),
             tk.Button(self.bottom, text="❌ Elimina", command=self.delete_note),
+            tk.Button(self.bottom, text="✏️ Rinomina", command=self.rename_note),
             tk.Button(self.bottom, text="🔐 Password", command=self.set_password),
+            tk.Button(self.bottom, text="🔒 Blocca", command=self.lock_session),
             tk.Button(self.bottom, text="📤 PDF", command=self.export_to_pdf),
             tk.Button(self.bottom, text="🌗 Tema", command=self.toggle_theme)
         ]
@@ -157,6 +399,119 @@ class CaldrasApp(tk.Tk):
             btn.pack(side=tk.LEFT, padx=6, pady=8)
             btn.bind("<Enter>", self.on_hover)
             btn.bind("<Leave>", self.on_leave)
+        # Salvataggi, cifratura ed export in thread separati; qui si vede cosa è in corso
+        self.status_label = tk.Label(self.bottom, text="", anchor="e", font=FONT_SNIPPET,
+                                     bg="#0e0f12", fg="#c6f6ff")
+        self.status_label.pack(side=tk.RIGHT, padx=8)
+        self.status_message = ""
+        self.jobs = JobQueue(self, on_status=self.show_status, on_error=self.show_job_error)
+        self.autosave_debounce = Debouncer(self, AUTOSAVE_IDLE_MS, self.autosave)
+    # ╔══════════════════════╗
+    # SCHEDE DELLE NOTE APERTE
+    # ╚══════════════════════╝
+
+    def new_tab(self, note_id, label):
+        """Scheda con editor e anteprima propri; resta in memoria finché non si chiude"""
+        frame = tk.PanedWindow(self.tabs, orient=tk.HORIZONTAL, bg="#0e0f12")
+        text = tk.Text(frame, wrap=tk.WORD, font=FONT_CONSOLE,
+                       bg="#16232f", fg="#c6f6ff", insertbackground="#76f6ff",
+                       relief=tk.FLAT)
+        # Bind per aggiornamento automatico anteprima
+        text.bind("<KeyRelease>", self.on_edit)
+        text.bind("<ButtonRelease>", lambda e: self.preview_debounce())
+        # L'anteprima segue lo scorrimento dell'editor
+        text.configure(yscrollcommand=self.on_editor_scroll)
+        frame.add(text)
+
+        preview = tk.Text(frame, wrap=tk.WORD, state=tk.DISABLED,
+                          font=FONT_CONSOLE, bg="#16232f", fg="#c6f6ff",
+                          relief=tk.FLAT)
+        frame.add(preview)
+        # La rotella sull'anteprima scorre l'editor, che poi riallinea l'anteprima
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            preview.bind(sequence, self.scroll_from_preview)
+
+        tab = NoteTab(note_id, frame, text, preview)
+        # Anteprima a blocchi: a ogni tasto si riscrivono solo i blocchi cambiati,
+        # e solo attorno alla parte visibile dell'editor
+        tab.blocks = BlockPreview(preview)
+        # Annulla/ripeti a diff invece dell'undo di Tk, che su note enormi tiene copie intere
+        tab.history = UndoHistory(text, self.config.get("undo_kb", 1024) * 1024)
+        text.bind("<<Undo>>", lambda e: tab.history.undo())
+        text.bind("<<Redo>>", lambda e: tab.history.redo())
+        # Prima della modifica (i binding del widget precedono quelli di Text)
+        text.bind("<Key>", lambda e: self.load_before_edit(tab))
+        text.bind("<<Paste>>", lambda e: self.load_before_edit(tab))
+        self.tabs.add(frame, text=label)
+        self.editors[note_id] = tab
+        self.theme_tab(tab)
+        return tab
+
+    def activate(self, tab):
+        """Porta in primo piano la scheda: editor e anteprima restano come li si era lasciati"""
+        if tab is self.editor:
+            return
+        if self.editor is not None:
+            # Le modifiche della scheda che si lascia restano in attesa del salvataggio automatico
+            self.capture_editor()
+            if self.journal_job is not None:
+                self.after_cancel(self.journal_job)
+                self.journal_tick()
+        self.preview_debounce.cancel()
+        self.preview_worker.cancel()
+        self.editor = tab
+        self.text_area, self.preview, self.preview_blocks = tab.text, tab.preview, tab.blocks
+        self.editor_note = tab.note_id
+        self.current_index = self.index.position(tab.note_id) if tab.note_id is not None else None
+        self.editors.move_to_end(tab.note_id)
+        if self.tabs.select() != str(tab.frame):
+            self.tabs.select(tab.frame)
+
+    def on_tab_changed(self, event):
+        tab = next((t for t in self.editors.values() if str(t.frame) == self.tabs.select()), None)
+        if tab is not None:
+            self.activate(tab)
+
+    def close_tab_at(self, event):
+        """Clic centrale su una linguetta: chiude quella scheda"""
+        try:
+            k = self.tabs.index(f"@{event.x},{event.y}")
+        except tk.TclError:
+            return
+        frame = self.tabs.tabs()[k]
+        tab = next((t for t in self.editors.values() if str(t.frame) == frame), None)
+        if tab is not None:
+            self.close_tab(tab)
+
+    def close_tab(self, tab):
+        """Chiude la scheda; le sue modifiche restano in attesa del salvataggio automatico"""
+        if tab.note_id is None and len(self.editors) == 1:
+            return "break"
+        self.capture_editor(tab, final=True)
+        if tab is self.editor:
+            others = [t for t in self.editors.values() if t is not tab]
+            # Si torna alla scheda usata più di recente, o a una scheda vuota
+            self.activate(others[-1] if others else self.new_tab(None, "—"))
+        del self.editors[tab.note_id]
+        if tab.note_id is not None and tab.history.done:
+            # Riaprendo la nota con lo stesso testo si ritrovano annullamenti e ripristini
+            text = tab.text.get("1.0", "end-1c")
+            self.session.put(("undo", tab.note_id), (content_hash(text), tab.history.export()),
+                             tab.history.size)
+        tab.history.close()
+        self.tabs.forget(tab.frame)
+        tab.frame.destroy()
+        return "break"
+
+    def evict_tabs(self):
+        """Chiude le schede usate meno di recente oltre tabs_max schede o tabs_mb di testo"""
+        most = self.config.get("tabs_max", 8)
+        budget = self.config.get("tabs_mb", 32) * 2**20
+        for tab in list(self.editors.values())[:-1]:
+            if len(self.editors) <= most and sum(t.size for t in self.editors.values()) <= budget:
+                break
+            self.close_tab(tab)
+
     def toggle_theme(self):
         self.theme = "alien-light" if self.theme == "alien-dark" else "alien-dark"
         self.config["theme"] = self.theme
@@ -164,13 +519,14 @@ class CaldrasApp(tk.Tk):
         self.apply_theme()
         self.update_preview()
 
-    def apply_theme(self):
+    def theme_colors(self):
+        """Sfondo, testo, sfondo dei campi e colore d'accento del tema attivo"""
         if self.theme == "alien-dark":
-            bg, fg, edt = "#0e0f12", "#c6f6ff", "#16232f"
-            accent = "#76f6ff"
-        else:
-            bg, fg, edt = "#f8f9fc", "#28323a", "#ffffff"
-            accent = "#37a3c6"
+            return "#0e0f12", "#c6f6ff", "#16232f", "#76f6ff"
+        return "#f8f9fc", "#28323a", "#ffffff", "#37a3c6"
+
+    def apply_theme(self):
+        bg, fg, edt, accent = self.theme_colors()
 
         # Finestra principale e frame
         self.configure(bg=bg)
@@ -179,15 +535,28 @@ class CaldrasApp(tk.Tk):
         self.right_frame.configure(bg=bg)
         self.bottom.configure(bg=bg)
         
-        # Barra di ricerca
+        # Barra di ricerca e filtro tag
         self.search_entry.configure(bg=edt, fg=fg, insertbackground=accent)
+        self.tag_entry.configure(bg=edt, fg=fg, insertbackground=accent)
+        self.tag_button.configure(bg=edt, fg=fg, activebackground=accent, activeforeground=bg)
+        self.plan_label.configure(bg=bg, fg=fg)
+        self.status_label.configure(bg=bg, fg=fg)
         
-        # Lista note
+        # Lista note ed estratti
+        self.list_frame.configure(bg=bg)
         self.note_list.configure(bg=edt, fg=fg, selectbackground=accent, selectforeground=bg)
+        self.note_scroll.configure(bg=edt, troughcolor=bg, activebackground=accent)
+        self.snippet_view.configure(bg=edt, fg=fg, state=tk.DISABLED)
+        self.completion_list.configure(bg=edt, fg=fg, selectbackground=accent, selectforeground=bg)
+        self.snippet_view.tag_configure("match", background=accent, foreground=bg)
         
-        # Area di testo e anteprima
-        self.text_area.configure(bg=edt, fg=fg, insertbackground=accent)
-        self.preview.configure(bg=edt, fg=fg, state=tk.DISABLED)
+        # Schede: aree di testo e anteprime
+        style = ttk.Style(self)
+        style.configure("TNotebook", background=bg, borderwidth=0)
+        style.configure("TNotebook.Tab", background=edt, foreground=fg, font=FONT_SNIPPET)
+        style.map("TNotebook.Tab", background=[("selected", accent)], foreground=[("selected", bg)])
+        for tab in self.editors.values():
+            self.theme_tab(tab)
 
         # Pulsanti
         for btn in self.buttons:
@@ -207,19 +576,74 @@ class CaldrasApp(tk.Tk):
         event.widget.configure(bg=bg, fg=fg)
 
     def update_preview(self, event=None):
+        """Anteprima aggiornata subito (apertura di una nota, cambio di tema)"""
+        self.preview_debounce.cancel()
+        self.preview_worker.cancel()
+        md_text = self.text_area.get("1.0", tk.END)
+        # Tornando a una nota già vista l'anteprima è già convertita
+        plan = self.session.get(("preview", self.editor_note))
+        if plan is None or plan.text != md_text:
+            plan = plan_preview(md_text, self.visible_lines())
+        self.apply_preview_plan(plan)
+
+    def render_preview_async(self):
         md_text = self.text_area.get("1.0", tk.END)
+        window = self.visible_lines()
+        tab = self.editor
+        self.preview_worker.submit(lambda cancel: plan_preview(md_text, window, cancel),
+                                   lambda plan: self.apply_preview_plan(plan, tab))
+
+    def apply_preview_plan(self, plan, tab=None):
+        # Un piano arrivato dopo un cambio di scheda appartiene a un'altra anteprima
+        if plan is None or (tab is not None and tab is not self.editor):
+            return
         self.preview.configure(state=tk.NORMAL)
-        self.preview.delete("1.0", tk.END)
-        
-        # Configura i tag per la formattazione
-        self.setup_preview_tags()
-        
-        # Renderizza il markdown con formattazione
-        self.render_markdown_to_text(md_text)
-        
+        self.preview_blocks.apply(plan, self.visible_lines())
         self.preview.configure(state=tk.DISABLED)
+        self.align_preview()
+        if self.editor_note is not None:
+            # Stima: testo, blocchi e segmenti occupano circa tre volte il testo
+            self.session.put(("preview", self.editor_note), plan, 3 * sys.getsizeof(plan.text))
+
+    def visible_lines(self):
+        """Prima e ultima riga dell'editor visibili"""
+        first = self.text_area.index("@0,0")
+        last = self.text_area.index(f"@0,{self.text_area.winfo_height()}")
+        return int(first.split(".")[0]), int(last.split(".")[0])
+
+    def align_preview(self):
+        """Porta in cima all'anteprima la riga che è in cima all'editor"""
+        self.preview.yview(self.preview_blocks.index_of(self.visible_lines()[0]))
+
+    def on_editor_scroll(self, first, last):
+        # Più eventi di scorrimento di fila diventano un solo aggiornamento
+        if not self.sync_pending:
+            self.sync_pending = True
+            self.after_idle(self.sync_preview)
 
-    def setup_preview_tags(self):
+    def sync_preview(self):
+        """Disegna i blocchi attorno alla nuova parte visibile, con lo stesso testo"""
+        self.sync_pending = False
+        self.preview.configure(state=tk.NORMAL)
+        self.preview_blocks.show(self.visible_lines())
+        self.preview.configure(state=tk.DISABLED)
+        self.align_preview()
+
+    def scroll_from_preview(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.text_area.yview_scroll(-3, "units")
+        else:
+            self.text_area.yview_scroll(3, "units")
+        return "break"
+
+    def theme_tab(self, tab):
+        bg, fg, edt, accent = self.theme_colors()
+        tab.frame.configure(bg=bg)
+        tab.text.configure(bg=edt, fg=fg, insertbackground=accent)
+        tab.preview.configure(bg=edt, fg=fg, state=tk.DISABLED)
+        self.setup_preview_tags(tab.preview)
+
+    def setup_preview_tags(self, preview):
         """Configura i tag per la formattazione del testo nell'anteprima"""
         if self.theme == "alien-dark":
             fg_normal = "#c6f6ff"
@@ -235,220 +659,651 @@ class CaldrasApp(tk.Tk):
             fg_code = "#d63384"
             
         # Header styles
-        self.preview.tag_config("h1", foreground=fg_header, font=("Cascadia Code", 16, "bold"))
-        self.preview.tag_config("h2", foreground=fg_header, font=("Cascadia Code", 14, "bold"))
-        self.preview.tag_config("h3", foreground=fg_header, font=("Cascadia Code", 12, "bold"))
+        preview.tag_config("h1", foreground=fg_header, font=("Cascadia Code", 16, "bold"))
+        preview.tag_config("h2", foreground=fg_header, font=("Cascadia Code", 14, "bold"))
+        preview.tag_config("h3", foreground=fg_header, font=("Cascadia Code", 12, "bold"))
         
         # Text styles
-        self.preview.tag_config("bold", foreground=fg_bold, font=("Cascadia Code", 11, "bold"))
-        self.preview.tag_config("italic", foreground=fg_italic, font=("Cascadia Code", 11, "italic"))
-        self.preview.tag_config("code", foreground=fg_code, font=("Consolas", 10), background="#2d2d2d" if self.theme == "alien-dark" else "#f5f5f5")
-        self.preview.tag_config("blockquote", foreground=fg_italic, font=("Cascadia Code", 11, "italic"))
-        
-    def render_markdown_to_text(self, md_text):
-        """Converte markdown in testo formattato per tkinter"""
-        import re
-        
-        lines = md_text.split('\n')
-        
-        for line_num, line in enumerate(lines):
-            # Headers
-            if line.startswith('### '):
-                self.preview.insert(tk.END, line[4:] + '\n', "h3")
-            elif line.startswith('## '):
-                self.preview.insert(tk.END, line[3:] + '\n', "h2")
-            elif line.startswith('# '):
-                self.preview.insert(tk.END, line[2:] + '\n', "h1")
-            
-            # Blockquotes
-            elif line.startswith('> '):
-                self.preview.insert(tk.END, "❯ " + line[2:] + '\n', "blockquote")
-            
-            # Lists
-            elif re.match(r'^\s*[-*+]\s', line):
-                indent = len(line) - len(line.lstrip())
-                bullet = "  " * (indent // 2) + "• "
-                content = re.sub(r'^\s*[-*+]\s', '', line)
-                self.preview.insert(tk.END, bullet)
-                self.format_inline_text(content + '\n')
-            
-            # Numbered lists
-            elif re.match(r'^\s*\d+\.\s', line):
-                indent = len(line) - len(line.lstrip())
-                prefix = "  " * (indent // 2)
-                match = re.match(r'^\s*(\d+)\.\s(.*)$', line)
-                if match:
-                    num, content = match.groups()
-                    self.preview.insert(tk.END, f"{prefix}{num}. ")
-                    self.format_inline_text(content + '\n')
-            
-            # Code blocks
-            elif line.startswith('```'):
-                if hasattr(self, '_in_code_block'):
-                    del self._in_code_block
-                    self.preview.insert(tk.END, '\n')
-                else:
-                    self._in_code_block = True
-                    lang = line[3:].strip()
-                    if lang:
-                        self.preview.insert(tk.END, f"[{lang}]\n", "code")
-            
-            elif hasattr(self, '_in_code_block'):
-                self.preview.insert(tk.END, line + '\n', "code")
-            
-            # Regular text
-            else:
-                if line.strip():  # Non-empty line
-                    self.format_inline_text(line + '\n')
-                else:  # Empty line
-                    self.preview.insert(tk.END, '\n')
-    
-    def format_inline_text(self, text):
-        """Formatta il testo inline (bold, italic, code)"""
-        import re
-        
-        # Split text into segments for formatting
-        pos = 0
-        
-        # Find and format inline code first
-        for match in re.finditer(r'`([^`]+)`', text):
-            # Insert normal text before code
-            if match.start() > pos:
-                self.format_bold_italic(text[pos:match.start()])
-            
-            # Insert code
-            self.preview.insert(tk.END, match.group(1), "code")
-            pos = match.end()
-        
-        # Insert remaining text
-        if pos < len(text):
-            self.format_bold_italic(text[pos:])
-    
-    def format_bold_italic(self, text):
-        """Formatta grassetto e corsivo"""
-        import re
-        
-        pos = 0
+        preview.tag_config("bold", foreground=fg_bold, font=("Cascadia Code", 11, "bold"))
+        preview.tag_config("italic", foreground=fg_italic, font=("Cascadia Code", 11, "italic"))
+        preview.tag_config("code", foreground=fg_code, font=("Consolas", 10), background="#2d2d2d" if self.theme == "alien-dark" else "#f5f5f5")
+        preview.tag_config("blockquote", foreground=fg_italic, font=("Cascadia Code", 11, "italic"))
         
-        # Process bold and italic
-        for match in re.finditer(r'\*\*\*(.+?)\*\*\*|\*\*(.+?)\*\*|\*(.+?)\*', text):
-            # Insert normal text before formatting
-            if match.start() > pos:
-                self.preview.insert(tk.END, text[pos:match.start()])
-            
-            # Determine formatting type
-            if match.group(1):  # Bold + Italic (***text***)
-                self.preview.insert(tk.END, match.group(1), ("bold", "italic"))
-            elif match.group(2):  # Bold (**text**)
-                self.preview.insert(tk.END, match.group(2), "bold")
-            elif match.group(3):  # Italic (*text*)
-                self.preview.insert(tk.END, match.group(3), "italic")
-            
-            pos = match.end()
-        
-        # Insert remaining normal text
-        if pos < len(text):
-            self.preview.insert(tk.END, text[pos:])
-
     def export_to_pdf(self):
         if self.current_index is None:
             messagebox.showinfo("Nessuna nota", "Seleziona una nota da esportare.")
             return
 
         titolo = self.notes[self.current_index][0]
+        self.finish_loading(self.editor)
         content = self.text_area.get("1.0", tk.END)
         file_path = filedialog.asksaveasfilename(defaultextension=".pdf",
                             filetypes=[("PDF files", "*.pdf")],
                             title="Esporta PDF",
                             initialfile=f"{titolo}.pdf")
         if file_path:
-            success, engine = generate_pdf(content, file_path)
-            if success:
-                messagebox.showinfo("✅ PDF Esportato", f"PDF salvato con {engine}:\n{file_path}")
-            else:
-                messagebox.showerror("Errore PDF", f"Errore durante l'esportazione:\n{engine}")
+            self.jobs.submit(("pdf", file_path), lambda: generate_pdf(content, file_path),
+                             lambda result: self.pdf_done(result, file_path), label="📤 PDF")
+
+    def pdf_done(self, result, file_path):
+        success, engine = result
+        if success:
+            messagebox.showinfo("✅ PDF Esportato", f"PDF salvato con {engine}:\n{file_path}")
+        else:
+            messagebox.showerror("Errore PDF", f"Errore durante l'esportazione:\n{engine}")
+
+    # ╔═════════════════════════════╗
+    # SALVATAGGI IN BACKGROUND
+    # ╚═════════════════════════════╝
+
+    def write_notes(self, on_done=None):
+        """Scrive il vault nel thread di I/O; delle scritture in attesa conta l'ultima"""
+        snapshot = list(self.notes)
+        self.jobs.submit("vault", lambda: save_notes(snapshot), on_done,
+                         label="💾 salvataggio", coalesce=True)
+
+    # ╔═════════════════════════════╗
+    # DIARIO DELLE MODIFICHE (CRASH)
+    # ╚═════════════════════════════╝
+
+    def journal_tick(self):
+        """Accoda al diario il diff tra l'ultimo testo registrato e l'editor"""
+        self.journal_job = None
+        note_id = self.editor_note
+        pos = self.index.position(note_id) if note_id is not None else None
+        if pos is None or self.editor.pending is not None:
+            return
+        text = self.text_area.get("1.0", tk.END).strip()
+        before = self.journaled.get(note_id)
+        if before is None or before == text:
+            return
+        self.journaled[note_id] = text
+        titolo, _, password = self.notes[pos] if len(self.notes[pos]) == 3 else (*self.notes[pos], None)
+        encrypt = (lambda payload: encrypt_text(payload, password)) if password else None
+        diff = make_diff(before, text)
+        self.jobs.submit("journal", lambda: append_record(
+            JOURNAL_FILE, encode_record(note_id, titolo, before, diff, encrypt)))
+
+    def compact_journal(self, result=None):
+        """Svuota il diario quando tutto ciò che contiene è già nel vault"""
+        if self.dirty or self.journal_keep:
+            return
+        if all(content_hash(text) == self.saved_hash.get(note_id)
+               for note_id, text in self.journaled.items()):
+            self.jobs.submit("journal", lambda: clear_journal(JOURNAL_FILE))
+
+    def recover_journal(self):
+        """All'avvio: propone di riapplicare le modifiche rimaste nel diario.
+
+        Il testo recuperato si apre in una scheda come modifica non salvata:
+        lo si vede prima che finisca nel vault, col salvataggio di sempre.
+        """
+        records = read_journal(JOURNAL_FILE)
+        if not records:
+            return
+        chains = {}
+        for note_id, titolo, protected, payload in records:
+            pos = self.index.position(note_id)
+            if pos is None or self.notes[pos][0] != titolo:
+                # Id cambiato (indice ricostruito) o nota rinominata: prima il titolo, poi l'id.
+                # Un diff si applica solo al testo da cui è nato, quindi una nota sbagliata resta intatta
+                pos = next((p for p, n in enumerate(self.notes) if n[0] == titolo), pos)
+            if pos is not None:
+                chains.setdefault(self.index.ids[pos], []).append(payload)
+        titles = [self.notes[self.index.position(i)][0] for i in chains]
+        if not titles or not messagebox.askyesno(
+                "♻️ Recupero", "Modifiche non salvate trovate per:\n" + "\n".join(titles) +
+                "\n\nRipristinarle?"):
+            clear_journal(JOURNAL_FILE)
+            return
+        recovered = []
+        for note_id, payloads in chains.items():
+            pos = self.index.position(note_id)
+            titolo, contenuto, password = self.notes[pos] if len(self.notes[pos]) == 3 else (*self.notes[pos], None)
+            decode = bytes.decode
+            if password:
+                pw = simpledialog.askstring("🔐 Password richiesta",
+                                            f"Password per recuperare '{titolo}':", show='*', parent=self)
+                if pw != password:
+                    # Si riproverà al prossimo avvio
+                    self.journal_keep = True
+                    continue
+                try: cifrato, contenuto = contenuto, decrypt_text(contenuto, password)
+                except: continue
+                # Password già verificata: la scheda non la chiede di nuovo
+                self.session.put(cifrato, contenuto)
+                decode = lambda payload, pw=pw: decrypt_text(payload, pw)
+            base = contenuto.strip()
+            text = replay(base, payloads, decode)
+            if text != base:
+                self.saved_hash[note_id] = content_hash(base)
+                self.dirty[note_id] = text
+                self.journaled[note_id] = text
+                recovered.append(note_id)
+        for note_id in recovered:
+            self.open_note(self.index.position(note_id))
+        if recovered:
+            self.flash_status("♻️ Modifiche ripristinate nelle schede: salva per confermarle")
+
+    def on_edit(self, event=None):
+        self.preview_debounce()
+        self.autosave_debounce()
+        # Il diario scrive al più ogni JOURNAL_MS anche mentre si continua a scrivere
+        if self.journal_job is None:
+            self.journal_job = self.after(JOURNAL_MS, self.journal_tick)
+
+    def capture_editor(self, tab=None, final=False):
+        """Confronta l'editor con l'ultima versione salvata e segna la nota come modificata o no.
+
+        Una nota ancora in caricamento si salta (il testo è incompleto),
+        a meno che final chieda di finire di caricarla subito.
+        """
+        tab = tab or self.editor
+        note_id = tab.note_id
+        if note_id is None or self.index.position(note_id) is None:
+            return
+        if tab.pending is not None:
+            if not final:
+                return
+            self.finish_loading(tab)
+        text = tab.text.get("1.0", tk.END).strip()
+        tab.size = len(text)
+        if content_hash(text) != self.saved_hash.get(note_id):
+            self.dirty[note_id] = text
+        else:
+            self.dirty.pop(note_id, None)
+
+    def autosave(self):
+        # Tutte le schede: si può scrivere in una e passare subito a un'altra
+        for tab in self.editors.values():
+            self.capture_editor(tab)
+        self.commit_dirty()
+
+    def commit_dirty(self, announce=False):
+        """Cifra e salva in un'unica scrittura tutte le note modificate, e solo quelle"""
+        batch = {}
+        for note_id, text in self.dirty.items():
+            pos = self.index.position(note_id)
+            if pos is not None and not self.jobs.busy(("password", note_id)):
+                batch[note_id] = (text, self.notes[pos][2] if len(self.notes[pos]) == 3 else None)
+        if not batch:
+            if announce:
+                self.flash_status("Nessuna modifica da salvare")
+            return
+
+        def encrypt():
+            # Nel thread di I/O anche la reindicizzazione, dal testo in chiaro già disponibile
+            contents = {}
+            for note_id, (text, pw) in batch.items():
+                content = encrypt_text(text, pw) if pw else text
+                contents[note_id] = content
+                self.reindex(note_id, text, lambda note: (note[0], content, pw))
+            return contents
+
+        def store(contents):
+            titles = []
+            for note_id, content in contents.items():
+                text, pw = batch[note_id]
+                pos = self.index.position(note_id)
+                if pos is None:
+                    continue    # eliminata nel frattempo
+                self.notes[pos] = (self.notes[pos][0], content, pw)
+                self.saved_hash[note_id] = content_hash(text)
+                if self.dirty.get(note_id) == text:
+                    del self.dirty[note_id]
+                titles.append(self.notes[pos][0])
+            if titles:
+                self.write_notes(self.compact_journal)
+                self.flash_status("✅ Salvate: " + ", ".join(f"'{t}'" for t in titles))
+                # L'indice è già aggiornato: la query corrente (dalla cache se non toccata) si rifà
+                self.refresh_list()
+
+        self.jobs.submit("autosave", encrypt, store,
+                         lambda e: messagebox.showerror("Errore", "Errore nella cifratura."),
+                         label="🔐 cifratura" if any(pw for _, pw in batch.values()) else "")
+
+    def reindex(self, note_id, text=None, change=None):
+        """Nel thread di I/O: reindicizza la nota com'è ora, o come change(nota) dopo il salvataggio.
+
+        text è il corpo in chiaro, se già noto; al thread di Tk resta solo
+        l'assegnazione in self.notes.
+        """
+        with self.index.lock:
+            pos = self.index.position(note_id)
+            if pos is None:
+                return
+            note = self.notes[pos]
+        self.index.update_id(note_id, change(note) if change else note, text)
+
+    # ╔═════════════════════════════╗
+    # NOTE SBLOCCATE (CACHE DI SESSIONE)
+    # ╚═════════════════════════════╝
+
+    def expire_session(self):
+        self.session.expire()
+        self.after(SESSION_EXPIRE_MS, self.expire_session)
+
+    def lock_session(self):
+        """Blocca: salva le modifiche, dimentica i testi in chiaro e chiude le schede delle note protette"""
+        if self.index is None:
+            return "break"
+        self.autosave_debounce.cancel()
+        for tab in self.editors.values():
+            self.capture_editor(tab, final=True)
+        self.commit_dirty()
+        for tab in list(self.editors.values()):
+            pos = self.index.position(tab.note_id) if tab.note_id is not None else None
+            if pos is not None and len(self.notes[pos]) == 3 and self.notes[pos][2]:
+                self.close_tab(tab)
+        # Dopo le schede: chiudendole la cronologia degli annullamenti finisce in sessione
+        self.session.clear()
+        self.index.forget_plaintext()
+        self.snippet_shown = None
+        for note_id, text in list(self.journaled.items()):
+            pos = self.index.position(note_id)
+            if pos is not None and len(self.notes[pos]) == 3 and self.notes[pos][2] \
+                    and content_hash(text) == self.saved_hash.get(note_id):
+                del self.journaled[note_id]
+        self.flash_status("🔒 Note protette bloccate")
+        return "break"
+
+    def show_status(self, labels):
+        text = "⏳ " + ", ".join(labels) if labels else self.status_message
+        self.status_label.configure(text=text)
+
+    def flash_status(self, message):
+        """Messaggio che resta visibile qualche secondo, se non ci sono lavori in corso"""
+        self.status_message = message
+        self.show_status(self.jobs.labels())
+        self.after(4000, lambda: self.status_message == message and self.clear_status())
+
+    def clear_status(self):
+        self.status_message = ""
+        self.show_status(self.jobs.labels())
+
+    def show_job_error(self, error):
+        messagebox.showerror("Errore", f"Operazione non riuscita:\n{error}")
     def refresh_list(self):
-        self.note_list.delete(0, tk.END)
-        keyword = self.search_var.get().lower() if hasattr(self, 'search_var') else ""
-        for note in self.notes:
-            title = note[0] if len(note) >= 1 else "Senza titolo"
-            if keyword in title.lower():
-                label = title + (" 🔒" if len(note) == 3 and note[2] else "")
-                self.note_list.insert(tk.END, label)
+        if self.index is None:
+            return      # archivio in caricamento: l'elenco è quello dello snapshot
+        keyword = self.search_var.get() if hasattr(self, 'search_var') else ""
+        tags = self.tag_var.get().replace(",", " ").split() if hasattr(self, 'tag_var') else []
+        self.search_debounce.cancel()
+        self.searcher.submit(lambda cancel: self.find_notes(keyword, tags, cancel), self.show_results)
+
+    def find_notes(self, keyword, tags=(), cancel=None):
+        """Eseguita nel thread di ricerca: non tocca i widget. Restituisce (id, piano)"""
+        # Query ripetute o cancellate con backspace: risultato dalla cache se ancora valido
+        ids, plan = self.index.cached((keyword, tuple(tags)),
+                                      lambda: self.run_search(keyword, tags, cancel),
+                                      lambda result: (result[0], *dependencies(keyword, tags)), cancel)
+        # Anche con un milione di risultati il filtro resta fuori dal mainloop
+        return [i for i in ids if self.index.position(i) is not None], plan
+
+    def run_search(self, keyword, tags=(), cancel=None):
+        tagged = self.index.notes_with_tags(tags) if tags else None
+        if tagged is not None and not keyword.strip():
+            return tagged, []
+        if is_structured(keyword):
+            # Query con operatori (tag:, locked:, modified:, "frase", -parola)
+            try:
+                ids, plan = run_query(self.index, self.notes, keyword, cancel=cancel)
+            except ValueError as e:
+                return [], [f"⚠️ {e}"]
+            if tagged is not None:
+                allowed = set(tagged)
+                ids = [i for i in ids if i in allowed]
+            return ids, plan
+        # Ricerca fuzzy sui titoli tramite l'indice a trigrammi,
+        # seguita dalle note più pertinenti per contenuto (BM25)
+        ids = self.index.filter_titles(keyword, cancel=cancel)
+        if keyword.strip():
+            shown = set(ids)
+            ids += [i for i in self.index.search(keyword, k=MAX_RESULTS, cancel=cancel) if i not in shown]
+        if tagged is not None:
+            allowed = set(tagged)
+            ids = [i for i in ids if i in allowed]
+        return ids, []
+
+    def fill_tag_menu(self):
+        """Popola il menu 🏷️ con i tag più usati e il numero di note"""
+        self.tag_menu.delete(0, tk.END)
+        if self.index is None:
+            return
+        for tag, count in self.index.tag_counts()[:MAX_TAG_FACETS]:
+            self.tag_menu.add_command(label=f"#{tag} ({count})",
+                                      command=lambda t=tag: self.add_tag_filter(t))
+        if self.tag_var.get().strip():
+            self.tag_menu.add_separator()
+            self.tag_menu.add_command(label="✖ Rimuovi filtri", command=lambda: self.tag_var.set(""))
+
+    def add_tag_filter(self, tag):
+        current = self.tag_var.get().split()
+        if f"#{tag}" not in current:
+            self.tag_var.set(" ".join(current + [f"#{tag}"]))
+
+    def show_results(self, result):
+        ids, plan = result
+        self.plan_label.configure(text=("🧭 " + " | ".join(plan)) if plan else "")
+        self.visible_ids = ids
+        self.note_rows.set_ids(ids, self.restore_top)
+        self.restore_top = 0
+        self.snippet_shown = None
+        self.show_snippet(0)
+
+    def note_label(self, note_id):
+        """Etichetta di una riga dell'elenco: chiamata solo per le righe visibili"""
+        if self.index is None:
+            return self.snapshot_labels.get(note_id, "")
+        pos = self.index.position(note_id)
+        note = self.notes[pos] if pos is not None else ()
+        title = note[0] if len(note) >= 1 else "Senza titolo"
+        return title + (" 🔒" if len(note) == 3 and note[2] else "")
+
+    def show_snippet(self, i):
+        """Estratto dell'i-esimo risultato: generato solo per la nota indicata"""
+        query = self.search_var.get()
+        if self.snippet_shown == (i, query):
+            return
+        self.snippet_shown = (i, query)
+        text, spans = "", []
+        if query.strip() and 0 <= i < len(self.visible_ids):
+            note_id = self.visible_ids[i]
+            pos = self.index.position(note_id)
+            if pos is not None:
+                # Le note protette danno un estratto solo se sbloccate nella sessione
+                text, spans = self.index.snippet(note_id, self.notes[pos], snippet_query(query),
+                                                 lambda note: self.session.get(note[1]))
+        self.snippet_view.configure(state=tk.NORMAL)
+        self.snippet_view.delete("1.0", tk.END)
+        self.snippet_view.insert("1.0", text)
+        for start, end in spans:
+            self.snippet_view.tag_add("match", f"1.0+{start}c", f"1.0+{end}c")
+        self.snippet_view.configure(state=tk.DISABLED)
+
+    def on_search_change(self, *args):
+        if self.index is None:
+            return
+        self.update_completions()
+        self.search_debounce()
+
+    def update_completions(self):
+        """Titoli che iniziano con il testo digitato (ricerca binaria, sotto il millisecondo)"""
+        self.completion_ids = self.index.complete(self.search_var.get(), MAX_COMPLETIONS)
+        self.completion_list.delete(0, tk.END)
+        if not self.completion_ids:
+            self.hide_completions()
+            return
+        for note_id in self.completion_ids:
+            self.completion_list.insert(tk.END, self.notes[self.index.position(note_id)][0])
+        self.completion_list.configure(height=len(self.completion_ids))
+        self.completion_list.place(in_=self.search_entry, x=0, rely=1.0, relwidth=1.0)
+        self.completion_list.lift()
+
+    def hide_completions(self):
+        self.completion_list.place_forget()
+
+    def hide_completions_unless_focused(self):
+        if self.focus_get() is not self.completion_list:
+            self.hide_completions()
+
+    def focus_completions(self, event=None):
+        if self.completion_ids and self.completion_list.winfo_ismapped():
+            self.completion_list.focus_set()
+            self.completion_list.selection_clear(0, tk.END)
+            self.completion_list.selection_set(0)
+            self.completion_list.activate(0)
+        return "break"
+
+    def open_completion(self, i=None):
+        if i is None:
+            sel = self.completion_list.curselection()
+            i = sel[0] if sel else 0
+        if not self.completion_list.winfo_ismapped() or i >= len(self.completion_ids):
+            return
+        pos = self.index.position(self.completion_ids[i])
+        self.hide_completions()
+        if pos is not None:
+            self.open_note(pos)
+            self.text_area.focus_set()
 
     def new_note(self):
+        if self.index is None:
+            return
         titolo = simpledialog.askstring("Nuova Nota", "Titolo:", parent=self)
         if titolo:
             self.notes.append((titolo, "", None))
-            save_notes(self.notes)
+            self.index.add(self.notes[-1])
+            self.write_notes()
             self.refresh_list()
 
     def on_select(self, event):
-        sel = self.note_list.curselection()
-        if not sel: return
-        i = sel[0]
-        matches = [note for note in self.notes if self.search_var.get().lower() in note[0].lower()]
-        if i >= len(matches): return
-        self.current_index = self.notes.index(matches[i])
-        titolo, contenuto, password = self.notes[self.current_index] if len(self.notes[self.current_index]) == 3 else (*self.notes[self.current_index], None)
+        i = self.note_rows.selection()
+        if i is None or self.index is None: return
+        self.show_snippet(i)
+        self.open_note(self.index.position(self.visible_ids[i]))
+
+    def open_note(self, pos):
+        note_id = self.index.ids[pos]
+        if note_id in self.editors:
+            # Già aperta: testo, annullamenti, cursore, scorrimento e anteprima sono nella scheda
+            self.activate(self.editors[note_id])
+            return
+        titolo, contenuto, password = self.notes[pos] if len(self.notes[pos]) == 3 else (*self.notes[pos], None)
         if password:
-            pw = simpledialog.askstring("🔐 Password richiesta", f"Inserisci password per '{titolo}':", show='*')
-            if pw != password:
-                messagebox.showerror("Errore", "Password errata.")
-                self.text_area.delete("1.0", tk.END)
-                self.preview.configure(state=tk.NORMAL)
-                self.preview.delete("1.0", tk.END)
-                self.preview.configure(state=tk.DISABLED)
-                return
-            try: contenuto = decrypt_text(contenuto, password)
-            except: contenuto = ""
-        self.text_area.delete("1.0", tk.END)
-        self.text_area.insert(tk.END, contenuto)
+            # Già sbloccata in questa sessione: niente password né decifratura
+            cifrato, contenuto = contenuto, self.session.get(contenuto)
+            if contenuto is None:
+                pw = simpledialog.askstring("🔐 Password richiesta", f"Inserisci password per '{titolo}':", show='*')
+                if pw != password:
+                    messagebox.showerror("Errore", "Password errata.")
+                    return
+                try:
+                    contenuto = decrypt_text(cifrato, password)
+                    self.session.put(cifrato, contenuto)
+                except: contenuto = ""
+        if note_id in self.dirty:
+            contenuto = self.dirty[note_id]
+        else:
+            self.saved_hash[note_id] = content_hash(contenuto.strip())
+        self.journaled.setdefault(note_id, contenuto.strip())
+        # La scheda vuota dell'avvio si riusa, altrimenti se ne apre una nuova
+        tab = self.editors.pop(None, None)
+        if tab is not None:
+            tab.note_id = note_id
+            self.editors[note_id] = tab
+            self.tabs.tab(tab.frame, text=titolo)
+            with tab.history.paused():
+                tab.text.delete("1.0", tk.END)
+            tab.history.clear()
+            self.editor = None
+        else:
+            tab = self.new_tab(note_id, titolo)
+        tab.size = len(contenuto)
+        self.activate(tab)
+        self.load_text(tab, contenuto)
+        history = self.session.get(("undo", note_id))
+        if history is not None and history[0] == content_hash(contenuto):
+            tab.history.load(history[1])
         self.update_preview()
+        self.evict_tabs()
+
+    # ╔══════════════════════════╗
+    # CARICAMENTO DELLE NOTE LUNGHE
+    # ╚══════════════════════════╝
+
+    def load_text(self, tab, text):
+        """Inserisce subito il primo schermo; il resto arriva a pezzi e intanto si può già scrivere"""
+        end = chunk_end(text, 0, LOAD_FIRST_CHARS)
+        # I pezzi inseriti dal caricamento non devono finire tra gli annullamenti
+        with tab.history.paused():
+            tab.text.insert(tk.END, text[:end])
+        if end < len(text):
+            tab.pending = (text, end)
+            # Gravità a sinistra: ciò che si scrive in fondo intanto resta dopo il segno
+            tab.text.mark_set(LOAD_MARK, "end - 1c")
+            tab.text.mark_gravity(LOAD_MARK, tk.LEFT)
+            self.after_idle(self.load_chunk, tab)
+        else:
+            self.loaded(tab)
+
+    def append_loaded(self, tab, chunk):
+        """Aggiunge un pezzo dopo il testo già caricato, e il segno si sposta dopo il pezzo"""
+        with tab.history.paused():
+            tab.text.mark_gravity(LOAD_MARK, tk.RIGHT)
+            tab.text.insert(LOAD_MARK, chunk)
+            tab.text.mark_gravity(LOAD_MARK, tk.LEFT)
+
+    def load_before_edit(self, tab):
+        """Modifica oltre il testo caricato: prima si finisce di caricare.
+
+        Così il resto della nota arriva prima del testo nuovo, e gli indici
+        salvati negli annullamenti non vengono spostati da un pezzo inserito dopo.
+        """
+        if tab.pending is None:
+            return
+        past = tab.text.compare(tk.INSERT, ">=", LOAD_MARK)
+        if not past and tab.text.tag_ranges(tk.SEL):
+            past = tab.text.compare(tk.SEL_LAST, ">", LOAD_MARK)
+        if past:
+            self.finish_loading(tab)
+
+    def load_chunk(self, tab):
+        if tab.pending is None:
+            return      # finita di caricare o chiusa nel frattempo
+        text, start = tab.pending
+        end = chunk_end(text, start, LOAD_CHUNK_CHARS)
+        self.append_loaded(tab, text[start:end])
+        if end < len(text):
+            tab.pending = (text, end)
+            self.status_message = f"📄 Caricamento: {100 * end // len(text)}%"
+            self.show_status(self.jobs.labels())
+            self.after_idle(self.load_chunk, tab)
+        else:
+            self.loaded(tab)
+
+    def finish_loading(self, tab):
+        """Inserisce in una volta quanto resta da caricare (salvataggio, esportazione, chiusura)"""
+        if tab.pending is not None:
+            text, start = tab.pending
+            self.append_loaded(tab, text[start:])
+            self.loaded(tab)
+
+    def loaded(self, tab):
+        was_loading = tab.pending is not None
+        tab.pending = None
+        if was_loading:
+            tab.text.mark_unset(LOAD_MARK)
+            if self.status_message.startswith("📄"):
+                self.clear_status()
+            if tab is self.editor:
+                # L'anteprima era stata calcolata sul primo pezzo
+                self.preview_debounce()
 
     def save_current(self):
         if self.current_index is None: return
-        titolo, _, password = self.notes[self.current_index] if len(self.notes[self.current_index]) == 3 else (*self.notes[self.current_index], None)
-        new_content = self.text_area.get("1.0", tk.END).strip()
-        if password:
-            try: new_content = encrypt_text(new_content, password)
-            except:
-                messagebox.showerror("Errore", "Errore nella cifratura.")
-                return
-        self.notes[self.current_index] = (titolo, new_content, password)
-        save_notes(self.notes)
-        messagebox.showinfo("Salvata", f"La nota '{titolo}' è stata salvata.")
+        note_id = self.index.ids[self.current_index]
+        if self.jobs.busy(("password", note_id)):
+            messagebox.showinfo("Attendi", "Cambio password in corso per questa nota.")
+            return
+        # Come il salvataggio automatico, ma subito: solo le note cambiate
+        self.autosave_debounce.cancel()
+        self.capture_editor(final=True)
+        self.commit_dirty(announce=True)
 
     def delete_note(self):
         if self.current_index is not None:
             titolo = self.notes[self.current_index][0]
             if messagebox.askyesno("Eliminare", f"Eliminare '{titolo}'?"):
-                del self.notes[self.current_index]
-                save_notes(self.notes)
-                self.text_area.delete("1.0", tk.END)
-                self.preview.configure(state=tk.NORMAL)
-                self.preview.delete("1.0", tk.END)
-                self.preview.configure(state=tk.DISABLED)
+                note_id = self.index.ids[self.current_index]
+                self.close_tab(self.editors[note_id])
+                self.dirty.pop(note_id, None)
+                self.saved_hash.pop(note_id, None)
+                self.journaled.pop(note_id, None)
+                # Insieme sotto il lock: la ricerca in corso non vede mai posizioni scalate a metà
+                with self.index.lock:
+                    pos = self.index.position(note_id)
+                    del self.notes[pos]
+                    self.index.delete(pos)
+                # Le posizioni dopo la nota eliminata sono scalate di uno
+                self.current_index = self.index.position(self.editor_note) if self.editor_note is not None else None
+                self.write_notes()
                 self.refresh_list()
-                self.current_index = None
+
+    def rename_note(self):
+        if self.current_index is None: return
+        titolo, contenuto, password = self.notes[self.current_index] if len(self.notes[self.current_index]) == 3 else (*self.notes[self.current_index], None)
+        nuovo = simpledialog.askstring("✏️ Rinomina", "Nuovo titolo:", initialvalue=titolo, parent=self)
+        if not nuovo or nuovo == titolo: return
+        note_id = self.index.ids[self.current_index]
+        if self.jobs.busy(("password", note_id)):
+            messagebox.showinfo("Attendi", "Cambio password in corso, riprova tra poco.")
+            return
+        self.notes[self.current_index] = (nuovo, contenuto, password)
+        self.tabs.tab(self.editor.frame, text=nuovo)
+        self.write_notes()
+        # Stessa fila dei salvataggi: la reindicizzazione vede il contenuto dell'ultimo salvato
+        self.jobs.submit("autosave", lambda: self.reindex(note_id), lambda _: self.refresh_list())
 
     def set_password(self):
         if self.current_index is None: return
+        # Prima della domanda: con un salvataggio in corso la password scelta andrebbe persa
+        if self.jobs.busy("autosave"):
+            messagebox.showinfo("Attendi", "Salvataggio in corso, riprova tra poco.")
+            return
+        note_id = self.index.ids[self.current_index]
         pw = simpledialog.askstring("🔐 Password", "Nuova password (vuoto per rimuovere):", show='*', parent=self)
-        titolo, contenuto, old_pw = self.notes[self.current_index] if len(self.notes[self.current_index]) == 3 else (*self.notes[self.current_index], None)
-        if old_pw:
-            try: contenuto = decrypt_text(contenuto, old_pw)
-            except:
-                messagebox.showerror("Errore", "Password errata.")
+        self.change_password(note_id, pw)
+
+    def change_password(self, note_id, pw):
+        if self.jobs.busy("autosave"):
+            # Salvataggio partito mentre la finestra era aperta: si cambia appena finisce
+            self.after(JobQueue.POLL_MS, self.change_password, note_id, pw)
+            return
+        pos = self.index.position(note_id)
+        if pos is None:
+            return
+        titolo, contenuto, old_pw = self.notes[pos] if len(self.notes[pos]) == 3 else (*self.notes[pos], None)
+        # Modifiche non ancora salvate: si cifrano direttamente con la nuova password
+        if note_id in self.editors:
+            self.capture_editor(self.editors[note_id], final=True)
+        # Resta tra le modifiche da salvare finché il cambio di password non riesce
+        edited = self.dirty.get(note_id)
+
+        def rekey():
+            # Nel thread di I/O: decifra con la vecchia password e cifra con la nuova
+            if edited is not None:
+                plain = edited
+            else:
+                plain = decrypt_text(contenuto, old_pw) if old_pw else contenuto
+            new_content = encrypt_text(plain, pw) if pw else plain
+            self.reindex(note_id, plain, lambda note: (note[0], new_content, pw or None))
+            return plain, new_content
+
+        def store(result):
+            plain, new_content = result
+            pos = self.index.position(note_id)
+            if pos is None:
                 return
-        if pw:
-            contenuto = encrypt_text(contenuto, pw)
-            self.notes[self.current_index] = (titolo, contenuto, pw)
-        else:
-            self.notes[self.current_index] = (titolo, contenuto, None)
-        save_notes(self.notes)
-        messagebox.showinfo("🔒 Password", f"La password per '{titolo}' è stata aggiornata.")
+            self.notes[pos] = (self.notes[pos][0], new_content, pw or None)
+            self.saved_hash[note_id] = content_hash(plain.strip())
+            if edited is not None and self.dirty.get(note_id) == edited:
+                del self.dirty[note_id]
+            self.write_notes()
+            messagebox.showinfo("🔒 Password", f"La password per '{titolo}' è stata aggiornata.")
+
+        self.jobs.submit(("password", note_id), rekey, store,
+                         lambda e: messagebox.showerror("Errore", "Password errata."),
+                         label="🔐 password")
 
 if __name__ == "__main__":
-    splash()
-    CaldrasApp().mainloop()
+    config = load_config()
+    loading = BackgroundLoad(load_startup)
+    snapshot = load_snapshot()
+    if snapshot is None:
+        # Lo splash dura quanto il caricamento, che intanto procede in un thread
+        splash(loading, config.get("splash_min_ms", 0))
+        CaldrasApp(config, loading.result()).mainloop()
+    else:
+        # Con lo snapshot la finestra si disegna subito e il vault arriva dopo
+        CaldrasApp(config, loading=loading, snapshot=snapshot).mainloop()
@@ -6,34 +6,53 @@ import hashlib
 import time
 import random
 import datetime
-from cryptography.fernet import Fernet
-from weasyprint import HTML
-from colorama import Fore, Style, init
-from rich.console import Console
-from rich.markdown import Markdown
-import markdown
+import re
+import readline
+# cryptography, markdown, rich e weasyprint si importano al primo uso:
+# elencare o cercare le note non li carica
+from caldras_query import is_structured, run_query, snippet_query
+from caldras_search import SearchIndex
+from caldras_session import SessionCache
+from caldras_store import vault_stamp
+from caldras_worker import BackgroundLoad
 
-init(autoreset=True)
+# colorama si carica in colori(), all'avvio del menu: chi importa il modulo non la paga
+Fore = Style = None
+
+def colori():
+    global Fore, Style
+    from colorama import Fore, Style, init
+    init(autoreset=True)
 
 NOTE_FILE = ".note.dat"
+INDEX_FILE = ".note.idx"
+MAX_RISULTATI = 20
+MAX_RIGHE = 100
+MAX_TAG = 30
+MAX_COMPLETAMENTI = 10
+CACHE_MB = 64          # testi decifrati tenuti in memoria nella sessione
+CACHE_IDLE_MIN = 10    # minuti senza uso prima di dimenticarli
+SPLASH_MIN_S = 0       # durata minima dello splash; altrimenti dura quanto il caricamento
 
-# Inizializza Rich console
-console = Console()
+# Note protette già sbloccate, per testo cifrato: niente password né decifratura ripetute
+sbloccate = SessionCache(CACHE_MB * 2**20, CACHE_IDLE_MIN * 60)
 
 # ╔═══════════════╗
 # VISUAL STYLE FX
 # ╚═══════════════╝
 
-def splash():
+def splash(pronto):
+    """Intestazione e avanzamento finché l'evento pronto non è impostato (e almeno SPLASH_MIN_S)"""
+    inizio = time.monotonic()
     os.system('cls' if os.name == 'nt' else 'clear')
     print(Fore.MAGENTA + "╔" + "═" * 62 + "╗")
     print(Fore.MAGENTA + "║" + Style.BRIGHT + "       🧠 NOTE CLI CALDRAS • Archivio Quantico Digitale       " + Fore.MAGENTA + "║")
     print(Fore.MAGENTA + "╚" + "═" * 62 + "╝" + Style.RESET_ALL)
-    for i in range(3, 0, -1):
-        print(Fore.CYAN + f"→ Inizializzazione modulo in {i}..." + Style.RESET_ALL)
-        time.sleep(0.5)
+    print(Fore.CYAN + "→ Inizializzazione moduli", end="", flush=True)
+    while not pronto.wait(0.5) or time.monotonic() - inizio < SPLASH_MIN_S:
+        print(".", end="", flush=True)
+    print(Style.RESET_ALL)
     print(Fore.GREEN + "✓ Connessione al nodo stabilita. Sistema pronto.\n" + Style.RESET_ALL)
-    time.sleep(0.5)
 
 def access_granted():
     print(Fore.YELLOW + "\nDECODIFICA IN CORSO...")
@@ -67,8 +86,10 @@ def stampa_nota_markdown(titolo, contenuto, protetta=False):
     print(f"{Fore.CYAN}📋 VISUALIZZAZIONE MARKDOWN\n")
     
     # Usa Rich per renderizzare il markdown
+    from rich.console import Console
+    from rich.markdown import Markdown
     md = Markdown(contenuto)
-    console.print(md)
+    Console().print(md)
     print()
 
 def codice_galattico():
@@ -98,10 +119,12 @@ def get_key_from_password(password):
     return base64.urlsafe_b64encode(hashlib.sha256(password.encode()).digest())
 
 def encrypt_text(text, password):
+    from cryptography.fernet import Fernet
     key = get_key_from_password(password)
     return Fernet(key).encrypt(text.encode())
 
 def decrypt_text(ciphertext, password):
+    from cryptography.fernet import Fernet
     key = get_key_from_password(password)
     return Fernet(key).decrypt(ciphertext).decode()
 
@@ -118,7 +141,32 @@ def save_notes(notes):
     with open(NOTE_FILE, "wb") as f:
         pickle.dump(notes, f)
 
-def crea_nota(notes):
+def sblocca(titolo, contenuto, pw, animazione=False):
+    """Testo in chiaro di una nota protetta; la password si chiede solo se non è già sbloccata"""
+    testo = sbloccate.get(contenuto)
+    if testo is not None:
+        return testo
+    inserita = input(f"🔐 Password per '{titolo}': ")
+    if inserita != pw:
+        print(Fore.RED + "❌ Password errata.")
+        return None
+    if animazione:
+        access_granted()
+    testo = decrypt_text(contenuto, pw)
+    sbloccate.put(contenuto, testo)
+    return testo
+
+def sbloccata(nota):
+    """Testo in chiaro di una nota protetta già sbloccata in questa sessione, altrimenti None"""
+    return sbloccate.get(nota[1])
+
+def blocca(indice):
+    """Dimentica tutte le note sbloccate e gli estratti in chiaro"""
+    sbloccate.clear()
+    indice.forget_plaintext()
+    print(Fore.YELLOW + "🔒 Note protette bloccate: la password verrà richiesta di nuovo.")
+
+def crea_nota(notes, indice):
     titolo = input("Titolo: ").strip()
     print("Scrivi la nota (EOF per terminare):")
     righe = []
@@ -135,6 +183,7 @@ def crea_nota(notes):
         notes.append((titolo, contenuto, pw))
     else:
         notes.append((titolo, contenuto, None))
+    indice.add(notes[-1])
     save_notes(notes)
     print(Fore.GREEN + f"✅ Nota '{titolo}' salvata.")
 
@@ -151,21 +200,53 @@ def visualizza_nota(notes):
     elenca_note(notes)
     try:
         i = int(input("Numero della nota da aprire: ")) - 1
+    except ValueError:
+        print(Fore.RED + "⚠️ Errore nella visualizzazione.")
+        return
+    apri_nota(notes, i)
+
+def apri_nota(notes, i):
+    try:
         titolo, contenuto, *resto = notes[i]
         pw = resto[0] if resto else None
         if pw:
-            inserita = input(f"🔐 Password per '{titolo}': ")
-            if inserita != pw:
-                print(Fore.RED + "❌ Password errata.")
+            contenuto = sblocca(titolo, contenuto, pw, animazione=True)
+            if contenuto is None:
                 return
-            access_granted()
-            contenuto = decrypt_text(contenuto, pw)
         
         stampa_nota_cyber(titolo, contenuto, pw is not None)
         
     except:
         print(Fore.RED + "⚠️ Errore nella visualizzazione.")
 
+def apri_per_titolo(notes, indice):
+    """Apre una nota scrivendone il titolo, con completamento (Tab) sui titoli"""
+    def completa(testo, stato):
+        proposte = [notes[indice.position(i)][0] for i in indice.complete(testo, MAX_COMPLETAMENTI)]
+        return proposte[stato] if stato < len(proposte) else None
+    readline.set_completer(completa)
+    readline.set_completer_delims("")
+    readline.parse_and_bind("tab: complete")
+    try:
+        testo = input("📂 Titolo (Tab per completare): ")
+    finally:
+        readline.set_completer(None)
+    trovate = indice.complete(testo, MAX_COMPLETAMENTI)
+    esatte = [i for i in trovate if notes[indice.position(i)][0].strip().casefold() == testo.strip().casefold()]
+    if esatte or len(trovate) == 1:
+        apri_nota(notes, indice.position((esatte or trovate)[0]))
+    elif trovate:
+        print(Fore.CYAN + "\n📌 Titoli che iniziano così:")
+        for note_id in trovate:
+            i = indice.position(note_id)
+            print(f"  {i+1}. {notes[i][0]}")
+        try:
+            apri_nota(notes, int(input("Numero della nota da aprire: ")) - 1)
+        except ValueError:
+            print(Fore.RED + "⚠️ Scelta non valida.")
+    else:
+        print("🔎 Nessun titolo corrispondente.")
+
 def visualizza_nota_markdown(notes):
     """Funzione dedicata per visualizzare sempre in formato markdown"""
     elenca_note(notes)
@@ -174,29 +255,24 @@ def visualizza_nota_markdown(notes):
         titolo, contenuto, *resto = notes[i]
         pw = resto[0] if resto else None
         if pw:
-            inserita = input(f"🔐 Password per '{titolo}': ")
-            if inserita != pw:
-                print(Fore.RED + "❌ Password errata.")
+            contenuto = sblocca(titolo, contenuto, pw, animazione=True)
+            if contenuto is None:
                 return
-            access_granted()
-            contenuto = decrypt_text(contenuto, pw)
         
         stampa_nota_markdown(titolo, contenuto, pw is not None)
     except:
         print(Fore.RED + "⚠️ Errore nella visualizzazione.")
 
-def modifica_nota(notes):
+def modifica_nota(notes, indice):
     elenca_note(notes)
     try:
         i = int(input("Numero della nota da modificare: ")) - 1
         titolo, contenuto, *resto = notes[i]
         pw = resto[0] if resto else None
         if pw:
-            inserita = input(f"🔐 Password per '{titolo}': ")
-            if inserita != pw:
-                print("❌ Password errata.")
+            contenuto = sblocca(titolo, contenuto, pw)
+            if contenuto is None:
                 return
-            contenuto = decrypt_text(contenuto, pw)
         print("Scrivi il nuovo contenuto (EOF per terminare):")
         righe = []
         while True:
@@ -204,16 +280,16 @@ def modifica_nota(notes):
             if r.strip().lower() == "eof":
                 break
             righe.append(r)
-        nuovo_contenuto = "\n".join(righe).strip()
-        if pw:
-            nuovo_contenuto = encrypt_text(nuovo_contenuto, pw)
+        testo = "\n".join(righe).strip()
+        nuovo_contenuto = encrypt_text(testo, pw) if pw else testo
         notes[i] = (titolo, nuovo_contenuto, pw)
+        indice.update(i, notes[i], testo)
         save_notes(notes)
         print(Fore.GREEN + f"✏️ Nota '{titolo}' aggiornata.")
     except:
         print("⚠️ Errore durante la modifica.")
 
-def elimina_nota(notes):
+def elimina_nota(notes, indice):
     elenca_note(notes)
     try:
         i = int(input("Numero della nota da eliminare: ")) - 1
@@ -221,23 +297,22 @@ def elimina_nota(notes):
         conferma = input(f"Eliminare '{titolo}'? (s/n): ").lower()
         if conferma == "s":
             del notes[i]
+            indice.delete(i)
             save_notes(notes)
             print(Fore.RED + f"🗑️ Nota '{titolo}' eliminata.")
     except:
         print("⚠️ Errore durante l'eliminazione.")
 
-def aggiungi_contenuto(notes):
+def aggiungi_contenuto(notes, indice):
     elenca_note(notes)
     try:
         i = int(input("Numero della nota da aggiornare: ")) - 1
         titolo, contenuto, *resto = notes[i]
         pw = resto[0] if resto else None
         if pw:
-            inserita = input(f"🔐 Password per '{titolo}': ")
-            if inserita != pw:
-                print("❌ Password errata.")
+            contenuto = sblocca(titolo, contenuto, pw)
+            if contenuto is None:
                 return
-            contenuto = decrypt_text(contenuto, pw)
         print("Scrivi il contenuto da aggiungere (EOF per terminare):")
         nuove_righe = []
         while True:
@@ -246,10 +321,10 @@ def aggiungi_contenuto(notes):
                 break
             nuove_righe.append(r)
         da_aggiungere = "\n".join(nuove_righe).strip()
-        nuovo = contenuto.strip() + "\n\n" + da_aggiungere
-        if pw:
-            nuovo = encrypt_text(nuovo, pw)
+        testo = contenuto.strip() + "\n\n" + da_aggiungere
+        nuovo = encrypt_text(testo, pw) if pw else testo
         notes[i] = (titolo, nuovo, pw)
+        indice.update(i, notes[i], testo)
         save_notes(notes)
         print(Fore.CYAN + f"📎 Aggiunta alla nota '{titolo}' completata.")
     except:
@@ -262,47 +337,116 @@ def esporta_pdf(notes):
         titolo, contenuto, *resto = notes[i]
         pw = resto[0] if resto else None
         if pw:
-            inserita = input(f"🔐 Password per '{titolo}': ")
-            if inserita != pw:
-                print("❌ Password errata.")
+            contenuto = sblocca(titolo, contenuto, pw, animazione=True)
+            if contenuto is None:
                 return
-            access_granted()
-            contenuto = decrypt_text(contenuto, pw)
         
         # Converti markdown in HTML per il PDF
+        import markdown
+        from weasyprint import HTML
         html_body = markdown.markdown(contenuto)
         html = f"<html><head><style>body{{font-family:sans-serif;padding:2em;}}</style></head><body><h1>{titolo}</h1>{html_body}<hr><p style='font-size:10pt;color:#999;'>🛰️ Sigillo Caldras: C-LDRS.{datetime.datetime.now().strftime('%m%d')}.∞</p></body></html>"
         filename = f"{titolo.replace(' ', '_')}.pdf"
         HTML(string=html).write_pdf(filename)
         print(Fore.GREEN + f"📤 PDF '{filename}' esportato con successo (con rendering markdown).")
+    except ImportError as e:
+        print(Fore.RED + f"⚠️ Esportazione PDF non disponibile: manca il modulo '{e.name}'.")
     except:
         print("⚠️ Errore nell'esportazione.")
 
-def cerca_note(notes):
-    parola = input("🔍 Parola chiave: ").strip().lower()
-    trovate = []
-    for i, (titolo, contenuto, *resto) in enumerate(notes):
-        pw = resto[0] if resto else None
+def cerca_note(notes, indice):
+    parola = input("🔍 Cerca (es. tag:lavoro locked:no modified:>2026-01-01 -bozza, /regex/, \"testo esatto\"): ").strip()
+    if len(parola) > 2 and parola[0] == parola[-1] and parola[0] in '/"' and parola.count('"') <= 2:
+        cerca_righe(notes, indice, parola[1:-1], regex=parola[0] == "/")
+        return
+    piano = []
+    if is_structured(parola):
+        # Query con operatori: il piano parte dall'indice più selettivo
         try:
-            testo = decrypt_text(contenuto, pw) if pw else contenuto
-            if parola in titolo.lower() or parola in testo.lower():
-                trovate.append((i+1, titolo))
-        except:
-            pass
+            trovate, piano = run_query(indice, notes, parola, limit=MAX_RISULTATI)
+        except ValueError as e:
+            print(Fore.RED + f"⚠️ {e}")
+            return
+    else:
+        # Ranking BM25 sull'indice full-text: solo le note più pertinenti
+        trovate = indice.search(parola, k=MAX_RISULTATI)
     if trovate:
-        print(Fore.CYAN + f"\n📌 Trovate {len(trovate)} nota(e):")
-        for idx, t in trovate:
-            print(f"  {idx}. {t}")
+        print(Fore.CYAN + f"\n📌 Le {len(trovate)} nota(e) più pertinenti:")
+        for note_id in trovate:
+            i = indice.position(note_id)
+            print(f"  {i+1}. {notes[i][0]}")
+            # Estratto calcolato solo per i risultati stampati
+            estratto, intervalli = indice.snippet(note_id, notes[i], snippet_query(parola), sbloccata)
+            if estratto:
+                print("     " + evidenzia(estratto, intervalli))
     else:
         print("🔎 Nessun risultato.")
+    if piano:
+        print(Style.DIM + "🧭 Piano: " + " | ".join(piano) + Style.RESET_ALL)
+
+def evidenzia(testo, intervalli):
+    """Testo con gli intervalli (inizio, fine) evidenziati"""
+    parti, pos = [], 0
+    for inizio, fine in intervalli:
+        if inizio < pos:
+            continue
+        parti.append(Style.DIM + testo[pos:inizio] + Style.RESET_ALL)
+        parti.append(Fore.YELLOW + Style.BRIGHT + testo[inizio:fine] + Style.RESET_ALL)
+        pos = fine
+    parti.append(Style.DIM + testo[pos:] + Style.RESET_ALL)
+    return "".join(parti)
+
+def cerca_righe(notes, indice, pattern, regex=True):
+    """Ricerca stile grep: stampa le righe man mano che vengono trovate"""
+    trovate = 0
+    try:
+        for hit in indice.grep(notes, pattern, regex=regex, limit=MAX_RIGHE, unlocked=sbloccata):
+            if trovate == 0:
+                print(Fore.CYAN + "\n📌 Righe trovate:")
+            trovate += 1
+            i = indice.position(hit.note_id)
+            print(f"  {i+1}. {notes[i][0]} {Fore.YELLOW}:{hit.line_no}{Style.RESET_ALL}  {hit.line.strip()}")
+    except re.error as e:
+        print(Fore.RED + f"⚠️ Espressione regolare non valida: {e}")
+        return
+    if trovate == 0:
+        print("🔎 Nessun risultato.")
+    elif trovate == MAX_RIGHE:
+        print(Fore.YELLOW + f"… interrotto dopo {MAX_RIGHE} righe.")
+
+def filtra_tag(notes, indice):
+    conteggi = indice.tag_counts()
+    if conteggi:
+        print(Fore.CYAN + "\n🏷️ Tag disponibili:")
+        print("  " + "  ".join(f"#{t} ({n})" for t, n in conteggi[:MAX_TAG]))
+    tags = input("Tag da combinare (es. #lavoro #idee): ").replace(",", " ").split()
+    if not tags:
+        return
+    trovate = indice.notes_with_tags(tags)
+    if trovate:
+        print(Fore.CYAN + f"\n📌 {len(trovate)} nota(e) con {' '.join(tags)}:")
+        for note_id in trovate:
+            i = indice.position(note_id)
+            print(f"  {i+1}. {notes[i][0]}")
+    else:
+        print("🔎 Nessuna nota con questi tag.")
 
 # ╔════════════════════════╗
 # MENU PRINCIPALE INTERATTIVO
 # ╚════════════════════════╝
 
-def menu():
+def carica_archivio():
     notes = load_notes()
-    splash()
+    # L'indice salvato si apre senza ricostruirlo (mmap); se manca si crea da zero
+    indice = SearchIndex.open(INDEX_FILE, notes, vault_stamp(NOTE_FILE),
+                              decrypt=decrypt_text, encrypt=encrypt_text)
+    return notes, indice
+
+def menu():
+    # Note e indice si caricano mentre lo splash è a schermo
+    caricamento = BackgroundLoad(carica_archivio)
+    splash(caricamento.done)
+    notes, indice = caricamento.result()
     while True:
         print(Fore.MAGENTA + "\n╔═ NOTE CLI CALDRAS — Menu ─═══════════════════╗")
         print("  1. Crea nuova nota")
@@ -314,32 +458,43 @@ def menu():
         print("  7. Aggiungi contenuto a una nota")
         print("  8. Visualizza nota in Markdown")
         print("  9. Esci")
+        print(" 10. Filtra per tag")
+        print(" 11. Apri per titolo")
+        print(" 12. Blocca le note protette")
         print("╚══════════════════════════════════════════════╝")
         scelta = input(">>> ").strip()
         if scelta.lower() == "::caldras":
             codice_galattico()
         elif scelta == "1":
-            crea_nota(notes)
+            crea_nota(notes, indice)
         elif scelta == "2":
             visualizza_nota(notes)
         elif scelta == "3":
-            modifica_nota(notes)
+            modifica_nota(notes, indice)
         elif scelta == "4":
-            elimina_nota(notes)
+            elimina_nota(notes, indice)
         elif scelta == "5":
             esporta_pdf(notes)
         elif scelta == "6":
-            cerca_note(notes)
+            cerca_note(notes, indice)
         elif scelta == "7":
-            aggiungi_contenuto(notes)
+            aggiungi_contenuto(notes, indice)
         elif scelta == "8":
             visualizza_nota_markdown(notes)
         elif scelta == "9":
+            indice.save(INDEX_FILE, notes, vault_stamp(NOTE_FILE))
             print(Fore.YELLOW + "👋 Uscita. Alla prossima.")
             break
+        elif scelta == "10":
+            filtra_tag(notes, indice)
+        elif scelta == "11":
+            apri_per_titolo(notes, indice)
+        elif scelta == "12":
+            blocca(indice)
         else:
             print(Fore.RED + "⚠️ Scelta non valida.")
 
 # PUNTO DI INGRESSO
 if __name__ == "__main__":
+    colori()
     menu()
\ No newline at end of file
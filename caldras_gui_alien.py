@@ -1,19 +1,14 @@
 #!/usr/bin/env python3
 import tkinter as tk
 from tkinter import messagebox, simpledialog, filedialog
-import pickle, os, base64, hashlib, markdown, json, tempfile, subprocess
-from cryptography.fernet import Fernet
-
-# 🛰️ Supporto PDF automatico
-try:
-    from weasyprint import HTML
-    PDF_ENGINE = "weasyprint"
-except ImportError:
-    PDF_ENGINE = "wkhtmltopdf"
+import pickle, os, base64, hashlib, json, tempfile, subprocess, threading, queue
+# cryptography, markdown e weasyprint si importano al primo uso
 
 CONFIG_FILE = ".caldras.conf"
 NOTE_FILE = ".note.dat"
 FONT_CONSOLE = ("Cascadia Code", 11)
+PREVIEW_DEBOUNCE_MS = 150
+PREVIEW_POLL_MS = 20
 
 def load_config():
     if os.path.exists(CONFIG_FILE):
@@ -29,9 +24,11 @@ def get_key(password):
     return base64.urlsafe_b64encode(hashlib.sha256(password.encode()).digest())
 
 def encrypt_text(text, password):
+    from cryptography.fernet import Fernet
     return Fernet(get_key(password)).encrypt(text.encode())
 
 def decrypt_text(ciphertext, password):
+    from cryptography.fernet import Fernet
     return Fernet(get_key(password)).decrypt(ciphertext).decode()
 
 def load_notes():
@@ -46,6 +43,7 @@ def save_notes(notes):
         pickle.dump(notes, f)
 
 def generate_pdf(content_md, filename):
+    import markdown
     html_body = markdown.markdown(content_md)
     style = """
     <meta charset="utf-8">
@@ -55,8 +53,13 @@ def generate_pdf(content_md, filename):
     </style>
     """
     full_html = f"<html><head>{style}</head><body>{html_body}</body></html>"
+    # 🛰️ Supporto PDF automatico
+    try:
+        from weasyprint import HTML
+    except ImportError:
+        HTML = None
     try:
-        if PDF_ENGINE == "weasyprint" and HTML:
+        if HTML:
             HTML(string=full_html).write_pdf(filename)
             return True, "WeasyPrint"
         else:
@@ -99,6 +102,14 @@ class CaldrasApp(tk.Tk):
         self.notes = load_notes()
         self.current_index = None
 
+        # Anteprima: markdown convertito in un thread, risultato applicato nel mainloop
+        self.preview_job = None
+        self.preview_seq = self.preview_done = 0
+        self.preview_polling = False
+        self.preview_requests = queue.Queue()
+        self.preview_results = queue.Queue()
+        threading.Thread(target=self.preview_worker, daemon=True).start()
+
         self.setup_ui()
         self.apply_theme()
         self.refresh_list()
@@ -133,6 +144,7 @@ class CaldrasApp(tk.Tk):
                                  bg="#16232f", fg="#c6f6ff", insertbackground="#76f6ff",
                                  relief=tk.FLAT)
         pane_editor.add(self.text_area)
+        self.text_area.bind("<KeyRelease>", self.schedule_preview)
 
         self.preview = tk.Text(pane_editor, wrap=tk.WORD, state=tk.DISABLED,
                                font=FONT_CONSOLE, bg="#16232f", fg="#c6f6ff",
@@ -191,15 +203,66 @@ class CaldrasApp(tk.Tk):
         bg = "#16232f" if self.theme == "alien-dark" else "#ffffff"
         event.widget.configure(bg=bg, fg=fg)
 
+    def schedule_preview(self, event=None):
+        # Tasti ravvicinati: una sola conversione dopo la pausa di digitazione
+        if self.preview_job is not None:
+            self.after_cancel(self.preview_job)
+        self.preview_job = self.after(PREVIEW_DEBOUNCE_MS, self.update_preview)
+
     def update_preview(self, event=None):
-        md = self.text_area.get("1.0", tk.END)
-        html = markdown.markdown(md)
-        clean = self.clean_html(html)
+        # Il markdown si converte nel thread dell'anteprima, il widget si aggiorna qui
+        if self.preview_job is not None:
+            self.after_cancel(self.preview_job)
+            self.preview_job = None
+        self.preview_seq += 1
+        self.preview_requests.put((self.preview_seq, self.text_area.get("1.0", tk.END)))
+        if not self.preview_polling:
+            self.preview_polling = True
+            self.after(PREVIEW_POLL_MS, self.poll_preview)
+
+    def preview_worker(self):
+        while True:
+            seq, md = self.preview_requests.get()
+            # Delle richieste accumulate conta solo l'ultima
+            while not self.preview_requests.empty():
+                seq, md = self.preview_requests.get_nowait()
+            if seq != self.preview_seq:
+                continue
+            try:
+                import markdown
+                clean = self.clean_html(markdown.markdown(md))
+            except Exception:
+                clean = None
+            self.preview_results.put((seq, clean))
+
+    def poll_preview(self):
+        while not self.preview_results.empty():
+            seq, clean = self.preview_results.get_nowait()
+            # Le conversioni superate da un testo più recente si scartano
+            if seq == self.preview_seq:
+                self.preview_done = seq
+                if clean is not None:
+                    self.show_preview(clean)
+        if self.preview_done < self.preview_seq:
+            self.after(PREVIEW_POLL_MS, self.poll_preview)
+        else:
+            self.preview_polling = False
+
+    def show_preview(self, clean):
         self.preview.configure(state=tk.NORMAL)
         self.preview.delete("1.0", tk.END)
         self.preview.insert(tk.END, clean)
         self.preview.configure(state=tk.DISABLED)
 
+    def clear_preview(self):
+        # Anche una conversione ancora in corso non deve più comparire
+        if self.preview_job is not None:
+            self.after_cancel(self.preview_job)
+            self.preview_job = None
+        self.preview_seq += 1
+        self.preview_done = self.preview_seq
+        self.show_preview("")
+
     def clean_html(self, html):
         import re
         return re.sub(r"<[^>]+>", "", html)
@@ -250,9 +313,7 @@ class CaldrasApp(tk.Tk):
             if pw != password:
                 messagebox.showerror("Errore", "Password errata.")
                 self.text_area.delete("1.0", tk.END)
-                self.preview.configure(state=tk.NORMAL)
-                self.preview.delete("1.0", tk.END)
-                self.preview.configure(state=tk.DISABLED)
+                self.clear_preview()
                 return
             try: contenuto = decrypt_text(contenuto, password)
             except: contenuto = ""
@@ -280,9 +341,7 @@ class CaldrasApp(tk.Tk):
                 del self.notes[self.current_index]
                 save_notes(self.notes)
                 self.text_area.delete("1.0", tk.END)
-                self.preview.configure(state=tk.NORMAL)
-                self.preview.delete("1.0", tk.END)
-                self.preview.configure(state=tk.DISABLED)
+                self.clear_preview()
                 self.refresh_list()
                 self.current_index = None
 
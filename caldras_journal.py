@@ -0,0 +1,109 @@
+"""Diario delle modifiche non salvate: piccoli diff accodati a un file, da riapplicare dopo un crash.
+
+Ogni record è la differenza tra due stati del testo di una nota (prefisso e
+suffisso in comune più il testo inserito) insieme all'impronta del testo a
+cui va applicata. Per le note protette il diff è cifrato con la password
+della nota. Al riavvio i diff si riapplicano in ordine partendo dal testo
+salvato: un diff vale solo se l'impronta corrisponde, quindi quelli già
+assorbiti da un salvataggio vengono saltati.
+"""
+import hashlib
+import json
+import os
+import pickle
+import struct
+
+LENGTH = struct.Struct("<I")
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+# ╔══════════════════╗
+# DIFF DI UNA MODIFICA
+# ╚══════════════════╝
+
+def _common_prefix(a, b):
+    # Ricerca binaria su confronti di slice: resta in C anche con testi di megabyte
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def _common_suffix(a, b, limit):
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def make_diff(old, new):
+    """(prefisso, suffisso, testo inserito) che trasforma old in new"""
+    prefix = _common_prefix(old, new)
+    suffix = _common_suffix(old, new, min(len(old), len(new)) - prefix)
+    return prefix, suffix, new[prefix:len(new) - suffix]
+
+def apply_diff(text, diff):
+    prefix, suffix, inserted = diff
+    return text[:prefix] + inserted + text[len(text) - suffix:]
+
+# ╔═══════════════════╗
+# SCRITTURA E LETTURA
+# ╚═══════════════════╝
+
+def encode_record(note_id, title, before, diff, encrypt=None):
+    """Record pronto da accodare; con encrypt(testo) il diff viene cifrato"""
+    payload = json.dumps([text_hash(before), *diff])
+    payload = encrypt(payload) if encrypt else payload.encode("utf-8")
+    data = pickle.dumps((note_id, title, encrypt is not None, payload))
+    return LENGTH.pack(len(data)) + data
+
+def append_record(path, record):
+    """Accoda un record e lo porta su disco: sopravvive anche a un crash della macchina"""
+    with open(path, "ab") as f:
+        f.write(record)
+        f.flush()
+        os.fsync(f.fileno())
+
+def clear_journal(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def read_journal(path):
+    """Record (id, titolo, protetto, diff) in ordine; un record troncato chiude la lettura"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return []
+    records, pos = [], 0
+    while pos + LENGTH.size <= len(data):
+        (size,) = LENGTH.unpack_from(data, pos)
+        pos += LENGTH.size
+        if pos + size > len(data):
+            break
+        try:
+            records.append(pickle.loads(data[pos:pos + size]))
+        except Exception:
+            break
+        pos += size
+    return records
+
+def replay(text, payloads, decode):
+    """Riapplica i diff al testo salvato; decode(diff) restituisce il JSON del diff in chiaro"""
+    for payload in payloads:
+        try:
+            before, *diff = json.loads(decode(payload))
+        except Exception:
+            continue    # cifrato con un'altra password o illeggibile
+        if text_hash(text) == before:
+            text = apply_diff(text, diff)
+    return text
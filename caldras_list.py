@@ -0,0 +1,133 @@
+"""Elenco virtuale delle note: il Listbox contiene solo le righe visibili di un array di id."""
+import tkinter.font as tkfont
+from difflib import SequenceMatcher
+
+class VirtualList:
+    """Listbox che mostra una finestra scorrevole su un elenco di id anche molto lungo.
+
+    Il widget ha sempre al massimo tante righe quante ne entrano: scorrendo o
+    cambiando elenco si confrontano le righe mostrate con quelle nuove e si
+    cancellano o inseriscono solo le differenze. label(id) viene chiamata
+    solo per le righe visibili; la selezione è tenuta per id.
+    """
+
+    def __init__(self, listbox, scrollbar, label):
+        self.listbox = listbox
+        self.scrollbar = scrollbar
+        self.label = label
+        self.ids = []           # tutti gli id dell'elenco, nell'ordine mostrato
+        self.top = 0            # posizione dell'id nella prima riga
+        self.rows = 1           # righe che entrano nel widget
+        self.shown = []         # (id, etichetta) delle righe nel widget
+        self.selected = None    # id selezionato, anche se fuori vista
+        scrollbar.configure(command=self.yview)
+        listbox.configure(yscrollcommand="", height=1)
+        listbox.bind("<Configure>", self._on_configure)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            listbox.bind(sequence, self._on_wheel)
+        listbox.bind("<Up>", lambda e: self._step(-1))
+        listbox.bind("<Down>", lambda e: self._step(1))
+        listbox.bind("<Prior>", lambda e: self._step(-self.rows))
+        listbox.bind("<Next>", lambda e: self._step(self.rows))
+
+    # ── elenco e finestra ──
+    def set_ids(self, ids, top=0):
+        """Nuovo elenco a partire dalla posizione top (di norma la cima): si aggiornano solo le righe cambiate"""
+        self.ids = ids
+        self.top = top
+        self.redraw()
+
+    def redraw(self):
+        """Allinea il widget alla finestra [top, top + rows) dell'elenco"""
+        self.top = max(0, min(self.top, len(self.ids) - self.rows))
+        wanted = [(i, self.label(i)) for i in self.ids[self.top:self.top + self.rows]]
+        if wanted != self.shown:
+            matcher = SequenceMatcher(None, self.shown, wanted, autojunk=False)
+            # Dal fondo: gli indici delle righe precedenti restano validi
+            for op, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+                if op == "equal":
+                    continue
+                if i2 > i1:
+                    self.listbox.delete(i1, i2 - 1)
+                if j2 > j1:
+                    self.listbox.insert(i1, *(text for _, text in wanted[j1:j2]))
+            self.shown = wanted
+        self.listbox.selection_clear(0, "end")
+        row = self.row_of(self.selected)
+        if row is not None:
+            self.listbox.selection_set(row)
+            self.listbox.activate(row)
+        if self.ids:
+            self.scrollbar.set(self.top / len(self.ids),
+                               min(self.top + self.rows, len(self.ids)) / len(self.ids))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def row_of(self, note_id):
+        """Riga del widget che mostra l'id, o None se non è visibile"""
+        for row, (i, _) in enumerate(self.shown):
+            if i == note_id:
+                return row
+        return None
+
+    def see(self, k):
+        """Scorre quanto basta perché la posizione k sia visibile"""
+        if k < self.top:
+            self.top = k
+        elif k >= self.top + self.rows:
+            self.top = k - self.rows + 1
+        self.redraw()
+
+    # ── posizioni ──
+    def index(self, row):
+        """Posizione nell'elenco della riga row del widget"""
+        return self.top + row
+
+    def nearest(self, y):
+        return self.top + self.listbox.nearest(y)
+
+    def selection(self):
+        """Posizione nell'elenco della riga selezionata nel widget, o None"""
+        sel = self.listbox.curselection()
+        if not sel:
+            return None
+        k = self.index(sel[0])
+        self.selected = self.ids[k] if k < len(self.ids) else None
+        return k if self.selected is not None else None
+
+    # ── scorrimento ──
+    def yview(self, *args):
+        """Comando della scrollbar: moveto FRAZIONE o scroll N units/pages"""
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.ids))
+        elif args[0] == "scroll":
+            step = self.rows if args[2] == "pages" else 1
+            self.top += int(args[1]) * step
+        self.redraw()
+
+    def _on_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.yview("scroll", -3, "units")
+        else:
+            self.yview("scroll", 3, "units")
+        return "break"
+
+    def _step(self, delta):
+        """Frecce e pagine: sposta la selezione e scorre se esce dalla vista"""
+        if not self.ids:
+            return "break"
+        row = self.row_of(self.selected)
+        current = self.top + row if row is not None else self.top - 1
+        k = max(0, min(current + delta, len(self.ids) - 1))
+        self.selected = self.ids[k]
+        self.see(k)
+        self.listbox.event_generate("<<ListboxSelect>>")
+        return "break"
+
+    def _on_configure(self, event):
+        linespace = tkfont.Font(font=self.listbox.cget("font")).metrics("linespace")
+        pad = 2 * (int(self.listbox.cget("borderwidth")) + int(self.listbox.cget("highlightthickness")))
+        rows = max(1, (event.height - pad) // (linespace + 1 + 2 * int(self.listbox.cget("selectborderwidth"))))
+        if rows != self.rows:
+            self.rows = rows
+            self.redraw()
@@ -0,0 +1,273 @@
+"""Anteprima markdown incrementale: il documento è diviso in blocchi e si riscrivono solo quelli cambiati."""
+import re
+from bisect import bisect_right
+from collections import namedtuple
+from difflib import SequenceMatcher
+from itertools import accumulate, chain
+
+# Mark di Tk che segue l'ultimo blocco dell'anteprima
+END_MARK = "preview_end"
+# Righe del sorgente disegnate sopra e sotto la parte visibile dell'editor
+MARGIN_LINES = 150
+
+# Disegna in Tcl una serie di blocchi consecutivi: una sola chiamata da Python
+# invece di cinque per blocco. items alterna mark di inizio e argomenti di insert
+DRAW_PROC = """
+proc caldras_preview_draw {w before items} {
+    foreach {mark runs} $items {
+        set start [$w index $before]
+        if {[llength $runs]} { $w insert $before {*}$runs }
+        # Un blocco deve occupare almeno un carattere, o i mark si sovrapporrebbero
+        if {[$w compare $before == $start]} { $w insert $before "\n" }
+        $w mark set $mark $start
+        $w mark gravity $mark right
+    }
+}
+"""
+
+# ╔═══════════════════╗
+# DIVISIONE IN BLOCCHI
+# ╚═══════════════════╝
+
+def split_blocks(text):
+    """Blocchi che si disegnano da soli: paragrafi, titoli, righe vuote e blocchi ``` interi"""
+    blocks, current, fence = [], [], False
+    for line in text.split("\n"):
+        if fence:
+            current.append(line)
+            if line.startswith("```"):
+                blocks.append("\n".join(current))
+                current, fence = [], False
+        elif line.startswith("```"):
+            if current:
+                blocks.append("\n".join(current))
+            current, fence = [line], True
+        elif not line.strip() or line.startswith("#"):
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            blocks.append(line)
+        else:
+            current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+# ╔═════════════════════════════╗
+# MARKDOWN → SEGMENTI (TESTO, TAG)
+# ╚═════════════════════════════╝
+
+HEADINGS = (("### ", "h3"), ("## ", "h2"), ("# ", "h1"))
+BULLET_RE = re.compile(r"(\s*)[-*+]\s(.*)")
+NUMBER_RE = re.compile(r"(\s*)(\d+)\.\s(.*)")
+# Codice inline, grassetto+corsivo, grassetto, corsivo: un'unica scansione per riga
+INLINE_RE = re.compile(r"`([^`]+)`|\*\*\*([^`]+?)\*\*\*|\*\*([^`]+?)\*\*|\*([^`]+?)\*")
+INLINE_TAGS = (None, ("code",), ("bold", "italic"), ("bold",), ("italic",))
+CODE = ("code",)
+PLAIN = ()
+
+def _inline(text, runs):
+    pos = 0
+    for m in INLINE_RE.finditer(text):
+        if m.start() > pos:
+            runs.append((text[pos:m.start()], PLAIN))
+        runs.append((m.group(m.lastindex), INLINE_TAGS[m.lastindex]))
+        pos = m.end()
+    if pos < len(text):
+        runs.append((text[pos:], PLAIN))
+
+def render_runs(block):
+    """Segmenti (testo, tag) di un blocco, in un solo passaggio sulle righe.
+
+    Lo stato dei blocchi ``` è locale: non passa da un'anteprima all'altra.
+    """
+    runs = []
+    code = False
+    for line in block.split("\n"):
+        if line.startswith("```"):
+            if code:
+                runs.append(("\n", PLAIN))
+            elif line[3:].strip():
+                runs.append((f"[{line[3:].strip()}]\n", CODE))
+            code = not code
+        elif code:
+            runs.append((line + "\n", CODE))
+        elif line.startswith(("# ", "## ", "### ")):
+            for prefix, tag in HEADINGS:
+                if line.startswith(prefix):
+                    runs.append((line[len(prefix):] + "\n", (tag,)))
+                    break
+        elif line.startswith("> "):
+            runs.append(("❯ " + line[2:] + "\n", ("blockquote",)))
+        elif not line.strip():
+            runs.append(("\n", PLAIN))
+        else:
+            m = BULLET_RE.match(line)
+            if m:
+                runs.append(("  " * (len(m.group(1)) // 2) + "• ", PLAIN))
+                _inline(m.group(2) + "\n", runs)
+                continue
+            m = NUMBER_RE.fullmatch(line)
+            if m:
+                runs.append((f"{'  ' * (len(m.group(1)) // 2)}{m.group(2)}. ", PLAIN))
+                _inline(m.group(3) + "\n", runs)
+            else:
+                _inline(line + "\n", runs)
+    # Segmenti vicini con gli stessi tag diventano uno solo
+    merged = []
+    for text, tags in runs:
+        if merged and merged[-1][1] == tags:
+            merged[-1] = (merged[-1][0] + text, tags)
+        else:
+            merged.append((text, tags))
+    return merged
+
+def insert_args(runs):
+    """Argomenti per un unico Text.insert(indice, testo, tag, testo, tag, ...)"""
+    return list(chain.from_iterable(runs))
+
+# ╔══════════════════════════════╗
+# PIANO DI RENDERING (FUORI DA TK)
+# ╚══════════════════════════════╝
+
+# Tutto ciò che serve per disegnare: blocchi, righe d'inizio e segmenti già pronti per hash
+RenderPlan = namedtuple("RenderPlan", "text blocks starts runs")
+
+def block_starts(blocks):
+    """Riga del sorgente (da 1) in cui inizia ciascun blocco"""
+    return [1, *accumulate(b.count("\n") + 1 for b in blocks)][:-1]
+
+def window_range(starts, window):
+    """Blocchi [lo, hi) che coprono le righe della finestra più MARGIN_LINES"""
+    if window is None:
+        return 0, len(starts)
+    first, last = window
+    lo = max(bisect_right(starts, first - MARGIN_LINES) - 1, 0)
+    return lo, bisect_right(starts, last + MARGIN_LINES)
+
+def plan_preview(text, window=None, cancel=None):
+    """Divide e converte i blocchi della finestra senza toccare il widget (adatto a un thread).
+
+    Restituisce None se cancel viene impostato nel frattempo.
+    """
+    blocks = split_blocks(text)
+    starts = block_starts(blocks)
+    lo, hi = window_range(starts, window)
+    runs = {}
+    for n, block in enumerate(blocks[lo:hi]):
+        if n % 64 == 0 and cancel is not None and cancel.is_set():
+            return None
+        runs[hash(block)] = render_runs(block)
+    return RenderPlan(text, blocks, starts, runs)
+
+# ╔═══════════════════════════╗
+# AGGIORNAMENTO DEL WIDGET TEXT
+# ╚═══════════════════════════╝
+
+class BlockPreview:
+    """Tiene un widget Text allineato al markdown, blocco per blocco.
+
+    Ogni blocco disegnato inizia a un mark con gravità a destra: il testo
+    inserito in quel punto finisce prima del mark, quindi un blocco nuovo
+    si scrive sempre davanti al mark del blocco che lo segue. A ogni
+    aggiornamento gli hash dei blocchi si confrontano con quelli già
+    disegnati e solo i blocchi cambiati vengono cancellati e riscritti.
+
+    Con una finestra (prima, ultima riga visibile dell'editor) si disegnano
+    solo i blocchi in quelle righe più MARGIN_LINES sopra e sotto: il widget
+    resta piccolo qualunque sia la lunghezza della nota.
+    """
+
+    def __init__(self, widget):
+        self.widget = widget
+        self.parsed = {}        # segmenti già calcolati da un RenderPlan, per hash del blocco
+        self.text = None        # ultimo markdown ricevuto
+        self.blocks = []        # tutti i blocchi del markdown
+        self.starts = []        # riga del sorgente (da 1) in cui inizia ciascun blocco
+        self.first = 0          # indice del primo blocco disegnato
+        self.keys = []          # hash dei blocchi disegnati
+        self.marks = []         # mark di inizio di ciascun blocco disegnato
+        self._serial = 0
+        widget.tk.eval(DRAW_PROC)
+        self._set_end()
+
+    def _set_end(self):
+        self.widget.mark_set(END_MARK, "end-1c")
+        self.widget.mark_gravity(END_MARK, "right")
+
+    def _start(self, i):
+        return self.marks[i] if i < len(self.marks) else END_MARK
+
+    def apply(self, plan, window=None):
+        """Ridisegna i blocchi del piano (da plan_preview) diversi da quelli a schermo; restituisce quanti"""
+        self.text, self.blocks, self.starts = plan.text, plan.blocks, plan.starts
+        # I segmenti convertiti in seguito (scorrendo) si aggiungono al piano
+        self.parsed = plan.runs
+        return self.show(window)
+
+    def runs(self, block):
+        """Segmenti del blocco: dal piano se già pronti, altrimenti convertiti ora"""
+        key = hash(block)
+        runs = self.parsed.get(key)
+        if runs is None:
+            runs = self.parsed[key] = render_runs(block)
+        return runs
+
+    def show(self, window=None):
+        """Disegna i blocchi della finestra (tutti se window è None) con lo stesso testo"""
+        lo_block, hi_block = window_range(self.starts, window)
+        blocks = self.blocks[lo_block:hi_block]
+        keys = [hash(b) for b in blocks]
+        old = self.keys
+        self.first = lo_block
+        if keys == old:
+            return 0
+        # Prefisso e suffisso comuni: di norma cambia solo il blocco in cui si scrive
+        lo, limit = 0, min(len(old), len(keys))
+        while lo < limit and old[lo] == keys[lo]:
+            lo += 1
+        old_hi, new_hi = len(old), len(keys)
+        while old_hi > lo and new_hi > lo and old[old_hi - 1] == keys[new_hi - 1]:
+            old_hi -= 1
+            new_hi -= 1
+
+        marks = self.marks[:lo]
+        redrawn = 0
+        matcher = SequenceMatcher(None, old[lo:old_hi], keys[lo:new_hi], autojunk=False)
+        for op, i1, i2, j1, j2 in matcher.get_opcodes():
+            i1, i2, j1, j2 = i1 + lo, i2 + lo, j1 + lo, j2 + lo
+            if op == "equal":
+                marks.extend(self.marks[i1:i2])
+                continue
+            if i2 > i1:
+                self.widget.delete(self.marks[i1], self._start(i2))
+                for mark in self.marks[i1:i2]:
+                    self.widget.mark_unset(mark)
+            if j2 > j1:
+                marks.extend(self._draw(blocks[j1:j2], self._start(i2)))
+                redrawn += j2 - j1
+        marks.extend(self.marks[old_hi:])
+        self.keys, self.marks = keys, marks
+        return redrawn
+
+    def index_of(self, line):
+        """Indice del widget che corrisponde alla riga line del sorgente"""
+        if not self.marks:
+            return "1.0"
+        j = bisect_right(self.starts, line) - 1
+        j = min(max(j, self.first), self.first + len(self.marks) - 1)
+        return f"{self.marks[j - self.first]} + {max(line - self.starts[j], 0)} lines"
+
+    def _draw(self, blocks, before):
+        """Scrive i blocchi davanti al mark before e restituisce i loro mark di inizio.
+
+        Un insert per blocco, ma tutti nella stessa chiamata a Tcl (DRAW_PROC).
+        """
+        marks, items = [], []
+        for block in blocks:
+            self._serial += 1
+            mark = f"preview_block{self._serial}"
+            marks.append(mark)
+            items += (mark, insert_args(self.runs(block)))
+        self.widget.tk.call("caldras_preview_draw", self.widget._w, before, items)
+        return marks
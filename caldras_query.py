@@ -0,0 +1,313 @@
+"""Ricerca strutturata: tag:, locked:, modified:, title:, "frase esatta" ed esclusioni (-).
+
+Esempio: tag:lavoro locked:no modified:>2026-01-01 "frase esatta" -bozza
+
+Il piano parte dalla condizione più selettiva, interseca le liste degli
+indici e legge il testo delle note (decifrandolo se serve) solo per
+verificare le frasi esatte sui candidati rimasti.
+"""
+import datetime
+import re
+import time
+from collections import namedtuple
+
+from caldras_search import cancelled, inner_trigrams, normalize, tokenize, trigrams
+
+Clause = namedtuple("Clause", "kind value negate text")
+
+FIELDS = ("tag", "locked", "modified", "title")
+YES = ("yes", "si", "sì", "true", "1")
+NO = ("no", "false", "0")
+FOREVER = 2 ** 62
+
+TOKEN_RE = re.compile(r'(-?)(?:(\w+):)?(?:"([^"]*)"?|(\S+))')
+
+# ╔═════════════════╗
+# ANALISI DELLA QUERY
+# ╚═════════════════╝
+
+def _day(text):
+    """Mezzanotte (ora locale) del giorno AAAA-MM-GG, in secondi"""
+    try:
+        day = datetime.date.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"data non valida: '{text}' (usa AAAA-MM-GG)") from None
+    return int(time.mktime(day.timetuple())), int(time.mktime((day + datetime.timedelta(days=1)).timetuple()))
+
+def parse_range(value):
+    """Intervallo [inizio, fine) per >DATA, >=DATA, <DATA, <=DATA, DATA o DATA..DATA"""
+    if ".." in value:
+        first, last = value.split("..", 1)
+        return (_day(first)[0] if first else 0, _day(last)[1] if last else FOREVER)
+    for op in (">=", "<=", ">", "<", "="):
+        if value.startswith(op):
+            value = value[len(op):]
+            break
+    else:
+        op = "="
+    start, end = _day(value)
+    return {">": (end, FOREVER), ">=": (start, FOREVER), "<": (0, start),
+            "<=": (0, end), "=": (start, end)}[op]
+
+def parse(query):
+    """Clausole della query; solleva ValueError per valori non validi"""
+    clauses = []
+    for m in TOKEN_RE.finditer(query):
+        neg, field, phrase, word = m.groups()
+        negate, text = bool(neg), m.group(0)
+        field = field.lower() if field else None
+        if field is not None and field not in FIELDS:
+            # "http://..." e simili restano testo libero
+            field, word, phrase = None, m.group(0)[len(neg):], None
+        if field is None and phrase is not None:
+            if tokenize(phrase):
+                clauses.append(Clause("phrase", tuple(tokenize(phrase)), negate, text))
+            continue
+        value = phrase if phrase is not None else word
+        if field == "tag" or (field is None and value.startswith("#") and len(value) > 1):
+            clauses.append(Clause("tag", normalize(value.lstrip("#")), negate, text))
+        elif field == "locked":
+            if value.lower() not in YES + NO:
+                raise ValueError(f"locked: accetta yes/no, non '{value}'")
+            clauses.append(Clause("locked", value.lower() in YES, negate, text))
+        elif field == "modified":
+            clauses.append(Clause("modified", parse_range(value), negate, text))
+        elif field == "title":
+            if normalize(value).strip():
+                clauses.append(Clause("title", normalize(value).strip(), negate, text))
+        else:
+            clauses += [Clause("term", term, negate, text) for term in tokenize(value)]
+    # L'ultima parola, se la si sta ancora scrivendo, vale come prefisso
+    if clauses and clauses[-1].kind == "term" and not clauses[-1].negate and not query[-1:].isspace():
+        clauses[-1] = clauses[-1]._replace(kind="prefix")
+    return clauses
+
+def is_structured(query):
+    """True se la query usa operatori: altrimenti basta la ricerca semplice"""
+    try:
+        clauses = parse(query)
+    except ValueError:
+        return True
+    return any(c.negate or c.kind not in ("term", "prefix") for c in clauses)
+
+# ╔═════════════════════════╗
+# PIANIFICAZIONE ED ESECUZIONE
+# ╚═════════════════════════╝
+
+def _describe(clause):
+    return ("-" if clause.negate else "") + clause.text.lstrip("-")
+
+def _estimate(index, clause):
+    """Numero (stimato) di note che soddisfano la clausola"""
+    kind, value = clause.kind, clause.value
+    if kind == "tag":
+        return len(index.tags.notes_with([value]))
+    if kind == "term":
+        return index.fulltext.df(value)
+    if kind == "prefix":
+        return sum(index.fulltext.df(t) for t in index.fulltext.expand_prefix(value))
+    if kind == "phrase":
+        return min(index.fulltext.df(t) for t in value)
+    if kind == "title":
+        return index.titles.gram_df(value)
+    if kind == "modified":
+        return index.dates.count(*value)
+    if kind == "locked":
+        return len(index.locked) if value else len(index.ids) - len(index.locked)
+
+def _fetch(index, clause):
+    """Id che soddisfano la clausola, letti dall'indice adatto"""
+    kind, value = clause.kind, clause.value
+    if kind == "tag":
+        return set(index.tags.notes_with([value])), "indice dei tag"
+    if kind == "term":
+        return index.fulltext.doc_ids(value), "indice full-text"
+    if kind == "prefix":
+        ids = set()
+        for term in index.fulltext.expand_prefix(value):
+            ids |= index.fulltext.doc_ids(term)
+        return ids, "indice full-text (prefisso)"
+    if kind == "phrase":
+        # Candidati: note con tutte le parole; la frase si verifica dopo sul testo
+        lists = sorted((index.fulltext.doc_ids(t) for t in value), key=len)
+        return set.intersection(*lists), "indice full-text (candidati)"
+    if kind == "title":
+        return index.titles.containing(value), "indice a trigrammi dei titoli"
+    if kind == "modified":
+        return index.dates.between(*value), "indice delle date"
+    if kind == "locked":
+        if value:
+            return set(index.locked), "elenco delle note protette"
+        return set(index.ids) - index.locked, "elenco delle note protette"
+
+def _test(index, clause, note_id):
+    """Verifica la clausola su una sola nota, senza leggere il testo"""
+    kind, value = clause.kind, clause.value
+    if kind == "modified":
+        when = index.dates.get(note_id)
+        return when is not None and value[0] <= when < value[1]
+    if kind == "locked":
+        return (note_id in index.locked) == value
+    if kind == "title":
+        return value in (index.titles.title(note_id) or "")
+    return None
+
+def _phrase_matches(index, notes_by_id, ids, words, cancel=None):
+    """Id in ids il cui testo contiene la frase; None se la ricerca viene superata.
+
+    Si chiama senza il lock dell'indice: le note vengono dalla copia
+    notes_by_id fatta insieme ai candidati, e decifrarle può richiedere tempo.
+    """
+    pattern = re.compile(r"(?<!\w)" + r"\W+".join(map(re.escape, words)) + r"(?!\w)")
+    found = set()
+    for note_id in ids:
+        if cancelled(cancel):
+            return None
+        note = notes_by_id[note_id]
+        if pattern.search(normalize(note[0] + "\n" + index.plaintext(note))):
+            found.add(note_id)
+    return found
+
+def run_query(index, notes, query, limit=None, cancel=None):
+    """Esegue una query strutturata: (id in ordine di pertinenza, passi del piano)"""
+    clauses = parse(query)
+    steps = []
+    # Sotto il lock solo gli indici; le frasi si verificano dopo, sul testo
+    with index.lock:
+        positive = sorted(((_estimate(index, c), c) for c in clauses if not c.negate),
+                          key=lambda e: e[0])
+        negative = [c for c in clauses if c.negate]
+        if positive:
+            estimate, first = positive[0]
+            candidates, source = _fetch(index, first)
+            steps.append(f"{_describe(first)} → {source}: {len(candidates)} note")
+            rest = positive[1:]
+        else:
+            candidates = set(index.ids)
+            steps.append(f"nessuna condizione selettiva → tutte le {len(candidates)} note")
+            rest = []
+
+        phrases = [first] if positive and first.kind == "phrase" else []
+        for estimate, clause in rest:
+            if not candidates or cancelled(cancel):
+                break
+            if clause.kind in ("modified", "locked", "title") and len(candidates) < estimate:
+                # Pochi candidati: si controllano uno a uno invece di leggere una lista lunga
+                candidates = {i for i in candidates if _test(index, clause, i)}
+                steps.append(f"{_describe(clause)} → filtro sui candidati: {len(candidates)} note")
+            else:
+                ids, source = _fetch(index, clause)
+                candidates &= ids
+                steps.append(f"{_describe(clause)} → ∩ {source} ({len(ids)}): {len(candidates)} note")
+            if clause.kind == "phrase":
+                phrases.append(clause)
+
+        excluded = []   # frasi escluse: (clausola, candidati che contengono le parole)
+        for clause in negative:
+            if not candidates or cancelled(cancel):
+                break
+            if clause.kind in ("modified", "locked", "title"):
+                candidates = {i for i in candidates if not _test(index, clause, i)}
+                steps.append(f"{_describe(clause)} → esclusione sui candidati: {len(candidates)} note")
+                continue
+            ids, source = _fetch(index, clause)
+            if clause.kind == "phrase":
+                excluded.append((clause, ids & candidates))
+                continue
+            candidates -= ids
+            steps.append(f"{_describe(clause)} → esclusione ({source}): {len(candidates)} note")
+
+        if cancelled(cancel):
+            return [], steps
+        locked = index.locked & candidates
+        # Copia delle note da verificare: fuori dal lock le posizioni possono cambiare
+        notes_by_id = {i: notes[index.position(i)] for i in candidates} if phrases or excluded else {}
+
+    for clause in phrases:
+        if not candidates:
+            break
+        checked = len(candidates)
+        decrypt = len(candidates & locked)
+        candidates = _phrase_matches(index, notes_by_id, candidates, clause.value, cancel)
+        if candidates is None:
+            return [], steps
+        note = f", {decrypt} da decifrare" if decrypt else ""
+        steps.append(f"{_describe(clause)} → verifica del testo su {checked} candidati{note}: "
+                     f"{len(candidates)} note")
+
+    for clause, ids in excluded:
+        if not candidates:
+            break
+        ids = _phrase_matches(index, notes_by_id, ids & candidates, clause.value, cancel)
+        if ids is None:
+            return [], steps
+        candidates -= ids
+        steps.append(f"{_describe(clause)} → esclusione (verifica del testo su {len(ids)} candidati): "
+                     f"{len(candidates)} note")
+
+    if cancelled(cancel):
+        return [], steps
+    with index.lock:
+        # Le note eliminate durante la verifica non entrano nel risultato
+        candidates = {i for i in candidates if index.position(i) is not None}
+        # Ordine: pertinenza BM25 se ci sono parole da cercare, altrimenti le più recenti
+        groups = [[c.value] if c.kind == "term" else
+                  index.fulltext.expand_prefix(c.value) if c.kind == "prefix" else list(c.value)
+                  for c in clauses if not c.negate and c.kind in ("term", "prefix", "phrase")]
+        if groups:
+            scores = index.fulltext.scores(groups, cancel) or {}
+            ranked = sorted(candidates, key=lambda i: (-scores.get(i, 0.0), index.position(i)))
+            steps.append("ordinamento per pertinenza (BM25)")
+        else:
+            ranked = sorted(candidates, key=lambda i: (-(index.dates.get(i) or 0), index.position(i)))
+            steps.append("ordinamento per data di modifica")
+    return ranked[:limit] if limit else ranked, steps
+
+def snippet_query(query):
+    """Parole da evidenziare negli estratti: la query senza operatori né esclusioni"""
+    try:
+        clauses = parse(query)
+    except ValueError:
+        return ""
+    words = []
+    for c in clauses:
+        if not c.negate and c.kind in ("term", "prefix"):
+            words.append(c.value)
+        elif not c.negate and c.kind == "phrase":
+            words.extend(c.value)
+    text = " ".join(words)
+    return text if clauses and clauses[-1].kind == "prefix" else text + " "
+
+def dependencies(query, tags=()):
+    """Chiavi, prefissi e "dipende da tutto" del risultato di una ricerca (per la cache).
+
+    Basta che il risultato dipenda da una chiave di ogni nota che potrebbe
+    entrarci: le note che ne escono sono già tra gli id del risultato.
+    """
+    try:
+        clauses = parse(query)
+    except ValueError:
+        return (), (), False
+    keys = {"#:" + normalize(t.lstrip("#")) for t in tags}
+    prefixes = []
+    for c in clauses:
+        if c.negate:
+            continue
+        if c.kind == "term":
+            keys.add("t:" + c.value)
+        elif c.kind == "prefix":
+            prefixes.append(c.value)
+        elif c.kind == "phrase":
+            keys.update("t:" + w for w in c.value)
+        elif c.kind == "tag":
+            keys.add("#:" + c.value)
+        elif c.kind == "title" and len(c.value) >= 3:
+            keys.update("g:" + g for g in inner_trigrams(c.value))
+    everything = not keys and not prefixes
+    if query.strip() and not is_structured(query):
+        # Ricerca semplice: conta anche la somiglianza dei titoli (trigrammi)
+        q = normalize(query).strip()
+        if len(q) < 3:
+            everything = True
+        keys.update("g:" + g for g in trigrams(q))
+    return keys, prefixes, everything
@@ -0,0 +1,159 @@
+"""Ricerca regex/sottostringa su un buffer contiguo con i corpi delle note."""
+import os
+import re
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+from multiprocessing import Pool
+
+ScanHit = namedtuple("ScanHit", "note_id line_no line")
+
+# Le note sono separate da "\n\0\n": ^ e $ (MULTILINE) funzionano ai bordi di ogni nota
+SEPARATOR = b"\n\0\n"
+
+# ╔══════════════════════════╗
+# SCANSIONE DI UN BLOCCO DI NOTE
+# ╚══════════════════════════╝
+
+def _matcher(pattern, regex, ignore_case):
+    # Si cerca sul testo decodificato, non sui byte: IGNORECASE, \w e \b valgono
+    # anche per le lettere accentate ("perché" trova "PERCHÉ", \bcittà\b trova "Città")
+    if regex or ignore_case:
+        if not regex:
+            pattern = re.escape(pattern)
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        compiled = re.compile(pattern, flags)
+        def search(text, pos, end):
+            m = compiled.search(text, pos, end)
+            return (m.start(), m.end()) if m else None
+    else:
+        def search(text, pos, end):
+            i = text.find(pattern, pos, end)
+            return (i, i + len(pattern)) if i >= 0 else None
+    return search
+
+def scan_range(text, search, start, end):
+    """Posizioni delle righe con almeno un match in text[start:end] (una per riga, come grep)"""
+    hits = []
+    pos = start
+    while pos < end:
+        found = search(text, pos, end)
+        if found is None:
+            break
+        hit, hit_end = found
+        line_end = text.find("\n", hit, end)
+        if line_end < 0:
+            line_end = end
+        if "\0" in text[max(hit - 1, 0):max(hit_end, hit + 1)]:
+            # Il match cade nel separatore o lo attraversa: non appartiene a una sola nota
+            pos = hit + 1
+            continue
+        hits.append(hit)
+        pos = max(line_end + 1, hit_end)
+    return hits
+
+def scan_block(buf, search, start, end):
+    """Offset in byte dei match in buf[start:end]: il blocco si decodifica e si cerca come testo"""
+    text = buf[start:end].decode("utf-8")
+    offsets = []
+    char, byte = 0, start    # ultimo match: posizione nel testo e offset corrispondente nel buffer
+    for hit in scan_range(text, search, 0, len(text)):
+        byte += len(text[char:hit].encode("utf-8"))
+        char = hit
+        offsets.append(byte)
+    return offsets
+
+# Stato dei processi di scansione: il buffer arriva una sola volta, con l'initializer
+_worker_buf = None
+_worker_search = None
+
+def _init_worker(buf, pattern, regex, ignore_case):
+    global _worker_buf, _worker_search
+    _worker_buf = buf
+    _worker_search = _matcher(pattern, regex, ignore_case)
+
+def _scan_block(block):
+    start, end = block
+    return scan_block(_worker_buf, _worker_search, start, end)
+
+# ╔═══════════════════════╗
+# CORPUS CONTIGUO DELLE NOTE
+# ╚═══════════════════════╝
+
+class ScanCorpus:
+    """Corpi in chiaro concatenati in un unico buffer, con l'array degli offset di inizio"""
+
+    # Dimensione indicativa dei blocchi scansionati in un colpo solo (allineati alle note)
+    BLOCK_SIZE = 4 << 20
+    # Sotto questa dimensione i processi costano più di quanto fanno risparmiare
+    PARALLEL_MIN_SIZE = 64 << 20
+
+    def __init__(self, entries):
+        """entries: coppie (id nota, testo in chiaro)"""
+        parts = []
+        self.offsets = array("q")
+        self.ids = []
+        pos = 0
+        for note_id, text in entries:
+            data = text.encode("utf-8")
+            self.offsets.append(pos)
+            self.ids.append(note_id)
+            parts.append(data)
+            pos += len(data) + len(SEPARATOR)
+        self.buffer = SEPARATOR.join(parts)
+        self.offsets.append(pos)    # sentinella: fine dell'ultima nota + separatore
+
+    def __len__(self):
+        return len(self.ids)
+
+    def note_bounds(self, k):
+        return self.offsets[k], self.offsets[k + 1] - len(SEPARATOR)
+
+    def blocks(self):
+        """Intervalli [inizio, fine) di circa BLOCK_SIZE byte che non spezzano le note"""
+        start = 0
+        for k in range(1, len(self.offsets)):
+            if self.offsets[k] - start >= self.BLOCK_SIZE or k == len(self.offsets) - 1:
+                end = min(self.offsets[k], len(self.buffer))
+                if end > start:
+                    yield start, end
+                start = self.offsets[k]
+
+    def resolve(self, offset):
+        """Nota, numero di riga e testo della riga che contiene l'offset"""
+        k = bisect_right(self.offsets, offset) - 1
+        start, end = self.note_bounds(k)
+        nl = self.buffer.rfind(b"\n", start, offset)
+        line_start = nl + 1 if nl >= 0 else start
+        line_end = self.buffer.find(b"\n", offset, end)
+        if line_end < 0:
+            line_end = end
+        line_no = self.buffer.count(b"\n", start, line_start) + 1
+        line = self.buffer[line_start:line_end].decode("utf-8", "replace")
+        return ScanHit(self.ids[k], line_no, line)
+
+    def scan(self, pattern, regex=True, ignore_case=True, limit=None, processes=None):
+        """Genera i risultati man mano che li trova; si ferma dopo limit righe.
+
+        processes=None sceglie da solo: i corpus grandi vengono divisi tra i core.
+        """
+        if processes is None:
+            processes = (os.cpu_count() or 1) if len(self.buffer) >= self.PARALLEL_MIN_SIZE else 0
+        found = 0
+        if processes > 1:
+            with Pool(processes, _init_worker, (self.buffer, pattern, regex, ignore_case)) as pool:
+                for hits in pool.imap(_scan_block, self.blocks()):
+                    for hit in hits:
+                        yield self.resolve(hit)
+                        found += 1
+                        if limit and found >= limit:
+                            pool.terminate()
+                            return
+            return
+        search = _matcher(pattern, regex, ignore_case)
+        for start, end in self.blocks():
+            for hit in scan_block(self.buffer, search, start, end):
+                yield self.resolve(hit)
+                found += 1
+                if limit and found >= limit:
+                    return
@@ -0,0 +1,1101 @@
+"""Indici di ricerca condivisi tra Caldras CLI e GUI."""
+import hashlib
+import heapq
+import json
+import math
+import pickle
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+from itertools import chain, islice
+
+from caldras_scan import ScanCorpus
+from caldras_store import FLAG_PROTECTED, DiskIndex, restamp_index, write_index
+
+# ╔═══════════════════════╗
+# NORMALIZZAZIONE DEI TESTI
+# ╚═══════════════════════╝
+
+def normalize(text):
+    """Casefold e rimozione degli accenti ("Perché" → "perche")"""
+    folded = text.casefold()
+    if folded.isascii():
+        return folded
+    decomposed = unicodedata.normalize("NFKD", folded)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+WORD_RE = re.compile(r"\w+")
+
+def tokenize(text):
+    """Termini normalizzati di un testo"""
+    return WORD_RE.findall(normalize(text))
+
+TAG_RE = re.compile(r"(?<![\w#&/])#(\w[\w/-]*)")
+FENCE_RE = re.compile(r"^```.*?(?:^```[^\n]*$|\Z)", re.MULTILINE | re.DOTALL)
+
+def extract_tags(text):
+    """#tag presenti nel markdown (esclusi i blocchi di codice), normalizzati"""
+    text = FENCE_RE.sub("", text)
+    return sorted({normalize(t).rstrip("/-") for t in TAG_RE.findall(text)})
+
+def cancelled(cancel):
+    """Vero se la ricerca è stata superata da una più recente (threading.Event impostato)"""
+    return cancel is not None and cancel.is_set()
+
+def fingerprint(note):
+    """Impronta di 64 bit di una nota: cambia se cambiano titolo, contenuto o password"""
+    return int.from_bytes(hashlib.blake2b(pickle.dumps(tuple(note), 4), digest_size=8).digest(), "little")
+
+def trigrams(text):
+    """Trigrammi di un testo già normalizzato, con padding ai bordi"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def inner_trigrams(text):
+    """Trigrammi senza padding: presenti in ogni titolo che contiene text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+NoteTerms = namedtuple("NoteTerms", "fingerprint title tf tags")
+
+def analyze_note(note, body, title_weight=3):
+    """Impronta, termini pesati e tag di una nota dato il corpo in chiaro.
+
+    È la parte lunga dell'indicizzazione e non tocca gli indici: si può
+    calcolare fuori dal lock, anche in un altro thread.
+    """
+    title = note[0] if len(note) >= 1 else "Senza titolo"
+    tf = Counter()
+    for term in tokenize(title):
+        tf[term] += title_weight
+    for term in tokenize(body):
+        tf[term] += 1
+    return NoteTerms(fingerprint(note), title, tf, extract_tags(body))
+
+# ╔═════════════════════════════╗
+# SEGMENTO SU DISCO + MODIFICHE IN RAM
+# ╚═════════════════════════════╝
+
+class _Layered:
+    """Base comune: un segmento su disco (sola lettura) più le modifiche in memoria.
+
+    Gli id del segmento rimossi o reindicizzati finiscono in dead e vengono
+    ignorati nelle letture dal disco.
+    """
+
+    # Le note protette non hanno termini né tag nel segmento pubblico
+    PUBLIC_ONLY = True
+
+    def __init__(self, base=None):
+        self.base = base
+        self.dead = set()
+
+    def _base_slot(self, note_id):
+        if self.base is None or note_id in self.dead:
+            return None
+        slot = self.base.slot(note_id)
+        if slot is not None and self.PUBLIC_ONLY and self.base.flags[slot] & FLAG_PROTECTED:
+            return None
+        return slot
+
+    def _base_postings(self, key):
+        if self.base is None:
+            return []
+        ids = self.base.postings(key)
+        return [i for i in ids if i not in self.dead] if self.dead else ids
+
+# ╔══════════════════════════╗
+# INDICE A TRIGRAMMI SUI TITOLI
+# ╚══════════════════════════╝
+
+class TitleIndex(_Layered):
+    """Indice fuzzy dei titoli: trigramma → id delle note"""
+
+    # Quota minima di trigrammi della query che un titolo deve contenere
+    MIN_COVERAGE = 0.5
+    # I titoli delle note protette restano in chiaro, come nell'elenco
+    PUBLIC_ONLY = False
+
+    def __init__(self, base=None):
+        super().__init__(base)
+        self.titles = {}                 # id → titolo normalizzato
+        self.grams = defaultdict(set)    # trigramma → {id}
+        self.gram_count = {}             # id → numero di trigrammi
+
+    def __len__(self):
+        on_disk = self.base.n_notes - len(self.dead) if self.base else 0
+        return on_disk + len(self.titles)
+
+    def title(self, note_id):
+        if note_id in self.titles:
+            return self.titles[note_id]
+        slot = self._base_slot(note_id)
+        return self.base.title(slot) if slot is not None else None
+
+    def grams_of(self, note_id):
+        if note_id in self.gram_count:
+            return self.gram_count[note_id]
+        return self.base.gram_counts[self.base.slot(note_id)]
+
+    def add(self, note_id, title):
+        norm = normalize(title)
+        grams = trigrams(norm)
+        self.titles[note_id] = norm
+        self.gram_count[note_id] = len(grams)
+        for g in grams:
+            self.grams[g].add(note_id)
+
+    def remove(self, note_id):
+        norm = self.titles.pop(note_id, None)
+        if norm is None:
+            if self._base_slot(note_id) is not None:
+                self.dead.add(note_id)
+            return
+        del self.gram_count[note_id]
+        for g in trigrams(norm):
+            ids = self.grams.get(g)
+            if ids is not None:
+                ids.discard(note_id)
+                if not ids:
+                    del self.grams[g]
+
+    def gram_df(self, q):
+        """Stima dei titoli che contengono q: la lista di trigrammi più corta"""
+        if len(q) < 3:
+            return len(self)
+        return min(self._gram_ids(g, count=True) for g in inner_trigrams(q))
+
+    def _gram_ids(self, g, count=False):
+        key = b"g:" + g.encode("utf-8")
+        if count:
+            return len(self.grams.get(g, ())) + (self.base.df(key) if self.base else 0)
+        return set(self.grams.get(g, ())).union(self._base_postings(key))
+
+    def containing(self, q):
+        """Id dei titoli che contengono q: intersezione dei trigrammi interni, poi verifica"""
+        if len(q) < 3:
+            return self._containing(q)
+        lists = sorted((self._gram_ids(g) for g in inner_trigrams(q)), key=len)
+        candidates = set.intersection(*lists)
+        return {i for i in candidates if q in self.title(i)}
+
+    def _containing(self, q):
+        """Id dei titoli che contengono q (i titoli su disco si cercano nel blocco mappato)"""
+        hits = {i for i, t in self.titles.items() if q in t}
+        if self.base is not None:
+            on_disk = (self.base.ids[slot] for slot in self.base.titles_containing(q))
+            hits.update(i for i in on_disk if i not in self.dead)
+        return hits
+
+    def search(self, query, limit=None, cancel=None):
+        """Id dei titoli simili alla query, dal più pertinente"""
+        q = normalize(query).strip()
+        if not q:
+            return []
+        if len(q) < 3:
+            # Troppo corta per i trigrammi: confronto diretto sui titoli normalizzati
+            hits = list(self._containing(q))
+            titles = {i: self.title(i) for i in hits}
+            hits.sort(key=lambda i: (not titles[i].startswith(q), len(titles[i]), i))
+            return hits[:limit] if limit else hits
+
+        q_grams = trigrams(q)
+        postings = [self.grams[g] for g in q_grams if g in self.grams]
+        postings += [self._base_postings(b"g:" + g.encode("utf-8")) for g in q_grams]
+        shared = Counter(chain.from_iterable(postings))
+        if cancelled(cancel):
+            return []
+
+        # Copertura: quota dei trigrammi della query presenti nel titolo (tollera i refusi);
+        # a parità di copertura vince il titolo più corto (somiglianza di Jaccard)
+        min_shared = self.MIN_COVERAGE * len(q_grams)
+        inner = len(q) - 2      # trigrammi interni, presenti in ogni titolo che contiene q
+        exact = None
+        scored = []
+        for note_id, n in shared.items():
+            if n < min_shared:
+                continue
+            sim = n / len(q_grams) + 0.1 * n / (len(q_grams) + self.grams_of(note_id) - n)
+            if n >= inner:
+                if exact is None:
+                    exact = self._containing(q)
+                if note_id in exact:
+                    sim += 1.0      # le corrispondenze esatte restano sempre in cima
+            scored.append((sim, note_id))
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        if limit:
+            scored = scored[:limit]
+        return [note_id for _, note_id in scored]
+
+# ╔═══════════════════════════╗
+# COMPLETAMENTO DEI TITOLI PER PREFISSO
+# ╚═══════════════════════════╝
+
+class TitleCompleter(_Layered):
+    """Array ordinato di (titolo normalizzato, id): i completamenti sono una ricerca binaria"""
+
+    PUBLIC_ONLY = False
+
+    def __init__(self, base=None):
+        super().__init__(base)
+        self.entries = []    # (titolo normalizzato, id) in ordine alfabetico
+        self.titles = {}     # id → titolo normalizzato
+        # Copia di entries per complete(), rifatta da publish() dopo le modifiche:
+        # non cambia mai sul posto, quindi si legge da un altro thread senza lock
+        self.view = ()
+
+    def add(self, note_id, title):
+        norm = normalize(title)
+        insort(self.entries, (norm, note_id))
+        self.titles[note_id] = norm
+
+    def remove(self, note_id):
+        norm = self.titles.pop(note_id, None)
+        if norm is None:
+            if self._base_slot(note_id) is not None:
+                self.dead.add(note_id)
+            return
+        del self.entries[bisect_left(self.entries, (norm, note_id))]
+
+    def publish(self):
+        self.view = tuple(self.entries)
+
+    @staticmethod
+    def _in_memory(entries, prefix):
+        i = bisect_left(entries, (prefix,))
+        while i < len(entries) and entries[i][0].startswith(prefix):
+            yield entries[i]
+            i += 1
+
+    def complete(self, prefix, limit=10):
+        """Id dei primi limit titoli (in ordine alfabetico) che iniziano con prefix"""
+        prefix = normalize(prefix).lstrip()
+        if not prefix:
+            return []
+        sources = [self._in_memory(self.view, prefix)]
+        if self.base is not None:
+            on_disk = self.base.titles_with_prefix(prefix)
+            sources.append((t, i) for t, i in on_disk if i not in self.dead)
+        return [note_id for _, note_id in islice(heapq.merge(*sources), limit)]
+
+# ╔═══════════════════════════╗
+# INDICE FULL-TEXT CON RANKING BM25
+# ╚═══════════════════════════╝
+
+class FullTextIndex(_Layered):
+    """Indice invertito con punteggio BM25F (il titolo pesa più del corpo)"""
+
+    K1 = 1.2
+    B = 0.75
+    TITLE_WEIGHT = 3
+    # Termini in cui si espande l'ultima parola della query mentre si digita
+    MAX_PREFIX_TERMS = 50
+
+    def __init__(self, base=None):
+        super().__init__(base)
+        self.postings = defaultdict(dict)   # termine → {id: frequenza pesata}
+        self.doc_len = {}                   # id → lunghezza pesata
+        self.doc_terms = {}                 # id → termini indicizzati (per la rimozione)
+        self.total_len = 0
+        self.base_docs = base.n_public if base else 0
+        self.base_len = base.total_len if base else 0
+        self._vocab = None                  # termini ordinati, per l'espansione dei prefissi
+
+    def __len__(self):
+        return self.base_docs + len(self.doc_len)
+
+    def add(self, note_id, title, body):
+        self.add_counts(note_id, analyze_note((title,), body, self.TITLE_WEIGHT).tf)
+
+    def add_counts(self, note_id, tf):
+        """Indicizza una nota a partire dalle frequenze dei suoi termini"""
+        length = sum(tf.values())
+        for term, n in tf.items():
+            if term not in self.postings:
+                self._vocab = None
+            self.postings[term][note_id] = n
+        self.doc_len[note_id] = length
+        self.doc_terms[note_id] = tuple(tf)
+        self.total_len += length
+
+    def counts(self, note_id):
+        """Frequenze dei termini di una nota indicizzata in memoria"""
+        return {t: self.postings[t][note_id] for t in self.doc_terms[note_id]}
+
+    def length_of(self, note_id):
+        if note_id in self.doc_len:
+            return self.doc_len[note_id]
+        return self.base.doc_lens[self.base.slot(note_id)]
+
+    def remove(self, note_id):
+        terms = self.doc_terms.pop(note_id, None)
+        if terms is None:
+            slot = self._base_slot(note_id)
+            if slot is not None:
+                self.dead.add(note_id)
+                self.base_docs -= 1
+                self.base_len -= self.base.doc_lens[slot]
+            return
+        self.total_len -= self.doc_len.pop(note_id)
+        for term in terms:
+            docs = self.postings[term]
+            docs.pop(note_id, None)
+            if not docs:
+                del self.postings[term]
+                self._vocab = None
+
+    def expand_prefix(self, prefix):
+        """Termini dell'indice che iniziano con prefix (al massimo MAX_PREFIX_TERMS)"""
+        if self._vocab is None:
+            self._vocab = sorted(self.postings)
+        i = bisect_left(self._vocab, prefix)
+        out = []
+        while i < len(self._vocab) and self._vocab[i].startswith(prefix) and len(out) < self.MAX_PREFIX_TERMS:
+            out.append(self._vocab[i])
+            i += 1
+        if self.base is not None:
+            # Le chiavi su disco sono già ordinate: ne bastano altrettante
+            on_disk = self.base.keys_with_prefix(b"t:" + prefix.encode("utf-8"))
+            out += [key[2:].decode("utf-8") for key, _ in islice(on_disk, self.MAX_PREFIX_TERMS)]
+        return sorted(set(out))[:self.MAX_PREFIX_TERMS]
+
+    def query_terms(self, query):
+        """Termini della query; l'ultima parola, se non ancora conclusa, vale come prefisso"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        groups = [[t] for t in terms]
+        if not query[-1:].isspace():
+            groups[-1] = self.expand_prefix(terms[-1]) or [terms[-1]]
+        return groups
+
+    def _postings(self, term):
+        """Terne (id, frequenza, lunghezza del documento) dalla RAM e dal disco"""
+        docs = [(i, tf, self.doc_len[i]) for i, tf in self.postings[term].items()] if term in self.postings else []
+        if self.base is not None:
+            ids, tfs = self.base.postings(b"t:" + term.encode("utf-8"), with_tf=True)
+            doc_lens, slot = self.base.doc_lens, self.base.slot
+            docs += [(i, tf, doc_lens[slot(i)]) for i, tf in zip(ids, tfs) if i not in self.dead]
+        return docs
+
+    def df(self, term):
+        """Numero (stimato per il disco) di note che contengono il termine"""
+        n = len(self.postings.get(term, ()))
+        if self.base is not None:
+            n += self.base.df(b"t:" + term.encode("utf-8"))
+        return n
+
+    def doc_ids(self, term):
+        """Insieme degli id delle note che contengono il termine"""
+        ids = set(self.postings.get(term, ()))
+        ids.update(self._base_postings(b"t:" + term.encode("utf-8")))
+        return ids
+
+    def scores(self, groups, cancel=None):
+        """Punteggio BM25 di ogni nota per i gruppi di termini (None se annullata)"""
+        scores = defaultdict(float)
+        n_docs = len(self)
+        if not n_docs:
+            return scores
+        avg_len = (self.base_len + self.total_len) / n_docs
+        for group in groups:
+            for term in group:
+                docs = self._postings(term)
+                if not docs:
+                    continue
+                if cancelled(cancel):
+                    return None
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for note_id, tf, length in docs:
+                    norm = self.K1 * (1 - self.B + self.B * length / avg_len)
+                    scores[note_id] += idf * tf * (self.K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, k=20, cancel=None):
+        """I k id più pertinenti per la query, con il relativo punteggio"""
+        scores = self.scores(self.query_terms(query), cancel)
+        if not scores:
+            return []
+        return heapq.nlargest(k, scores.items(), key=lambda s: s[1])
+
+# ╔═══════════════════════╗
+# INDICE DEI TAG (FACCETTE)
+# ╚═══════════════════════╝
+
+def intersect_sorted(lists):
+    """Intersezione di liste ordinate di id, partendo dalla più corta"""
+    if not lists:
+        return []
+    lists = sorted(lists, key=len)
+    result = lists[0]
+    for other in lists[1:]:
+        out = []
+        lo = 0
+        for note_id in result:
+            lo = bisect_left(other, note_id, lo)
+            if lo == len(other):
+                break
+            if other[lo] == note_id:
+                out.append(note_id)
+        result = out
+        if not result:
+            break
+    return result
+
+class TagIndex(_Layered):
+    """Tag → lista ordinata di id delle note.
+
+    I tag delle note protette stanno in un indice a parte (sealed): servono
+    ai filtri ma non compaiono nell'elenco pubblico dei tag con i conteggi.
+    Su disco finiscono solo nella parte cifrata dell'indice.
+    """
+
+    def __init__(self, base=None):
+        super().__init__(base)
+        self.postings = {}    # tag → [id] ordinati (note libere)
+        self.sealed = {}      # tag → [id] ordinati (note protette)
+        self.note_tags = {}   # id → (tag, protetta)
+
+    def add(self, note_id, tags, sealed=False):
+        target = self.sealed if sealed else self.postings
+        for tag in tags:
+            insort(target.setdefault(tag, []), note_id)
+        self.note_tags[note_id] = (tuple(tags), sealed)
+
+    def remove(self, note_id):
+        if note_id not in self.note_tags:
+            if self._base_slot(note_id) is not None:
+                self.dead.add(note_id)
+            return
+        tags, sealed = self.note_tags.pop(note_id)
+        target = self.sealed if sealed else self.postings
+        for tag in tags:
+            ids = target[tag]
+            del ids[bisect_left(ids, note_id)]
+            if not ids:
+                del target[tag]
+
+    def tags_of(self, note_id):
+        return list(self.note_tags.get(note_id, ((), False))[0])
+
+    def counts(self):
+        """(tag, numero di note libere) dal più usato"""
+        counts = Counter({t: len(ids) for t, ids in self.postings.items()})
+        if self.base is not None:
+            for key, df in self.base.keys_with_prefix(b"#:"):
+                counts[key[2:].decode("utf-8")] += len(self._base_postings(key)) if self.dead else df
+        return sorted(((t, n) for t, n in counts.items() if n), key=lambda c: (-c[1], c[0]))
+
+    def notes_with(self, tags):
+        """Id ordinati delle note che hanno tutti i tag richiesti"""
+        lists = []
+        for tag in tags:
+            ids = self.postings.get(tag, []) + self.sealed.get(tag, [])
+            ids += self._base_postings(b"#:" + tag.encode("utf-8"))
+            lists.append(sorted(ids))
+        return intersect_sorted(lists)
+
+# ╔════════════════════════╗
+# DATE DI ULTIMA MODIFICA
+# ╚════════════════════════╝
+
+class DateIndex(_Layered):
+    """Data di ultima modifica (secondi) di ogni nota.
+
+    Le note del vault non hanno date: le registra l'indice a ogni modifica.
+    Per gli intervalli si usa un array ordinato di (data, id), creato alla
+    prima richiesta e poi aggiornato a ogni modifica.
+    """
+
+    PUBLIC_ONLY = False
+
+    def __init__(self, base=None):
+        super().__init__(base)
+        self.modified = {}      # id → data, per le note indicizzate in questa sessione
+        self._sorted = None     # (data, id) ordinati
+
+    def get(self, note_id):
+        if note_id in self.modified:
+            return self.modified[note_id]
+        slot = self._base_slot(note_id)
+        return self.base.modified[slot] if slot is not None else None
+
+    def set(self, note_id, when):
+        self.remove(note_id)
+        self.modified[note_id] = when
+        if self._sorted is not None:
+            insort(self._sorted, (when, note_id))
+
+    def remove(self, note_id):
+        when = self.get(note_id)
+        if when is None:
+            return
+        if self.modified.pop(note_id, None) is None:
+            self.dead.add(note_id)
+        if self._sorted is not None:
+            del self._sorted[bisect_left(self._sorted, (when, note_id))]
+
+    def _ordered(self):
+        if self._sorted is None:
+            pairs = [(when, note_id) for note_id, when in self.modified.items()]
+            if self.base is not None:
+                pairs += [(self.base.modified[slot], self.base.ids[slot]) for slot in range(self.base.n_notes)
+                          if self.base.ids[slot] not in self.dead]
+            self._sorted = sorted(pairs)
+        return self._sorted
+
+    def count(self, start, end):
+        """Note modificate nell'intervallo [start, end)"""
+        ordered = self._ordered()
+        return bisect_left(ordered, (end,)) - bisect_left(ordered, (start,))
+
+    def between(self, start, end):
+        ordered = self._ordered()
+        return {note_id for _, note_id in ordered[bisect_left(ordered, (start,)):bisect_left(ordered, (end,))]}
+
+# ╔═════════════════════════════╗
+# ESTRATTI CON I TERMINI EVIDENZIATI
+# ╚═════════════════════════════╝
+
+def term_positions(text):
+    """Termine normalizzato → intervalli (inizio, fine) delle occorrenze nel testo originale"""
+    positions = defaultdict(list)
+    for m in WORD_RE.finditer(text):
+        positions[normalize(m.group())].append(m.span())
+    return positions
+
+def make_snippet(text, spans, width):
+    """Estratto di circa width caratteri attorno al gruppo di intervalli più fitto.
+
+    Restituisce (estratto, intervalli relativi all'estratto); gli a capo
+    diventano spazi e i tagli sono segnati con "…".
+    """
+    if not spans:
+        a, b = 0, min(len(text), width)
+        hits = []
+    else:
+        # Finestra che contiene più occorrenze: due indici che scorrono sugli intervalli
+        best, best_n, j = 0, 0, 0
+        for i, (start, _) in enumerate(spans):
+            while j < len(spans) and spans[j][1] - start <= width:
+                j += 1
+            if j - i > best_n:
+                best, best_n = i, j - i
+        hits = spans[best:best + max(best_n, 1)]
+        first, last = hits[0][0], hits[-1][1]
+        a = max(0, first - max(width - (last - first), 0) // 2)
+        b = min(len(text), max(a + width, last))
+        a = max(0, min(a, b - width))
+        if a > 0:
+            space = text.find(" ", a, first)
+            a = space + 1 if space >= 0 else a
+    if b < len(text):
+        space = text.rfind(" ", hits[-1][1] if hits else a, b)
+        b = space if space > a else b
+    excerpt = text[a:b].replace("\n", " ").replace("\r", " ")
+    shift = -a
+    if a > 0:
+        excerpt = "…" + excerpt
+        shift += 1
+    if b < len(text):
+        excerpt += "…"
+    return excerpt, [(s + shift, e + shift) for s, e in spans if s >= a and e <= b]
+
+class SnippetCache:
+    """Estratti dei risultati, calcolati solo per le note effettivamente mostrate.
+
+    Per ogni nota si tengono il testo in chiaro e le posizioni dei termini,
+    solo in memoria e solo per la sessione: gli estratti successivi (anche
+    per altre ricerche) non rileggono né decifrano il corpo.
+    """
+
+    WIDTH = 160
+    MAX_NOTES = 256
+
+    def __init__(self):
+        self._entries = OrderedDict()   # id → (testo, posizioni dei termini)
+
+    def discard(self, note_id):
+        self._entries.pop(note_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def snippet(self, note_id, load, terms):
+        """load() fornisce il testo in chiaro solo la prima volta"""
+        entry = self._entries.get(note_id)
+        if entry is None:
+            text = load()
+            entry = (text, term_positions(text))
+            self._entries[note_id] = entry
+            if len(self._entries) > self.MAX_NOTES:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(note_id)
+        text, positions = entry
+        spans = sorted(span for term in set(terms) for span in positions.get(term, ()))
+        return make_snippet(text, spans, self.WIDTH)
+
+# ╔═══════════════════════╗
+# CACHE DEI RISULTATI (LRU)
+# ╚═══════════════════════╝
+
+CacheEntry = namedtuple("CacheEntry", "result members keys prefixes everything")
+
+class QueryCache:
+    """Risultati delle ultime query, invalidati solo dalle modifiche che li riguardano.
+
+    Ogni voce ricorda le chiavi da cui dipende ("t:termine", "g:trigramma",
+    "#:tag"), i prefissi ancora aperti e gli id del risultato: una nota
+    modificata invalida le voci che la contengono o che ora la troverebbero.
+    Le variazioni delle statistiche globali di BM25 non bastano a invalidare.
+    """
+
+    MAX_ENTRIES = 128
+
+    def __init__(self):
+        self.generation = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, generation):
+        if generation != self.generation:
+            # Modifiche non notificate (riapertura, recupero): si riparte da zero
+            self._entries.clear()
+            self.generation = generation
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry.result
+
+    def put(self, key, generation, result, ids, keys=(), prefixes=(), everything=False):
+        if generation != self.generation:
+            return
+        self._entries[key] = CacheEntry(result, frozenset(ids), frozenset(keys), tuple(prefixes), everything)
+        if len(self._entries) > self.MAX_ENTRIES:
+            self._entries.popitem(last=False)
+
+    def touch(self, note_id, keys, generation):
+        """Una nota è cambiata: keys sono le chiavi del suo nuovo contenuto"""
+        terms = [k[2:] for k in keys if k.startswith("t:")]
+        stale = [key for key, e in self._entries.items()
+                 if e.everything or note_id in e.members or not e.keys.isdisjoint(keys)
+                 or any(t.startswith(p) for p in e.prefixes for t in terms)]
+        for key in stale:
+            del self._entries[key]
+        self.generation = generation
+
+    def clear(self):
+        self._entries.clear()
+
+# ╔════════════════════════════╗
+# INDICE DELLE NOTE (ID STABILI)
+# ╚════════════════════════════╝
+
+class SearchIndex:
+    """Raccoglie gli indici e assegna a ogni nota un id stabile.
+
+    Le note restano una lista di tuple (titolo, contenuto, password): l'indice
+    tiene una lista parallela di id, aggiornata da add/update/delete. Con
+    open/save gli id e gli indici sopravvivono tra un avvio e l'altro.
+    """
+
+    def __init__(self, decrypt=None, encrypt=None, base=None):
+        self.ids = []            # posizione → id
+        self.next_id = 0
+        self.generation = 0      # incrementata a ogni modifica delle note
+        self.decrypt = decrypt   # decrypt_text(contenuto, password) dello script chiamante
+        self.encrypt = encrypt   # encrypt_text(testo, password), per la parte sigillata su disco
+        self.base = base         # DiskIndex aperto, o None
+        self.titles = TitleIndex(base)
+        self.completer = TitleCompleter(base)
+        self.fulltext = FullTextIndex(base)
+        self.tags = TagIndex(base)
+        self.dates = DateIndex(base)
+        self.locked = set()      # id delle note protette da password
+        self.snippets = SnippetCache()
+        self.cache = QueryCache()
+        self.fingerprints = {}   # id → impronta delle note indicizzate in questa sessione
+        self.lock = threading.RLock()
+        # id → posizione: mai modificato sul posto ma sostituito per intero, così
+        # position() lo legge senza lock (il thread Tk non aspetta le ricerche)
+        self._positions = None
+        self._corpus = None      # ((generazione, protette incluse), ScanCorpus) per le ricerche regex
+
+    @classmethod
+    def build(cls, notes, decrypt=None, encrypt=None, modified=None):
+        """Indicizza da zero; modified è la data da attribuire alle note (default: adesso)"""
+        index = cls(decrypt, encrypt)
+        for note in notes:
+            note_id = index._new_id()
+            index.ids.append(note_id)
+            index._index_note(note_id, note, modified)
+        index.completer.publish()
+        return index
+
+    # ╔═════════════════╗
+    # PERSISTENZA SU DISCO
+    # ╚═════════════════╝
+
+    @classmethod
+    def open(cls, path, notes, stamp, decrypt=None, encrypt=None, unsealed=None):
+        """Apre l'indice salvato senza ricostruirlo.
+
+        Se il timbro del vault non coincide (note cambiate da un'altra versione
+        di Caldras o salvataggio interrotto) si reindicizzano solo le differenze.
+        unsealed (id → {"tf", "tags"}) dà termini e tag delle note protette già
+        in memoria: quelle non si decifrano (riapertura dopo save).
+        """
+        try:
+            base = DiskIndex(path)
+        except (OSError, ValueError):
+            # In mancanza di meglio le note prendono la data del file del vault
+            return cls.build(notes, decrypt, encrypt, modified=stamp[0] // 10**9 or None)
+        index = cls(decrypt, encrypt, base)
+        index.next_id = base.next_id
+        index.generation = base.generation
+        sealed = dict(base.sealed())
+        if base.stamp == tuple(stamp) and base.n_notes == len(notes):
+            index.ids = list(base.positions)
+            unsealed = unsealed or {}
+            for note_id, note in zip(index.ids, notes):
+                if note_password(note):
+                    index._unseal(note_id, note, sealed.get(note_id), unsealed.get(note_id))
+        else:
+            index._catch_up(notes, sealed, stamp[0] // 10**9 or None)
+        index.completer.publish()
+        return index
+
+    def _unseal(self, note_id, note, token, data=None):
+        """Carica in memoria termini e tag cifrati di una nota protetta (o data, se già noti)"""
+        try:
+            if data is None:
+                data = json.loads(self.decrypt(token, note_password(note)))
+            self.fulltext.add_counts(note_id, data["tf"])
+            self.tags.add(note_id, data["tags"], sealed=True)
+            self.locked.add(note_id)
+        except Exception:
+            # Sigillo mancante o illeggibile: si reindicizza la nota
+            modified = self.dates.get(note_id)
+            self._unindex_note(note_id)
+            self._index_note(note_id, note, modified)
+
+    def _catch_up(self, notes, sealed, modified=None):
+        """Allinea l'indice al vault confrontando le impronte delle note.
+
+        Le note nuove o cambiate fuori da questa sessione prendono la data modified.
+        """
+        base = self.base
+        by_fingerprint = defaultdict(list)
+        for slot in range(base.n_notes):
+            by_fingerprint[base.fingerprints[slot]].append(base.ids[slot])
+        kept = set()
+        for note in notes:
+            candidates = by_fingerprint.get(fingerprint(note))
+            if candidates:
+                note_id = candidates.pop()
+                kept.add(note_id)
+                self.ids.append(note_id)
+                if note_password(note):
+                    self._unseal(note_id, note, sealed.get(note_id))
+            else:
+                note_id = self._new_id()
+                self.ids.append(note_id)
+                self._index_note(note_id, note, modified)
+        for slot in range(base.n_notes):
+            if base.ids[slot] not in kept:
+                self._unindex_note(base.ids[slot])
+        self.generation += 1
+
+    def save(self, path, notes, stamp):
+        """Scrive l'indice su disco e lo riapre; stamp è il timbro attuale del vault"""
+        with self.lock:
+            if self.base is not None and self.generation == self.base.generation:
+                # Nessuna modifica alle note: basta aggiornare il timbro
+                if self.base.stamp != tuple(stamp):
+                    self.base.close()
+                    restamp_index(path, self.generation, stamp)
+                    self.base = None
+            else:
+                protected = {note_id for note_id, note in zip(self.ids, notes) if note_password(note)}
+                docs = self._doc_records(protected)
+                public = [d for d in docs if not d[4]]
+                meta = {"generation": self.generation, "stamp": stamp, "next_id": self.next_id,
+                        "total_len": sum(d[2] for d in public), "n_public": len(public)}
+                entries = self._entries(protected)
+                sealed = self._sealed(notes)
+                self.close()
+                write_index(path, meta, docs, self.ids, entries, sealed)
+            if self.base is None:
+                # Termini e tag delle protette sono già in memoria: riaprendo non si decifrano
+                unsealed = {note_id: {"tf": self.fulltext.counts(note_id), "tags": self.tags.tags_of(note_id)}
+                            for note_id, note in zip(self.ids, notes) if note_password(note)}
+                reopened = SearchIndex.open(path, notes, stamp, self.decrypt, self.encrypt, unsealed)
+                reopened.lock = self.lock
+                self.__dict__.update(reopened.__dict__)
+
+    def close(self):
+        """Rilascia il file mappato in memoria"""
+        if self.base is not None:
+            self.base.close()
+            self.base = None
+
+    def _doc_records(self, protected):
+        docs = []
+        for note_id in self.ids:
+            fp = self.fingerprints.get(note_id)
+            if fp is None:
+                fp = self.base.fingerprints[self.base.slot(note_id)]
+            docs.append((note_id, fp, self.fulltext.length_of(note_id), self.titles.grams_of(note_id),
+                         FLAG_PROTECTED if note_id in protected else 0, self.titles.title(note_id),
+                         self.dates.get(note_id) or 0))
+        docs.sort()
+        return docs
+
+    def _entries(self, protected):
+        """Chiavi ordinate del dizionario su disco: unione di segmento e modifiche in RAM"""
+        families = (
+            (b"#:", self.tags, False, {t: dict.fromkeys(ids) for t, ids in self.tags.postings.items()}),
+            (b"g:", self.titles, False, {g: dict.fromkeys(ids) for g, ids in self.titles.grams.items()}),
+            (b"t:", self.fulltext, True, {t: {i: n for i, n in docs.items() if i not in protected}
+                                          for t, docs in self.fulltext.postings.items()}),
+        )
+        entries = []
+        for prefix, layer, with_tf, memory in families:
+            memory = {prefix + k.encode("utf-8"): v for k, v in memory.items() if v}
+            keys = set(memory)
+            if self.base is not None:
+                keys.update(key for key, _ in self.base.keys_with_prefix(prefix))
+            for key in sorted(keys):
+                merged = {}
+                if self.base is not None:
+                    if with_tf:
+                        ids, tfs = self.base.postings(key, with_tf=True)
+                        merged = {i: n for i, n in zip(ids, tfs) if i not in layer.dead}
+                    else:
+                        merged = dict.fromkeys(layer._base_postings(key))
+                merged.update(memory.get(key, {}))
+                if merged:
+                    ids = sorted(merged)
+                    entries.append((key, ids, [merged[i] for i in ids] if with_tf else None))
+        return entries
+
+    def _sealed(self, notes):
+        """Termini e tag delle note protette, cifrati con la password di ciascuna nota"""
+        if self.encrypt is None:
+            return []
+        sealed = []
+        for note_id, note in zip(self.ids, notes):
+            password = note_password(note)
+            if password and note_id in self.fulltext.doc_len:
+                data = {"tf": self.fulltext.counts(note_id), "tags": self.tags.tags_of(note_id)}
+                sealed.append((note_id, self.encrypt(json.dumps(data), password)))
+        return sealed
+
+    # ╔═══════════════════╗
+    # MODIFICHE ALLE NOTE
+    # ╚═══════════════════╝
+
+    def add(self, note):
+        """Indicizza una nota appena aggiunta in coda alla lista"""
+        with self.lock:
+            note_id = self._new_id()
+            self.ids.append(note_id)
+            if self._positions is not None:
+                positions = dict(self._positions)
+                positions[note_id] = len(self.ids) - 1
+                self._positions = positions
+            self._index_note(note_id, note)
+            self.completer.publish()
+            return note_id
+
+    def update(self, pos, note, text=None):
+        """Reindicizza la nota in posizione pos dopo una modifica (vedi update_id)"""
+        return self.update_id(self.ids[pos], note, text)
+
+    def update_id(self, note_id, note, text=None):
+        """Reindicizza la nota note_id; None se nel frattempo è stata eliminata.
+
+        text è il corpo in chiaro, se chi salva lo ha già: così una nota
+        protetta non si decifra di nuovo. Tokenizzazione e tag si calcolano
+        prima di prendere il lock, che resta occupato solo per lo scambio.
+        """
+        if text is None:
+            text = self.plaintext(note)
+        terms = analyze_note(note, text, FullTextIndex.TITLE_WEIGHT)
+        with self.lock:
+            if self.position(note_id) is None:
+                return None
+            self._unindex_note(note_id)
+            self._index_note(note_id, note, terms=terms)
+            self.completer.publish()
+            return note_id
+
+    def delete(self, pos):
+        """Rimuove la nota in posizione pos (da chiamare insieme a del notes[pos])"""
+        with self.lock:
+            note_id = self.ids.pop(pos)
+            self._unindex_note(note_id)
+            self._positions = {n: p for p, n in enumerate(self.ids)}
+            self.completer.publish()
+            return note_id
+
+    def _new_id(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def _index_note(self, note_id, note, modified=None, terms=None):
+        if terms is None:
+            terms = analyze_note(note, self.plaintext(note), FullTextIndex.TITLE_WEIGHT)
+        self.generation += 1
+        self.fingerprints[note_id] = terms.fingerprint
+        self.dates.set(note_id, modified or int(time.time()))
+        if note_password(note):
+            self.locked.add(note_id)
+        self.titles.add(note_id, terms.title)
+        self.completer.add(note_id, terms.title)
+        self.fulltext.add_counts(note_id, terms.tf)
+        self.tags.add(note_id, terms.tags, sealed=bool(note_password(note)))
+        keys = {"t:" + t for t in terms.tf}
+        keys.update("g:" + g for g in trigrams(normalize(terms.title)))
+        keys.update("#:" + t for t in terms.tags)
+        self.cache.touch(note_id, keys, self.generation)
+
+    def _unindex_note(self, note_id):
+        self.generation += 1
+        self.fingerprints.pop(note_id, None)
+        self.dates.remove(note_id)
+        self.locked.discard(note_id)
+        self.snippets.discard(note_id)
+        self.titles.remove(note_id)
+        self.completer.remove(note_id)
+        self.fulltext.remove(note_id)
+        self.tags.remove(note_id)
+        self.cache.touch(note_id, (), self.generation)
+
+    def plaintext(self, note):
+        """Corpo in chiaro di una nota (decifrato con la sua password se protetta)"""
+        contenuto = note[1] if len(note) >= 2 else ""
+        password = note_password(note)
+        if not password:
+            return contenuto
+        if self.decrypt is None:
+            return ""
+        try:
+            return self.decrypt(contenuto, password)
+        except Exception:
+            return ""
+
+    def note_id(self, pos):
+        return self.ids[pos]
+
+    def position(self, note_id):
+        positions = self._positions
+        if positions is None:
+            with self.lock:
+                if self._positions is None:
+                    self._positions = {n: p for p, n in enumerate(self.ids)}
+                positions = self._positions
+        return positions.get(note_id)
+
+    def filter_titles(self, query, limit=None, cancel=None):
+        """Id delle note il cui titolo somiglia alla query, nell'ordine di rilevanza"""
+        with self.lock:
+            if not normalize(query).strip():
+                return list(self.ids)
+            return self.titles.search(query, limit, cancel)
+
+    def complete(self, prefix, limit=10):
+        """Id delle note il cui titolo inizia con prefix (completamento mentre si digita).
+
+        Senza lock: legge la copia dei titoli pubblicata dall'ultima modifica.
+        """
+        return self.completer.complete(prefix, limit)
+
+    def search(self, query, k=20, cancel=None):
+        """Le k note più pertinenti (titolo e contenuto) secondo BM25"""
+        with self.lock:
+            return [note_id for note_id, _ in self.fulltext.search(query, k, cancel)]
+
+    def cached(self, key, compute, dependencies, cancel=None):
+        """Risultato di compute() dalla cache, o calcolato e memorizzato.
+
+        dependencies(result) → (id del risultato, chiavi, prefissi, dipende da tutto).
+        """
+        with self.lock:
+            generation = self.generation
+            result = self.cache.get(key, generation)
+        if result is not None:
+            return result
+        result = compute()
+        if cancelled(cancel):
+            return result
+        with self.lock:
+            # Se nel frattempo le note sono cambiate il risultato non si memorizza
+            self.cache.put(key, generation, result, *dependencies(result))
+        return result
+
+    def snippet(self, note_id, note, query, unlocked=None):
+        """Estratto del corpo attorno ai termini della query e intervalli da evidenziare.
+
+        Per una nota protetta unlocked(nota) dà il testo in chiaro se la nota
+        è sbloccata nella sessione, altrimenti None: niente estratto.
+        """
+        if note_password(note):
+            text = unlocked(note) if unlocked else None
+            if text is None:
+                return "", []
+            load = lambda: text
+        else:
+            load = lambda: self.plaintext(note)
+        with self.lock:
+            terms = [t for group in self.fulltext.query_terms(query) for t in group]
+            return self.snippets.snippet(note_id, load, terms)
+
+    def tag_counts(self):
+        with self.lock:
+            return self.tags.counts()
+
+    def notes_with_tags(self, tags):
+        """Id (in ordine di creazione) delle note con tutti i tag indicati"""
+        with self.lock:
+            return self.tags.notes_with([normalize(t.lstrip("#")) for t in tags])
+
+    def scan_corpus(self, notes, unlocked=None):
+        """Buffer contiguo dei corpi in chiaro, ricostruito solo se le note sono cambiate.
+
+        Le note protette entrano solo se unlocked(nota) ne dà il testo (sbloccate
+        nella sessione); il buffer si rifà anche quando cambiano quelle sbloccate.
+        """
+        with self.lock:
+            texts = {}
+            if unlocked is not None:
+                for note_id in self.locked:
+                    text = unlocked(notes[self.position(note_id)])
+                    if text is not None:
+                        texts[note_id] = text
+            key = (self.generation, frozenset(texts))
+            if self._corpus is None or self._corpus[0] != key:
+                corpus = ScanCorpus((note_id, texts[note_id] if note_password(n) else self.plaintext(n))
+                                    for note_id, n in zip(self.ids, notes)
+                                    if not note_password(n) or note_id in texts)
+                self._corpus = (key, corpus)
+            return self._corpus[1]
+
+    def grep(self, notes, pattern, regex=True, limit=None, unlocked=None):
+        """Righe che contengono il pattern (regex o sottostringa esatta), in streaming"""
+        return self.scan_corpus(notes, unlocked).scan(pattern, regex=regex, ignore_case=regex, limit=limit)
+
+    def forget_plaintext(self):
+        """Blocco: dimentica estratti e buffer di ricerca, che contengono testi in chiaro"""
+        with self.lock:
+            self.snippets.clear()
+            self._corpus = None
+
+def note_title(note):
+    return note[0] if len(note) >= 1 else "Senza titolo"
+
+def note_password(note):
+    return note[2] if len(note) == 3 else None
@@ -0,0 +1,63 @@
+"""Cache di sessione: testi decifrati e anteprime, con budget in byte, LRU e scadenza per inattività."""
+import sys
+import time
+from collections import OrderedDict
+
+class SessionCache:
+    """Voci tenute solo in memoria finché c'è spazio e finché vengono usate.
+
+    Oltre il budget si scartano le voci usate meno di recente; quelle non
+    usate da più di idle secondi vengono dimenticate al primo accesso
+    successivo (o da expire()). clear() è il comando di blocco: toglie ogni
+    riferimento ai testi in chiaro.
+    """
+
+    def __init__(self, budget, idle):
+        self.budget = budget        # byte
+        self.idle = idle            # secondi
+        self.size = 0
+        self._entries = OrderedDict()   # chiave → (valore, byte, ultimo uso)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        self.expire()
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, size, _ = entry
+        self._entries[key] = (value, size, time.monotonic())
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value, size=None):
+        """Memorizza value; size è la stima in byte (di default sys.getsizeof)"""
+        size = sys.getsizeof(value) if size is None else size
+        self.discard(key)
+        if size > self.budget:
+            return
+        self._entries[key] = (value, size, time.monotonic())
+        self.size += size
+        while self.size > self.budget:
+            _, (_, old, _) = self._entries.popitem(last=False)
+            self.size -= old
+
+    def discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def expire(self):
+        """Dimentica le voci non usate da più di idle secondi"""
+        limit = time.monotonic() - self.idle
+        while self._entries:
+            key, (_, size, used) = next(iter(self._entries.items()))
+            if used >= limit:
+                break
+            del self._entries[key]
+            self.size -= size
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
@@ -0,0 +1,298 @@
+"""Indice di ricerca su disco: layout compatto interrogato direttamente via mmap.
+
+Struttura del file (little endian, sezioni allineate a 8 byte):
+  intestazione    magic, versione, generazione, timbro del vault, conteggi, offset
+  colonne note    posizioni (pos → id), id ordinati e, nello stesso ordine,
+                  impronta, lunghezza pesata, n. trigrammi, data di modifica, flag,
+                  titolo normalizzato;
+                  righe in ordine alfabetico di titolo (completamento per prefisso)
+  dizionario      chiavi ordinate ("t:" termini, "g:" trigrammi, "#:" tag)
+  posting         per chiave: delta degli id in varint (+ frequenza per i termini)
+  sigillati       dati cifrati delle note protette (termini e tag)
+"""
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+MAGIC = b"CLDRSIDX"
+VERSION = 3
+
+SECTIONS = ("positions", "ids", "fingerprints", "doc_len", "gram_count", "modified", "flags",
+            "title_offsets", "titles", "title_order", "key_offsets", "keys", "post_offsets", "df",
+            "postings", "sealed")
+HEADER = struct.Struct("<8sIQqqQIIQI" + "Q" * len(SECTIONS))
+
+FLAG_PROTECTED = 1
+
+def vault_stamp(path):
+    """Timbro del file delle note: (mtime in ns, dimensione)"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (0, 0)
+    return (st.st_mtime_ns, st.st_size)
+
+# ╔══════════════════╗
+# CODIFICA VARINT/DELTA
+# ╚══════════════════╝
+
+def encode_varints(values, out=None):
+    out = bytearray() if out is None else out
+    for v in values:
+        while v >= 0x80:
+            out.append(v & 0x7F | 0x80)
+            v >>= 7
+        out.append(v)
+    return out
+
+def decode_varints(data):
+    if data.isascii():
+        # Tutti i valori < 128 (posting densi): un byte per valore
+        return list(data)
+    values = []
+    n = shift = 0
+    for b in data:
+        n |= (b & 0x7F) << shift
+        if b & 0x80:
+            shift += 7
+        else:
+            values.append(n)
+            n = shift = 0
+    return values
+
+def encode_postings(ids, tfs=None):
+    """Id ordinati come differenze successive; con tfs, coppie (delta, frequenza)"""
+    deltas = [b - a for a, b in zip([0] + ids[:-1], ids)]
+    if tfs is None:
+        return encode_varints(deltas)
+    pairs = [v for pair in zip(deltas, tfs) for v in pair]
+    return encode_varints(pairs)
+
+# ╔══════════════╗
+# SCRITTURA INDICE
+# ╚══════════════╝
+
+def _pad(buf):
+    buf.extend(b"\0" * (-len(buf) % 8))
+
+def write_index(path, meta, docs, positions, entries, sealed):
+    """Scrive l'indice in un file temporaneo e lo sostituisce in modo atomico.
+
+    meta: generation, stamp, next_id, total_len, n_public
+    docs: record (id, impronta, lunghezza, n. trigrammi, flag, titolo normalizzato,
+          data di modifica in secondi) ordinati per id
+    positions: id nell'ordine della lista delle note
+    entries: (chiave bytes, id ordinati, frequenze o None) ordinati per chiave
+    sealed: coppie (id, token cifrato)
+    """
+    body = bytearray()
+    offsets = {}
+
+    def section(name, data):
+        _pad(body)
+        offsets[name] = HEADER.size + len(body)
+        body.extend(data)
+
+    section("positions", array("I", positions).tobytes())
+    section("ids", array("I", [d[0] for d in docs]).tobytes())
+    section("fingerprints", array("Q", [d[1] for d in docs]).tobytes())
+    section("doc_len", array("I", [d[2] for d in docs]).tobytes())
+    section("gram_count", array("I", [d[3] for d in docs]).tobytes())
+    section("modified", array("q", [d[6] for d in docs]).tobytes())
+    section("flags", bytes(d[4] for d in docs))
+    titles = [d[5].encode("utf-8") for d in docs]
+    section("title_offsets", array("I", [0, *accumulate(len(t) + 1 for t in titles)]).tobytes())
+    section("titles", b"\n".join(titles) + b"\n")
+    order = sorted(range(len(docs)), key=lambda k: (docs[k][5], docs[k][0]))
+    section("title_order", array("I", order).tobytes())
+
+    key_offsets, keys = array("I", [0]), bytearray()
+    post_offsets, df, postings = array("Q", [0]), array("I"), bytearray()
+    for key, ids, tfs in entries:
+        keys.extend(key)
+        key_offsets.append(len(keys))
+        postings.extend(encode_postings(ids, tfs))
+        post_offsets.append(len(postings))
+        df.append(len(ids))
+    section("key_offsets", key_offsets.tobytes())
+    section("keys", keys)
+    section("post_offsets", post_offsets.tobytes())
+    section("df", df.tobytes())
+    section("postings", postings)
+
+    blob = bytearray(struct.pack("<I", len(sealed)))
+    for note_id, token in sealed:
+        blob.extend(struct.pack("<II", note_id, len(token)))
+        blob.extend(token)
+    section("sealed", blob)
+
+    mtime_ns, size = meta["stamp"]
+    header = HEADER.pack(MAGIC, VERSION, meta["generation"], mtime_ns, size, meta["next_id"],
+                         len(positions), len(df), meta["total_len"], meta["n_public"],
+                         *(offsets[name] for name in SECTIONS))
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(body)
+    os.replace(tmp, path)
+
+def restamp_index(path, generation, stamp):
+    """Aggiorna solo generazione e timbro del vault, senza riscrivere l'indice"""
+    with open(path, "r+b") as f:
+        fields = list(HEADER.unpack(f.read(HEADER.size)))
+        fields[2], fields[3], fields[4] = generation, stamp[0], stamp[1]
+        f.seek(0)
+        f.write(HEADER.pack(*fields))
+
+# ╔══════════════════════════╗
+# LETTURA (MMAP, SENZA CARICARE)
+# ╚══════════════════════════╝
+
+class DiskIndex:
+    """Indice su disco mappato in memoria: ogni lettura decodifica solo ciò che serve"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            fields = HEADER.unpack_from(self.mm, 0)
+        except struct.error:
+            self.close()
+            raise ValueError("indice troncato")
+        magic, version = fields[0], fields[1]
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("formato dell'indice non riconosciuto")
+        (self.generation, mtime_ns, size, self.next_id, self.n_notes, self.n_keys,
+         self.total_len, self.n_public) = fields[2:10]
+        self.stamp = (mtime_ns, size)
+        self._slots = None
+        off = dict(zip(SECTIONS, fields[10:]))
+        view = memoryview(self.mm)
+        n, k = self.n_notes, self.n_keys
+
+        def column(name, fmt, count):
+            size = struct.calcsize(fmt) * count
+            return view[off[name]:off[name] + size].cast(fmt)
+
+        self.positions = column("positions", "I", n)
+        self.ids = column("ids", "I", n)
+        self.fingerprints = column("fingerprints", "Q", n)
+        self.doc_lens = column("doc_len", "I", n)
+        self.gram_counts = column("gram_count", "I", n)
+        self.modified = column("modified", "q", n)
+        self.flags = column("flags", "B", n)
+        self.title_offsets = column("title_offsets", "I", n + 1)
+        self.titles_at = off["titles"]
+        self.title_order = column("title_order", "I", n)
+        self.key_offsets = column("key_offsets", "I", k + 1)
+        self.keys_at = off["keys"]
+        self.post_offsets = column("post_offsets", "Q", k + 1)
+        self.dfs = column("df", "I", k)
+        self.postings_at = off["postings"]
+        self.sealed_at = off["sealed"]
+        self._views = [self.positions, self.ids, self.fingerprints, self.doc_lens,
+                       self.gram_counts, self.modified, self.flags, self.title_offsets,
+                       self.title_order, self.key_offsets, self.post_offsets, self.dfs, view]
+
+    def close(self):
+        for v in getattr(self, "_views", ()):
+            v.release()
+        self._views = []
+        self.mm.close()
+
+    # ── colonne delle note ──
+    def slot(self, note_id):
+        """Riga dell'id nelle colonne, o None se l'id non è nell'indice"""
+        if self._slots is None:
+            # Alla prima richiesta: le ricerche interrogano migliaia di id alla volta
+            self._slots = dict(zip(self.ids, range(self.n_notes)))
+        return self._slots.get(note_id)
+
+    def title(self, slot):
+        a = self.titles_at + self.title_offsets[slot]
+        b = self.titles_at + self.title_offsets[slot + 1] - 1
+        return self.mm[a:b].decode("utf-8")
+
+    def titles_containing(self, needle):
+        """Slot dei titoli che contengono needle, cercando direttamente nel blocco dei titoli"""
+        data = needle.encode("utf-8")
+        start = self.titles_at
+        end = self.titles_at + self.title_offsets[self.n_notes]
+        slots = []
+        pos = self.mm.find(data, start, end)
+        while pos >= 0:
+            slot = bisect_right(self.title_offsets, pos - start) - 1
+            slots.append(slot)
+            pos = self.mm.find(data, self.titles_at + self.title_offsets[slot + 1], end)
+        return slots
+
+    def titles_with_prefix(self, prefix):
+        """Genera (titolo, id) dei titoli che iniziano con prefix, in ordine alfabetico"""
+        order = self.title_order
+        lo, hi = 0, self.n_notes
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.title(order[mid]) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        for k in range(lo, self.n_notes):
+            title = self.title(order[k])
+            if not title.startswith(prefix):
+                break
+            yield title, self.ids[order[k]]
+
+    # ── dizionario e posting ──
+    def key(self, k):
+        return self.mm[self.keys_at + self.key_offsets[k]:self.keys_at + self.key_offsets[k + 1]]
+
+    def find_key(self, key):
+        lo, hi = 0, self.n_keys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def df(self, key):
+        """Numero di note nella lista della chiave (0 se la chiave non c'è)"""
+        k = self.find_key(key)
+        return self.dfs[k] if k < self.n_keys and self.key(k) == key else 0
+
+    def postings(self, key, with_tf=False):
+        """Id (e frequenze) della chiave; liste vuote se la chiave non c'è"""
+        k = self.find_key(key)
+        if k >= self.n_keys or self.key(k) != key:
+            return ([], []) if with_tf else []
+        values = decode_varints(self.mm[self.postings_at + self.post_offsets[k]:
+                                        self.postings_at + self.post_offsets[k + 1]])
+        if not with_tf:
+            return list(accumulate(values))
+        return list(accumulate(values[0::2])), values[1::2]
+
+    def keys_with_prefix(self, prefix):
+        """Genera (chiave, df) per le chiavi che iniziano con prefix, in ordine"""
+        k = self.find_key(prefix)
+        while k < self.n_keys:
+            key = self.key(k)
+            if not key.startswith(prefix):
+                break
+            yield key, self.dfs[k]
+            k += 1
+
+    def sealed(self):
+        """Coppie (id, token cifrato) delle note protette"""
+        pos = self.sealed_at
+        (count,) = struct.unpack_from("<I", self.mm, pos)
+        pos += 4
+        for _ in range(count):
+            note_id, length = struct.unpack_from("<II", self.mm, pos)
+            pos += 8
+            yield note_id, self.mm[pos:pos + length]
+            pos += length
@@ -0,0 +1,209 @@
+"""Annulla/ripeti per i widget Text: solo le modifiche, in un anello con budget in byte."""
+from collections import deque
+from contextlib import contextmanager
+from tkinter import TclError
+
+# Costo fisso stimato di un'operazione (indici e tupla), oltre al testo
+OP_OVERHEAD = 64
+
+# Comando Tcl al posto del widget: le modifiche passano da dispatch(), il resto
+# va al widget originale, e i suoi errori arrivano invariati al chiamante
+PROXY = """
+if {{$op in {{insert delete replace}}}} {{
+    lassign [{edit} $op {{*}}$args] code result
+    return -code $code $result
+}}
+{orig} $op {{*}}$args
+"""
+
+class UndoHistory:
+    """Cronologia delle modifiche di un widget Text, registrate da un proxy sul comando Tk.
+
+    Il comando Tcl del widget viene rinominato e sostituito da un proc Tcl:
+    ogni insert/delete/replace passa da dispatch(), viene registrato come
+    operazione (inizio, fine del testo tolto, testo tolto, fine del testo
+    messo, testo messo) ed eseguito sul widget vero; gli altri comandi vanno
+    dritti al widget senza passare da Python. Si tengono solo le differenze,
+    mai copie del documento.
+
+    Le operazioni di uno stesso evento formano un passo (es. scrivere
+    sopra una selezione); i caratteri scritti di seguito nella stessa
+    parola, e i backspace consecutivi, si fondono nel passo precedente.
+    Oltre budget byte o steps passi si dimenticano i più vecchi.
+    """
+
+    def __init__(self, widget, budget=2**20, steps=10000):
+        self.widget = widget
+        self.budget = budget
+        self.steps = steps
+        self.done = deque()     # passi annullabili, dal più vecchio; ogni passo è una lista di operazioni
+        self.undone = []        # passi ripetibili, l'ultimo annullato in fondo
+        self.size = 0           # byte stimati di done e undone
+        self.recording = True
+        self._open = False      # il passo in cima a done accoglie altre operazioni dello stesso evento
+        self._w = widget._w
+        self._orig = self._w + "_orig"
+        self._edit = self._w + "_edit"
+        widget.tk.call("rename", self._w, self._orig)
+        widget.tk.createcommand(self._edit, self.dispatch)
+        widget.tk.call("proc", self._w, "op args", PROXY.format(edit=self._edit, orig=self._orig))
+
+    def close(self):
+        """Rimette il comando originale del widget (prima di distruggerlo)"""
+        self.widget.tk.call("rename", self._w, "")
+        self.widget.tk.deletecommand(self._edit)
+        self.widget.tk.call("rename", self._orig, self._w)
+
+    def _call(self, *args):
+        return self.widget.tk.call(self._orig, *args)
+
+    # ── proxy del comando Tk ──
+    def dispatch(self, operation, *args):
+        """insert/delete/replace: (codice di ritorno Tcl, risultato) per il proc PROXY.
+
+        Un'eccezione non deve uscire da un callback Tcl (fermerebbe il
+        mainloop): l'errore del widget torna come codice e il proc lo rilancia
+        in Tcl, dove lo vede chi ha chiamato (i binding di Text usano catch,
+        il codice Python riceve il solito TclError).
+        """
+        try:
+            if self.recording:
+                return "ok", self._record(operation, args)
+            return "ok", self._call(operation, *args)
+        except TclError as e:
+            return "error", str(e)
+
+    def _record(self, operation, args):
+        if operation == "insert":
+            self._insert(args[0], "".join(args[1::2]), args[1:])
+        elif len(args) > 2 and operation == "delete":
+            # Più intervalli in un solo delete: raro, la cronologia non lo segue
+            self._call("delete", *args)
+            self.clear()
+        else:
+            start = self._call("index", args[0])
+            end = self._call("index", args[1] if len(args) > 1 else f"{start} + 1c")
+            if self._call("compare", end, ">", "end - 1c"):
+                end = self._call("index", "end - 1c")
+            if self._call("compare", start, "<", end):
+                deleted = self._call("get", start, end)
+                self._call("delete", start, end)
+                self._push((start, end, deleted, start, ""))
+            if operation == "replace":
+                self._insert(start, "".join(args[2::2]), args[2:])
+        return ""
+
+    def _insert(self, index, text, chunks):
+        if not text:
+            return
+        start, end = self._put(index, chunks)
+        self._push((start, start, "", end, text))
+
+    def _put(self, index, chunks):
+        """Inserisce e restituisce (inizio, fine) del testo messo, come li vede Tk"""
+        if self._call("compare", index, "==", "end"):
+            # Tk inserisce "alla fine" prima dell'ultimo a capo
+            index = "end - 1c"
+        self._call("mark", "set", "undo_start", index)
+        self._call("mark", "gravity", "undo_start", "left")
+        self._call("mark", "set", "undo_end", index)
+        self._call("mark", "gravity", "undo_end", "right")
+        self._call("insert", "undo_start", *chunks)
+        return self._call("index", "undo_start"), self._call("index", "undo_end")
+
+    # ── passi ──
+    def _push(self, op):
+        self.size -= sum(_cost(o) for step in self.undone for o in step)
+        self.undone.clear()
+        if self._open:
+            self.done[-1].append(op)
+            self.size += _cost(op)
+        elif self._merge(op):
+            self.size += _cost(op) - OP_OVERHEAD
+        else:
+            self.done.append([op])
+            self.size += _cost(op)
+            self._open = True
+            self.widget.after_idle(self._close_step)
+        while self.done and (self.size > self.budget or len(self.done) > self.steps):
+            self.size -= sum(_cost(o) for o in self.done.popleft())
+
+    def _close_step(self):
+        self._open = False
+
+    def _merge(self, op):
+        """Fonde op nel passo precedente se continua la stessa parola o la stessa cancellazione"""
+        if not self.done or len(self.done[-1]) != 1:
+            return False
+        start, deleted_end, deleted, inserted_end, inserted = self.done[-1][0]
+        new_start, new_deleted_end, new_deleted, new_inserted_end, new_inserted = op
+        if (inserted and not deleted and not new_deleted and new_start == inserted_end
+                and len(new_inserted) == 1 and new_inserted != "\n"
+                and (new_inserted.isspace() or not inserted[-1].isspace())):
+            self.done[-1][0] = (start, start, "", new_inserted_end, inserted + new_inserted)
+            return True
+        if (deleted and not inserted and not new_inserted and new_deleted_end == start
+                and len(new_deleted) == 1 and new_deleted != "\n"):
+            # Backspace: il nuovo testo tolto sta prima di quello già tolto
+            self.done[-1][0] = (new_start, deleted_end, new_deleted + deleted, new_start, "")
+            return True
+        return False
+
+    def undo(self):
+        if not self.done:
+            return "break"
+        step = self.done.pop()
+        for start, deleted_end, deleted, inserted_end, inserted in reversed(step):
+            self._call("delete", start, inserted_end)
+            self._call("insert", start, deleted)
+        self.undone.append(step)
+        self._open = False
+        self._show(step[0][0], step[0][1])
+        return "break"
+
+    def redo(self):
+        if not self.undone:
+            return "break"
+        step = self.undone.pop()
+        for start, deleted_end, deleted, inserted_end, inserted in step:
+            self._call("delete", start, deleted_end)
+            self._call("insert", start, inserted)
+        self.done.append(step)
+        self._open = False
+        self._show(step[-1][0], step[-1][3])
+        return "break"
+
+    def _show(self, start, end):
+        self._call("mark", "set", "insert", end)
+        self._call("see", start)
+        self._call("see", "insert")
+
+    # ── gestione ──
+    @contextmanager
+    def paused(self):
+        """Modifiche che non finiscono nella cronologia (caricamento del testo)"""
+        self.recording = False
+        try:
+            yield
+        finally:
+            self.recording = True
+
+    def clear(self):
+        self.done.clear()
+        self.undone.clear()
+        self.size = 0
+        self._open = False
+
+    def export(self):
+        """Passi da conservare chiudendo la scheda (si riapplicano solo allo stesso testo)"""
+        return list(self.done), list(self.undone)
+
+    def load(self, state):
+        done, undone = state
+        self.clear()
+        self.done.extend(done)
+        self.undone.extend(undone)
+        self.size = sum(_cost(o) for step in done + undone for o in step)
+
+def _cost(op):
+    return OP_OVERHEAD + len(op[2]) + len(op[4])
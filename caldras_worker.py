@@ -0,0 +1,268 @@
+"""Lavoro in background per la GUI: debounce e thread che non bloccano il mainloop di Tk."""
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+
+# ╔═══════════════════╗
+# DEBOUNCE DEGLI EVENTI
+# ╚═══════════════════╝
+
+class Debouncer:
+    """Raggruppa le chiamate ravvicinate: callback parte dopo delay ms senza nuove chiamate"""
+
+    def __init__(self, widget, delay, callback):
+        self.widget = widget
+        self.delay = delay
+        self.callback = callback
+        self._job = None
+
+    def __call__(self, *args):
+        self.cancel()
+        self._job = self.widget.after(self.delay, self._fire, args)
+
+    def _fire(self, args):
+        self._job = None
+        self.callback(*args)
+
+    def cancel(self):
+        if self._job is not None:
+            self.widget.after_cancel(self._job)
+            self._job = None
+
+# ╔═════════════════════════╗
+# UN SOLO LAVORO ALLA VOLTA
+# ╚═════════════════════════╝
+
+class LatestOnlyWorker:
+    """Thread che esegue solo la richiesta più recente.
+
+    Ogni submit annulla quella in corso (l'evento cancel passato alla funzione
+    viene impostato) e i risultati superati vengono scartati. Il risultato torna
+    sul thread di Tk: il mainloop lo raccoglie con after() e chiama on_done,
+    o on_error(eccezione) se func è fallita (in mancanza, report_callback_exception).
+    """
+
+    POLL_MS = 15
+
+    def __init__(self, widget, on_error=None):
+        self.widget = widget
+        self.on_error = on_error
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._seq = 0
+        self._cancel = threading.Event()
+        self._pending = False
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, func, on_done, on_error=None):
+        """Esegue func(cancel) nel thread e poi on_done(risultato) nel mainloop"""
+        self._cancel.set()
+        self._cancel = threading.Event()
+        self._seq += 1
+        self._requests.put((self._seq, func, self._cancel, on_done, on_error))
+        if not self._pending:
+            self._pending = True
+            self.widget.after(self.POLL_MS, self._poll)
+
+    def cancel(self):
+        """Annulla la richiesta in corso; il suo risultato non verrà consegnato"""
+        self._cancel.set()
+        self._seq += 1
+
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            # Delle richieste accumulate conta solo l'ultima
+            while not self._requests.empty():
+                request = self._requests.get_nowait()
+            seq, func, cancel, on_done, on_error = request
+            if cancel.is_set():
+                continue
+            try:
+                result, error = func(cancel), None
+            except Exception as e:
+                result, error = None, e
+            if not cancel.is_set():
+                self._results.put((seq, result, error, on_done, on_error))
+
+    def _poll(self):
+        while not self._results.empty():
+            seq, result, error, on_done, on_error = self._results.get_nowait()
+            if seq != self._seq:
+                continue
+            self._pending = False
+            if error is not None:
+                on_error = on_error or self.on_error
+                if on_error is not None:
+                    on_error(error)
+                else:
+                    self.widget.report_callback_exception(type(error), error, error.__traceback__)
+            elif on_done is not None:
+                on_done(result)
+        if self._pending and not self._cancel.is_set():
+            self.widget.after(self.POLL_MS, self._poll)
+        else:
+            self._pending = False
+
+# ╔════════════════════════════════╗
+# CODA DI I/O (SALVATAGGI, EXPORT)
+# ╚════════════════════════════════╝
+
+Job = namedtuple("Job", "func on_done on_error label")
+
+def _chain(first, then):
+    """Callback che chiama first e poi then (uno dei due può mancare)"""
+    if first is None:
+        return then
+    if then is None:
+        return first
+    def both(value):
+        first(value)
+        then(value)
+    return both
+
+class JobQueue:
+    """Lavori di I/O eseguiti da thread separati, in fila per chiave.
+
+    I lavori con la stessa chiave (es. "vault" o l'id di una nota) partono
+    uno alla volta nell'ordine di invio, e ciascuno solo dopo il callback del
+    precedente: due scritture dello stesso file non si sovrappongono e ogni
+    lavoro vede gli effetti di quello prima. Chiavi diverse vanno in parallelo.
+    on_done(risultato) e on_error(eccezione) vengono chiamate nel mainloop,
+    on_status(etichette) a ogni cambio dei lavori in corso.
+    """
+
+    POLL_MS = 30
+
+    def __init__(self, widget, workers=2, on_status=None, on_error=None):
+        self.widget = widget
+        self.on_status = on_status
+        self.on_error = on_error
+        self._lock = threading.Lock()
+        self._ready = queue.Queue()     # chiavi con un lavoro pronto a partire
+        self._pending = {}              # chiave → lavori in fila (il primo è in corso o pronto)
+        self._results = queue.Queue()
+        self._outstanding = 0           # lavori i cui callback non sono ancora stati chiamati
+        self._polling = False
+        for _ in range(workers):
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, key, func, on_done=None, on_error=None, label="", coalesce=False):
+        """Mette func() in fila sulla chiave key.
+
+        Con coalesce un lavoro ancora in attesa sulla stessa chiave viene
+        sostituito: basta l'ultimo, come per una scrittura dell'intero file.
+        I callback del lavoro sostituito si chiamano comunque, prima di quelli
+        nuovi e col risultato del lavoro che l'ha sostituito.
+        """
+        job = Job(func, on_done, on_error, label)
+        with self._lock:
+            jobs = self._pending.get(key)
+            if jobs is None:
+                self._pending[key] = deque([job])
+                self._ready.put(key)
+                self._outstanding += 1
+            elif coalesce and len(jobs) > 1:
+                replaced = jobs[-1]
+                jobs[-1] = job._replace(on_done=_chain(replaced.on_done, on_done),
+                                        on_error=_chain(replaced.on_error, on_error))
+            else:
+                jobs.append(job)
+                self._outstanding += 1
+        self._status()
+        if not self._polling:
+            self._polling = True
+            self.widget.after(self.POLL_MS, self._poll)
+
+    def busy(self, key):
+        """True se sulla chiave c'è un lavoro in corso o in attesa"""
+        with self._lock:
+            return key in self._pending
+
+    def labels(self):
+        """Etichette dei lavori in corso o in attesa, senza ripetizioni"""
+        with self._lock:
+            labels = [job.label for jobs in self._pending.values() for job in jobs if job.label]
+        return list(dict.fromkeys(labels))
+
+    def _run(self):
+        while True:
+            key = self._ready.get()
+            with self._lock:
+                job = self._pending[key][0]
+            try:
+                result, error = job.func(), None
+            except Exception as e:
+                result, error = None, e
+            self._results.put((key, job, result, error))
+
+    def _deliver(self):
+        while not self._results.empty():
+            key, job, result, error = self._results.get_nowait()
+            self._outstanding -= 1
+            try:
+                if error is not None:
+                    on_error = job.on_error or self.on_error
+                    if on_error is not None:
+                        on_error(error)
+                elif job.on_done is not None:
+                    job.on_done(result)
+            finally:
+                # Il lavoro successivo sulla chiave parte solo dopo il callback del precedente
+                with self._lock:
+                    jobs = self._pending[key]
+                    jobs.popleft()
+                    if jobs:
+                        self._ready.put(key)
+                    else:
+                        del self._pending[key]
+        self._status()
+
+    def _poll(self):
+        self._deliver()
+        if self._outstanding:
+            self.widget.after(self.POLL_MS, self._poll)
+        else:
+            self._polling = False
+
+    def _status(self):
+        if self.on_status is not None:
+            self.on_status(self.labels())
+
+    def drain(self):
+        """Attende la fine di tutti i lavori, compresi quelli inviati dai callback (uscita)"""
+        while self._outstanding:
+            self._deliver()
+            time.sleep(0.01)
+
+# ╔═════════════════════╗
+# CARICAMENTO ALL'AVVIO
+# ╚═════════════════════╝
+
+class BackgroundLoad:
+    """Esegue func in un thread mentre lo splash è a schermo.
+
+    done viene impostato a lavoro finito; result() aspetta e restituisce
+    il valore, o rilancia nel thread chiamante l'errore del caricamento.
+    """
+
+    def __init__(self, func):
+        self.done = threading.Event()
+        self._value = None
+        self._error = None
+        threading.Thread(target=self._run, args=(func,), daemon=True).start()
+
+    def _run(self, func):
+        try:
+            self._value = func()
+        except BaseException as e:
+            self._error = e
+        finally:
+            self.done.set()
+
+    def result(self):
+        self.done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Query strutturate sull'indice e cache dei risultati."""
+import pytest
+
+from caldras_query import dependencies, run_query
+from caldras_search import SearchIndex
+
+# Cifratura finta ma reversibile, come in test_search.py
+def encrypt(text, password):
+    return f"🔒{password}:{text[::-1]}".encode("utf-8")
+
+def decrypt(token, password):
+    prefix = f"🔒{password}:".encode("utf-8")
+    if not token.startswith(prefix):
+        raise ValueError("password errata")
+    return token[len(prefix):].decode("utf-8")[::-1]
+
+@pytest.fixture
+def notes():
+    return [
+        ("Diario di bordo", "Rotta verso la cometa di Halley #viaggio", None),
+        ("Codici", encrypt("Il sigillo segreto è zafferano #privato", "pw"), "pw"),
+        ("Lista della spesa", "latte, pane, zafferano", None),
+    ]
+
+def build(notes):
+    return SearchIndex.build(notes, decrypt, encrypt)
+
+def test_structured_query(notes):
+    index = build(notes)
+    assert run_query(index, notes, '"sigillo segreto"')[0] == [1]
+    assert run_query(index, notes, 'zafferano -"sigillo segreto"')[0] == [2]
+    assert run_query(index, notes, "tag:viaggio")[0] == [0]
+    assert run_query(index, notes, "locked:yes")[0] == [1]
+
+def test_query_cache_invalidated_only_by_related_changes(notes):
+    index = build(notes)
+    calls = []
+
+    def search(query):
+        def compute():
+            calls.append(query)
+            return index.search(query), []
+        return index.cached((query, ()), compute, lambda result: (result[0], *dependencies(query)))[0]
+
+    assert search("halley") == [0]
+    assert search("halley") == [0] and len(calls) == 1
+    # Una nota che non contiene "halley" (né nei termini né nei trigrammi del titolo) non invalida
+    notes[2] = ("Lista della spesa", "latte e uova", None)
+    index.update(2, notes[2])
+    assert search("halley") == [0] and len(calls) == 1
+    # Una nota che ora lo contiene sì
+    notes[2] = ("Lista della spesa", "latte e la cometa di Halley", None)
+    index.update(2, notes[2])
+    assert sorted(search("halley")) == [0, 2] and len(calls) == 2
+    # Anche una nota del risultato che cambia
+    notes[0] = ("Diario di bordo", "solo Giove", None)
+    index.update(0, notes[0])
+    assert search("halley") == [2] and len(calls) == 3
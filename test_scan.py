@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""Ricerca regex/sottostringa sul buffer contiguo: testo non ASCII, righe e bordi delle note."""
+import pytest
+
+from caldras_scan import ScanCorpus
+
+@pytest.fixture
+def corpus():
+    return ScanCorpus([
+        (10, "Città bella\nperché no"),
+        (11, "PERCHÉ sì\nè già così"),
+        (12, "niente da vedere\ncittadino"),
+    ])
+
+def hits(corpus, pattern, **kwargs):
+    return [(h.note_id, h.line_no, h.line) for h in corpus.scan(pattern, processes=0, **kwargs)]
+
+def test_ignore_case_folds_accented_letters(corpus):
+    assert hits(corpus, "perché") == [(10, 2, "perché no"), (11, 1, "PERCHÉ sì")]
+    assert hits(corpus, "perché", regex=False) == [(10, 2, "perché no"), (11, 1, "PERCHÉ sì")]
+
+def test_word_classes_match_accented_letters(corpus):
+    assert hits(corpus, r"\bcittà\b") == [(10, 1, "Città bella")]
+    assert hits(corpus, r"citt\w\b") == [(10, 1, "Città bella")]
+    assert hits(corpus, r"^\w+ sì$") == [(11, 1, "PERCHÉ sì")]
+
+def test_exact_substring_is_case_sensitive(corpus):
+    assert hits(corpus, "già", regex=False, ignore_case=False) == [(11, 2, "è già così")]
+    assert hits(corpus, "GIÀ", regex=False, ignore_case=False) == []
+
+def test_match_does_not_cross_notes(corpus):
+    assert hits(corpus, r"no\W+PERCHÉ") == []
+
+def test_limit(corpus):
+    assert len(hits(corpus, "i", limit=2)) == 2
+
+def test_parallel_scan_gives_the_same_lines(corpus):
+    corpus.BLOCK_SIZE = 1
+    expected = hits(corpus, r"\w+à")
+    assert [(h.note_id, h.line_no, h.line) for h in corpus.scan(r"\w+à", processes=2)] == expected
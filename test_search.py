@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""Indice di ricerca: salvataggio e riapertura, note protette, allineamento al vault."""
+import threading
+
+import pytest
+
+from caldras_search import SearchIndex
+from caldras_store import decode_varints, encode_postings, encode_varints
+
+# Cifratura finta ma reversibile: basta che il testo in chiaro non finisca su disco
+def encrypt(text, password):
+    return f"🔒{password}:{text[::-1]}".encode("utf-8")
+
+def decrypt(token, password):
+    prefix = f"🔒{password}:".encode("utf-8")
+    if not token.startswith(prefix):
+        raise ValueError("password errata")
+    return token[len(prefix):].decode("utf-8")[::-1]
+
+STAMP = (1_700_000_000 * 10**9, 1234)
+
+@pytest.fixture
+def notes():
+    return [
+        ("Diario di bordo", "Rotta verso la cometa di Halley #viaggio", None),
+        ("Codici", encrypt("Il sigillo segreto è zafferano #privato", "pw"), "pw"),
+        ("Lista della spesa", "latte, pane, zafferano", None),
+    ]
+
+def build(notes):
+    return SearchIndex.build(notes, decrypt, encrypt)
+
+def reopen(path, notes, stamp=STAMP):
+    return SearchIndex.open(str(path), notes, stamp, decrypt, encrypt)
+
+# ╔══════════════════════╗
+# SALVATAGGIO E RIAPERTURA
+# ╚══════════════════════╝
+
+def test_save_and_reopen_round_trip(tmp_path, notes):
+    index = build(notes)
+    path = tmp_path / "note.idx"
+    index.save(str(path), notes, STAMP)
+    reopened = reopen(path, notes)
+    assert reopened.base is not None
+    assert reopened.ids == index.ids
+    assert reopened.search("cometa") == index.search("cometa") == [0]
+    assert sorted(reopened.search("zafferano")) == [1, 2]
+    assert reopened.filter_titles("spesa") == [2]
+    assert reopened.notes_with_tags(["#viaggio"]) == [0]
+    assert reopened.tag_counts() == index.tag_counts()
+
+def test_protected_terms_are_sealed_on_disk(tmp_path, notes):
+    path = tmp_path / "note.idx"
+    build(notes).save(str(path), notes, STAMP)
+    data = path.read_bytes()
+    assert b"sigillo" not in data and b"privato" not in data
+    # Con la password della nota termini e tag tornano disponibili
+    reopened = reopen(path, notes)
+    assert reopened.search("sigillo") == [1]
+    assert reopened.notes_with_tags(["privato"]) == [1]
+
+def test_save_does_not_decrypt_protected_notes_again(tmp_path, notes):
+    calls = []
+
+    def counting_decrypt(token, password):
+        calls.append(token)
+        return decrypt(token, password)
+    index = SearchIndex.build(notes, counting_decrypt, encrypt)
+    calls.clear()
+    path = tmp_path / "note.idx"
+    index.save(str(path), notes, STAMP)
+    index.save(str(path), notes, (STAMP[0] + 1, STAMP[1]))
+    assert calls == []
+    assert index.search("sigillo") == [1]
+    assert index.notes_with_tags(["privato"]) == [1]
+
+def test_saving_unchanged_index_only_restamps(tmp_path, notes):
+    path = tmp_path / "note.idx"
+    build(notes).save(str(path), notes, STAMP)
+    reopened = reopen(path, notes)
+    generation = reopened.generation
+    stamp = (STAMP[0] + 1, STAMP[1])
+    reopened.save(str(path), notes, stamp)
+    again = reopen(path, notes, stamp)
+    assert again.base is not None and again.generation == generation
+    assert again.search("cometa") == [0]
+
+def test_unreadable_index_is_rebuilt(tmp_path, notes):
+    path = tmp_path / "note.idx"
+    path.write_bytes(b"non un indice")
+    index = reopen(path, notes)
+    assert index.base is None
+    assert index.search("cometa") == [0]
+
+# ╔═════════════════════════════╗
+# VAULT CAMBIATO FUORI DALLA SESSIONE
+# ╚═════════════════════════════╝
+
+def test_stale_stamp_catches_up_by_fingerprint(tmp_path, notes):
+    path = tmp_path / "note.idx"
+    index = build(notes)
+    index.save(str(path), notes, STAMP)
+    ids = dict(zip((n[0] for n in notes), index.ids))
+    # Un'altra versione di Caldras ha cambiato una nota, eliminata un'altra e aggiunta una nuova
+    changed = [
+        ("Diario di bordo", "Rotta verso Giove #viaggio", None),
+        notes[1],
+        ("Nuova", "appunti su Saturno", None),
+    ]
+    reopened = reopen(path, changed, (STAMP[0] + 5, 999))
+    assert reopened.search("cometa") == []
+    assert reopened.search("giove") == [reopened.ids[0]]
+    assert reopened.search("saturno") == [reopened.ids[2]]
+    assert reopened.filter_titles("spesa") == []
+    # La nota protetta, non cambiata, conserva id e termini sigillati
+    assert reopened.ids[1] == ids["Codici"]
+    assert reopened.search("sigillo") == [ids["Codici"]]
+    assert len(set(reopened.ids)) == 3
+
+# ╔═══════════════════════╗
+# MODIFICHE ALLE NOTE PROTETTE
+# ╚═══════════════════════╝
+
+def test_update_protected_note_with_plaintext(notes):
+    index = build(notes)
+    notes[1] = ("Codici", encrypt("nuova combinazione #cassaforte", "pw"), "pw")
+    index.update(1, notes[1], "nuova combinazione #cassaforte")
+    assert index.search("sigillo") == []
+    assert index.search("combinazione") == [1]
+    assert index.notes_with_tags(["privato"]) == []
+    assert index.notes_with_tags(["cassaforte"]) == [1]
+
+def test_update_of_deleted_note_is_ignored(notes):
+    index = build(notes)
+    note_id = index.ids[1]
+    del notes[1]
+    index.delete(1)
+    assert index.update_id(note_id, ("Codici", "altro", None)) is None
+    assert index.search("altro") == []
+
+# ╔═══════════════════════╗
+# NOTE ELIMINATE
+# ╚═══════════════════════╝
+
+def test_delete_protected_note_shifts_positions(tmp_path, notes):
+    index = build(notes)
+    del notes[1]
+    index.delete(1)
+    assert index.search("sigillo") == []
+    assert index.position(2) == 1
+    path = tmp_path / "note.idx"
+    index.save(str(path), notes, STAMP)
+    reopened = reopen(path, notes)
+    assert reopened.ids == [0, 2]
+    assert reopened.search("sigillo") == []
+    assert sorted(reopened.search("zafferano")) == [2]
+
+# ╔════════════════════════╗
+# TESTI IN CHIARO DELLA SESSIONE
+# ╚════════════════════════╝
+
+def test_protected_snippet_and_grep_need_unlock(notes):
+    index = build(notes)
+    unlocked = {}
+    session = lambda note: unlocked.get(note[1])
+    assert index.snippet(1, notes[1], "sigillo ", session) == ("", [])
+    assert [hit.note_id for hit in index.grep(notes, "zafferano", unlocked=session)] == [2]
+    unlocked[notes[1][1]] = decrypt(notes[1][1], "pw")
+    text, spans = index.snippet(1, notes[1], "sigillo ", session)
+    assert "sigillo" in text and spans
+    assert sorted(hit.note_id for hit in index.grep(notes, "zafferano", unlocked=session)) == [1, 2]
+    # Blocco: niente più estratti né righe della nota protetta
+    unlocked.clear()
+    index.forget_plaintext()
+    assert index.snippet(1, notes[1], "sigillo ", session) == ("", [])
+    assert [hit.note_id for hit in index.grep(notes, "zafferano", unlocked=session)] == [2]
+
+# ╔════════════════════╗
+# LETTURE SENZA LOCK
+# ╚════════════════════╝
+
+def test_titles_readable_while_the_lock_is_held(tmp_path, notes):
+    index = build(notes)
+    notes.append(("Diario di viaggio", "", None))
+    index.add(notes[-1])
+    path = tmp_path / "note.idx"
+    index.save(str(path), notes, STAMP)
+    index.update(0, ("Bordo libero", "", None))
+    held, release = threading.Event(), threading.Event()
+
+    def worker():
+        with index.lock:
+            held.set()
+            release.wait(5)
+    thread = threading.Thread(target=worker)
+    thread.start()
+    held.wait(5)
+    try:
+        # Elenco e completamenti del thread Tk non aspettano la ricerca in corso
+        assert index.complete("diario") == [3]
+        assert index.complete("bordo") == [0]
+        assert index.position(index.ids[2]) == 2
+    finally:
+        release.set()
+        thread.join()
+
+# ╔═══════════════════╗
+# CODIFICA SU DISCO
+# ╚═══════════════════╝
+
+@pytest.mark.parametrize("ids", [[0], [1, 2, 3], [5, 130, 20000, 2**40]])
+def test_varint_postings_round_trip(ids):
+    assert decode_varints(bytes(encode_varints(ids))) == ids
+    tfs = [1 + i * 200 for i in range(len(ids))]
+    pairs = decode_varints(bytes(encode_postings(ids, tfs)))
+    deltas, decoded_tfs = pairs[::2], pairs[1::2]
+    assert decoded_tfs == tfs
+    assert [sum(deltas[:i + 1]) for i in range(len(deltas))] == ids
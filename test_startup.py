@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Tempo di import di ogni versione: niente moduli pesanti all'avvio e budget in millisecondi.
+
+Ogni punto d'ingresso si importa in un processo nuovo con -X importtime. Gli
+script senza estensione o col trattino non sono importabili col loro nome:
+se ne importa una copia con un nome valido. Se manca una dipendenza leggera
+(tkinter...) il test di quella versione viene saltato.
+"""
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Budget generosi: servono a fermare un import pesante, non a misurare la macchina
+BUDGET_MS = {
+    "caldras": 250,
+    "caldras.py": 250,
+    "wcaldras.py": 250,
+    "caldras-gui": 300,
+    "caldras-gui.py": 300,
+    "caldras_gui.py": 300,
+    "caldras_alien": 300,
+    "caldras_gui_alien.py": 300,
+    "wcaldras-gui.py": 300,
+    "wcaldras_gui.py": 300,
+}
+# Da importare solo al primo uso (PDF, cifratura, anteprima con Rich, colori del terminale)
+HEAVY = ("weasyprint", "cryptography", "markdown", "rich", "colorama")
+
+LINE_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def module_name(entry, tmp_path):
+    """Nome con cui importare entry; per gli script non importabili, una copia in tmp_path"""
+    name, ext = os.path.splitext(entry)
+    if ext == ".py" and name.isidentifier():
+        return name
+    name = "entry_" + re.sub(r"\W", "_", entry)
+    shutil.copyfile(os.path.join(HERE, entry), tmp_path / f"{name}.py")
+    return name
+
+def import_times(entry, tmp_path):
+    """(nome del modulo, {modulo: microsecondi cumulativi}) per un import a freddo di entry"""
+    module = module_name(entry, tmp_path)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(tmp_path), HERE]))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=HERE, env=env, capture_output=True, text=True, timeout=60)
+    if result.returncode != 0:
+        missing = re.search(r"ModuleNotFoundError: No module named '([^']+)'", result.stderr)
+        if missing and missing.group(1).split(".")[0] in HEAVY:
+            # Qui non è installato, ma intanto si vede che viene importato all'avvio
+            pytest.fail(f"{entry} importa all'avvio: {missing.group(1)}")
+        if missing:
+            pytest.skip(f"dipendenza mancante: {missing.group(1)}")
+        pytest.fail(result.stderr)
+    times = {}
+    for m in LINE_RE.finditer(result.stderr):
+        times[m.group(4)] = int(m.group(2))
+    return module, times
+
+@pytest.mark.parametrize("entry", sorted(BUDGET_MS))
+def test_no_heavy_imports(entry, tmp_path):
+    _, times = import_times(entry, tmp_path)
+    loaded = sorted({name.split(".")[0] for name in times} & set(HEAVY))
+    assert not loaded, f"{entry} importa all'avvio: {', '.join(loaded)}"
+
+@pytest.mark.parametrize("entry", sorted(BUDGET_MS))
+def test_import_budget(entry, tmp_path):
+    module, times = import_times(entry, tmp_path)
+    ms = times[module] / 1000
+    assert ms <= BUDGET_MS[entry], f"import di {entry}: {ms:.0f} ms (budget {BUDGET_MS[entry]} ms)"
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Annulla/ripeti sul widget Text vero: passi, fusione delle parole, budget e ripristino.
+
+Serve un display: senza, i test vengono saltati.
+"""
+import pytest
+
+tk = pytest.importorskip("tkinter")
+
+from caldras_undo import OP_OVERHEAD, UndoHistory
+
+@pytest.fixture
+def root():
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("nessun display")
+    root.withdraw()
+    yield root
+    root.destroy()
+
+def editor(root, **kwargs):
+    widget = tk.Text(root)
+    return widget, UndoHistory(widget, **kwargs)
+
+def content(widget):
+    return widget.get("1.0", "end - 1c")
+
+def type_text(root, widget, text):
+    """Come da tastiera: un insert per carattere, ciascuno in un evento a sé"""
+    for ch in text:
+        widget.insert("insert", ch)
+        root.update_idletasks()
+
+def test_words_merge_into_steps(root):
+    widget, history = editor(root)
+    type_text(root, widget, "ciao mondo")
+    assert len(history.done) == 2
+    history.undo()
+    assert content(widget) == "ciao "
+    history.undo()
+    assert content(widget) == ""
+    history.redo()
+    history.redo()
+    assert content(widget) == "ciao mondo"
+
+def test_backspaces_merge(root):
+    widget, history = editor(root)
+    type_text(root, widget, "parola")
+    for _ in range(3):
+        widget.delete("insert - 1c")
+        root.update_idletasks()
+    assert content(widget) == "par"
+    history.undo()
+    assert content(widget) == "parola"
+
+def test_replace_is_one_step(root):
+    widget, history = editor(root)
+    with history.paused():
+        widget.insert("1.0", "vecchio testo")
+    widget.replace("1.0", "1.7", "nuovo")
+    root.update_idletasks()
+    assert content(widget) == "nuovo testo"
+    history.undo()
+    assert content(widget) == "vecchio testo"
+    history.redo()
+    assert content(widget) == "nuovo testo"
+
+def test_new_edit_clears_redo(root):
+    widget, history = editor(root)
+    type_text(root, widget, "uno due")
+    history.undo()
+    type_text(root, widget, "tre")
+    assert history.undone == []
+    assert history.redo() == "break"
+    assert content(widget) == "uno tre"
+
+def test_paused_edits_are_not_recorded(root):
+    widget, history = editor(root)
+    with history.paused():
+        widget.insert("1.0", "caricato dal file")
+    assert not history.done
+    history.undo()
+    assert content(widget) == "caricato dal file"
+
+def test_budget_drops_oldest_steps(root):
+    budget = 4 * (OP_OVERHEAD + 10)
+    widget, history = editor(root, budget=budget)
+    for i in range(20):
+        widget.insert("end", f"riga {i:04d}\n")
+        root.update_idletasks()
+    assert history.size <= budget
+    assert 0 < len(history.done) < 20
+    while history.done:
+        history.undo()
+    # Le righe più vecchie non si possono più annullare
+    assert content(widget).startswith("riga 0000\n")
+
+def test_export_and_load(root):
+    widget, history = editor(root)
+    type_text(root, widget, "salva questo")
+    state = history.export()
+    text = content(widget)
+    history.close()
+    widget.destroy()
+    widget, history = editor(root)
+    with history.paused():
+        widget.insert("1.0", text)
+    history.load(state)
+    history.undo()
+    assert content(widget) == "salva "
+
+def test_widget_errors_reach_the_caller(root):
+    widget, history = editor(root)
+    type_text(root, widget, "testo")
+    with pytest.raises(tk.TclError):
+        widget.insert("non un indice", "x")
+    with pytest.raises(tk.TclError):
+        widget.index("nemmeno questo")
+    # Niente registrato per la modifica fallita, e il widget funziona ancora
+    assert len(history.done) == 1
+    assert content(widget) == "testo"
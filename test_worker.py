@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Coda dei lavori di I/O: ordine per chiave e lavori sostituiti (coalesce)."""
+import threading
+
+from caldras_worker import JobQueue
+
+class Widget:
+    """Al posto del widget Tk: i callback li consegna drain()"""
+
+    def after(self, ms, func):
+        pass
+
+def test_jobs_on_the_same_key_run_in_order():
+    jobs = JobQueue(Widget())
+    done = []
+    for i in range(5):
+        jobs.submit("vault", lambda i=i: i, done.append)
+    jobs.drain()
+    assert done == [0, 1, 2, 3, 4]
+    assert not jobs.busy("vault")
+
+def test_coalesced_job_keeps_the_replaced_callbacks():
+    jobs = JobQueue(Widget())
+    started, release = threading.Event(), threading.Event()
+
+    def first():
+        started.set()
+        release.wait(5)
+        return "primo"
+    runs, done = [], []
+    jobs.submit("vault", first, done.append, coalesce=True)
+    started.wait(5)
+    # In attesa dietro al primo: il secondo viene sostituito dal terzo e non parte
+    jobs.submit("vault", lambda: runs.append(2) or "secondo", lambda r: done.append(("compatta", r)),
+                coalesce=True)
+    jobs.submit("vault", lambda: runs.append(3) or "terzo", done.append, coalesce=True)
+    release.set()
+    jobs.drain()
+    assert runs == [3]
+    assert done == ["primo", ("compatta", "terzo"), "terzo"]
+
+def test_coalesced_job_error_reaches_both_callbacks():
+    jobs = JobQueue(Widget())
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def fail():
+        raise OSError("disco pieno")
+    jobs.submit("vault", lambda: started.set() or release.wait(5))
+    started.wait(5)
+    jobs.submit("vault", fail, on_error=lambda e: errors.append(("primo", str(e))), coalesce=True)
+    jobs.submit("vault", fail, on_error=lambda e: errors.append(("secondo", str(e))), coalesce=True)
+    release.set()
+    jobs.drain()
+    assert errors == [("primo", "disco pieno"), ("secondo", "disco pieno")]
@@ -1,14 +1,8 @@
 #!/usr/bin/env python3
 import tkinter as tk
 from tkinter import messagebox, simpledialog, filedialog
-import pickle, os, base64, hashlib, markdown, subprocess, tempfile
-from cryptography.fernet import Fernet
-try:
-    from weasyprint import HTML
-    WEASYPRINT_AVAILABLE = True
-except ImportError:
-    HTML = None
-    WEASYPRINT_AVAILABLE = False
+import pickle, os, base64, hashlib, subprocess, tempfile
+# cryptography, markdown e weasyprint si importano al primo uso
 
 
 font_console = ("Cascadia Code", 11)  # fallback: ("Courier New", 11)
@@ -18,10 +12,12 @@ def get_key(password):
     return base64.urlsafe_b64encode(hashlib.sha256(password.encode()).digest())
 
 def encrypt_text(text, password):
+    from cryptography.fernet import Fernet
     return Fernet(get_key(password)).encrypt(text.encode())
 
 def generate_pdf(content_md, filename):
         try:
+            import markdown
             html_body = markdown.markdown(content_md)
             style = """
             <style>
@@ -45,7 +41,11 @@ def generate_pdf(content_md, filename):
             </html>
         """
 
-            if WEASYPRINT_AVAILABLE:
+            try:
+                from weasyprint import HTML
+            except ImportError:
+                HTML = None
+            if HTML:
                 HTML(string=full_html).write_pdf(filename)
                 return True, "WeasyPrint"
             else:
@@ -62,6 +62,7 @@ def generate_pdf(content_md, filename):
             return False, str(e)
 
 def decrypt_text(ciphertext, password):
+    from cryptography.fernet import Fernet
     return Fernet(get_key(password)).decrypt(ciphertext).decode()
 
 def load_notes():
@@ -185,6 +186,7 @@ class CaldrasApp(tk.Tk):
             )
 
     def update_preview(self, event=None):
+        import markdown
         md = self.text_area.get("1.0", tk.END)
         html = markdown.markdown(md)
         clean = self.clean_html(html)
@@ -8,26 +8,18 @@ import time
 import tempfile
 import random
 import datetime
-from cryptography.fernet import Fernet
-# from weasyprint import HTML
-from colorama import Fore, Style, init
-from rich.console import Console
-from rich.markdown import Markdown
-import markdown
-try:
-    from weasyprint import HTML
-    WEASYPRINT_AVAILABLE = True
-except ImportError:
-    WEASYPRINT_AVAILABLE = False
-    print("⚠️  WeasyPrint non disponibile. Funzionalità PDF disabilitate.")
-from colorama import Fore, Style, init
-
-init(autoreset=True)
+# cryptography, markdown, rich e weasyprint si importano al primo uso
+
+# colorama si carica in colori(), all'avvio del menu: chi importa il modulo non la paga
+Fore = Style = None
+
+def colori():
+    global Fore, Style
+    from colorama import Fore, Style, init
+    init(autoreset=True)
 
 NOTE_FILE = ".note.dat"
 
-# Inizializza Rich console
-console = Console()
 
 # ╔═══════════════╗
 # VISUAL STYLE FX
@@ -76,8 +68,10 @@ def stampa_nota_markdown(titolo, contenuto, protetta=False):
     print(f"{Fore.CYAN}📋 VISUALIZZAZIONE MARKDOWN\n")
     
     # Usa Rich per renderizzare il markdown
+    from rich.console import Console
+    from rich.markdown import Markdown
     md = Markdown(contenuto)
-    console.print(md)
+    Console().print(md)
     print()
 
 def codice_galattico():
@@ -107,10 +101,12 @@ def get_key_from_password(password):
     return base64.urlsafe_b64encode(hashlib.sha256(password.encode()).digest())
 
 def encrypt_text(text, password):
+    from cryptography.fernet import Fernet
     key = get_key_from_password(password)
     return Fernet(key).encrypt(text.encode())
 
 def decrypt_text(ciphertext, password):
+    from cryptography.fernet import Fernet
     key = get_key_from_password(password)
     return Fernet(key).decrypt(ciphertext).decode()
 
@@ -269,7 +265,9 @@ def aggiungi_contenuto(notes):
         print("⚠️ Errore nell'aggiunta.")
 
 def esporta_pdf(notes):
-    if not WEASYPRINT_AVAILABLE:
+    try:
+        from weasyprint import HTML
+    except ImportError:
         print("⚠️ Funzionalità PDF disabilitate. WeasyPrint non è disponibile.")
         return
     elenca_note(notes)
@@ -284,6 +282,7 @@ def esporta_pdf(notes):
                 return
             access_granted()
             contenuto = decrypt_text(contenuto, pw)
+        import markdown
         contenuto_html = markdown.markdown(contenuto)
         html_body = f"<h1>{titolo}</h1>{contenuto_html}<hr><p style='font-size:10pt;color:#999;'>🛰️ Sigillo Caldras: C-LDRS.{datetime.datetime.now().strftime('%m%d')}.∞</p>"
         html = f"<html><head><style>body{{font-family:sans-serif;padding:2em;}}</style></head><body>{html_body}</body></html>"
@@ -308,6 +307,7 @@ def esporta_pdf_alternativa(notes):
             contenuto = decrypt_text(contenuto, pw)
 
         # ✅ Conversione Markdown → HTML
+        import markdown
         contenuto_html = markdown.markdown(contenuto)
 
         html_body = f"<h1>{titolo}</h1>{contenuto_html}<hr><p style='font-size:10pt;color:#999;'>🛰️ Sigillo Caldras: C-LDRS.{datetime.datetime.now().strftime('%m%d')}.∞</p>"
@@ -396,4 +396,5 @@ def menu():
 
 # PUNTO DI INGRESSO
 if __name__ == "__main__":
+    colori()
     menu()
\ No newline at end of file
@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 import tkinter as tk
 from tkinter import messagebox, simpledialog, filedialog
-import pickle, os, base64, hashlib, markdown, json, tempfile, subprocess
-from cryptography.fernet import Fernet
+import pickle, os, base64, hashlib, json, tempfile, subprocess, shutil
+import importlib.util
 
 # 🛰️ Supporto PDF automatico
 def check_pdf_engines():
@@ -27,16 +27,35 @@ def check_pdf_engines():
     
     return weasyprint_available, wkhtmltopdf_available
 
-# Verifica motori PDF disponibili
-WEASYPRINT_AVAILABLE, WKHTMLTOPDF_AVAILABLE = check_pdf_engines()
+def pdf_engines_stamp():
+    """Impronta dei motori installati (percorso e data di WeasyPrint e di wkhtmltopdf), senza importarli"""
+    stamp = []
+    spec = importlib.util.find_spec("weasyprint")
+    for path in (spec.origin if spec else None, shutil.which("wkhtmltopdf")):
+        stamp.append([path, os.path.getmtime(path) if path else None])
+    return stamp
 
-if WEASYPRINT_AVAILABLE:
-    from weasyprint import HTML
-    PDF_ENGINE = "weasyprint"
-elif WKHTMLTOPDF_AVAILABLE:
-    PDF_ENGINE = "wkhtmltopdf"
-else:
-    PDF_ENGINE = "none"
+def pdf_engine(config):
+    """Motore PDF da usare, deciso al primo export.
+
+    La verifica (import di WeasyPrint, wkhtmltopdf --version) costa anche
+    un secondo: il risultato resta in .caldras.conf e vale finché
+    l'impronta dei motori installati non cambia.
+    """
+    stamp = pdf_engines_stamp()
+    cached = config.get("pdf_engines")
+    if cached and cached.get("stamp") == stamp:
+        weasyprint_available, wkhtmltopdf_available = cached["weasyprint"], cached["wkhtmltopdf"]
+    else:
+        weasyprint_available, wkhtmltopdf_available = check_pdf_engines()
+        config["pdf_engines"] = {"stamp": stamp, "weasyprint": weasyprint_available,
+                                 "wkhtmltopdf": wkhtmltopdf_available}
+        save_config(config)
+    if weasyprint_available:
+        return "weasyprint"
+    if wkhtmltopdf_available:
+        return "wkhtmltopdf"
+    return "none"
 
 CONFIG_FILE = ".caldras.conf"
 NOTE_FILE = ".note.dat"
@@ -56,9 +75,11 @@ def get_key(password):
     return base64.urlsafe_b64encode(hashlib.sha256(password.encode()).digest())
 
 def encrypt_text(text, password):
+    from cryptography.fernet import Fernet
     return Fernet(get_key(password)).encrypt(text.encode())
 
 def decrypt_text(ciphertext, password):
+    from cryptography.fernet import Fernet
     return Fernet(get_key(password)).decrypt(ciphertext).decode()
 
 def load_notes():
@@ -72,7 +93,8 @@ def save_notes(notes):
     with open(NOTE_FILE, "wb") as f:
         pickle.dump(notes, f)
 
-def generate_pdf(content_md, filename):
+def generate_pdf(content_md, filename, config):
+    import markdown
     html_body = markdown.markdown(content_md)
     style = """
     <meta charset="utf-8">
@@ -110,14 +132,16 @@ def generate_pdf(content_md, filename):
     html_body = markdown.markdown(content_md)
     full_html = f"<html><head>{style}</head><body>{html_body}</body></html>"
     # Controlla se hai un motore PDF disponibile
-    if PDF_ENGINE == "none":
+    engine = pdf_engine(config)
+    if engine == "none":
         return False, "Nessun motore PDF disponibile. Installa WeasyPrint (pip install weasyprint) o wkhtmltopdf."
     
     try:
-        if PDF_ENGINE == "weasyprint" and WEASYPRINT_AVAILABLE:
+        if engine == "weasyprint":
+            from weasyprint import HTML
             HTML(string=full_html).write_pdf(filename)
             return True, "WeasyPrint (con supporto emoji migliorato)"
-        elif PDF_ENGINE == "wkhtmltopdf" and WKHTMLTOPDF_AVAILABLE:
+        elif engine == "wkhtmltopdf":
             with tempfile.NamedTemporaryFile('w', delete=False, suffix=".html", encoding='utf-8') as fhtml:
                 fhtml.write(full_html)
                 html_path = fhtml.name
@@ -436,7 +460,7 @@ class CaldrasApp(tk.Tk):
                             title="Esporta PDF",
                             initialfile=f"{titolo}.pdf")
         if file_path:
-            success, engine = generate_pdf(content, file_path)
+            success, engine = generate_pdf(content, file_path, self.config)
             if success:
                 messagebox.showinfo("✅ PDF Esportato", f"PDF salvato con {engine}:\n{file_path}")
             else: